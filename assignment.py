@@ -0,0 +1,188 @@
+import targetproductoffer as tpro
+
+#==========================================================================================================================================
+# AssignmentRegistry Class
+#==========================================================================================================================================
+class AssignmentRegistry:
+
+    """
+    Class:     AssignmentRegistry
+
+    Description:
+        Keeps track of the products assigned to the TPOs of every commodity class, by period and by outlet. TPOs that are registered
+        with a commodity class report every change of their status or product through TargetProductOffer.addPeriod, so that the
+        registry is updated incrementally instead of being recomputed from all TPOs of the commodity class on every query.
+
+        Several TPOs may be assigned the same product at the same outlet, so assigned products are counted; a product is only removed
+        once no TPO is assigned to it anymore.
+
+    Instance Variables:
+        dict<int, list<int>> commodityIDs:
+            Commodity classes with which each TPO is registered.
+            Key: TPO ID
+            Value: list of commodity class IDs
+        dict<tuple<int, int, int>, dict<T, int>> assigned:
+            Number of TPOs assigned to each product.
+            Key: (commodity class ID, period ID, outlet ID); an outlet ID of None stands for every outlet of the commodity class
+            Value: map of product IDs to the number of TPOs assigned to them
+        dict<tuple<int, int>, int> unassignedCounts:
+            Number of unassigned TPOs.
+            Key: (commodity class ID, period ID)
+            Value: number of registered TPOs whose status is unassigned or out of stock
+    """
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # Constructor
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def __init__(self):
+
+        """
+        Constructor:
+
+            AssignmentRegistry()
+
+        Description:
+            Constructs an empty AssignmentRegistry object.
+        """
+
+        self.commodityIDs = {}
+        self.assigned = {}
+        self.unassignedCounts = {}
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # register Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def register(self, comID: int, tpo):
+
+        """
+        Method:
+
+            void register
+            (
+                int comID,
+                TargetProductOffer tpo
+            )
+
+        Description:
+            Registers a TPO with a commodity class. The current periods of the TPO are accounted for, and every later call to
+            tpo.addPeriod updates the registry. Registering a TPO with the same commodity class twice has no effect.
+        """
+
+        comIDs = self.commodityIDs.setdefault(tpo.ID, [])
+        if comID in comIDs:
+            return
+
+        comIDs.append(comID)
+        tpo.registry = self
+
+        for periodID, tpoProp in tpo.properties.items():
+            self.count(comID, periodID, tpo.outletID, tpoProp.statusID, tpoProp.productID, 1)
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # update Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def update(self, tpo, periodID: int, previous: tuple = None):
+
+        """
+        Method:
+
+            void update
+            (
+                TargetProductOffer tpo,
+                int periodID,
+                tuple<int, T> previous
+            )
+
+        Description:
+            Accounts for a change of the status or the product of a TPO during the given period. Called by tpo.addPeriod.
+
+        Arguments:
+            TargetProductOffer tpo:
+                TPO whose properties have changed.
+            int periodID:
+                Unique identifier of the period that has changed.
+            tuple<int, T> previous:
+                Status ID and product ID of the TPO before the change, or None if the TPO did not have the period before.
+        """
+
+        tpoProp = tpo.properties[periodID]
+        for comID in self.commodityIDs.get(tpo.ID, []):
+            if previous is not None:
+                self.count(comID, periodID, tpo.outletID, previous[0], previous[1], -1)
+            self.count(comID, periodID, tpo.outletID, tpoProp.statusID, tpoProp.productID, 1)
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # count Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def count(self, comID: int, periodID: int, outletID: int, statusID: int, productID, increment: int):
+
+        """
+        Method:
+
+            void count
+            (
+                int comID,
+                int periodID,
+                int outletID,
+                int statusID,
+                T productID,
+                int increment
+            )
+
+        Description:
+            Adds (increment = 1) or removes (increment = -1) the contribution of a single TPO to the registry.
+        """
+
+        if not tpro.isAssignedStatus(statusID):
+            key = (comID, periodID)
+            self.unassignedCounts[key] = self.unassignedCounts.get(key, 0) + increment
+            return
+
+        for key in [(comID, periodID, outletID), (comID, periodID, None)]:
+            counts = self.assigned.setdefault(key, {})
+            counts[productID] = counts.get(productID, 0) + increment
+            if counts[productID] <= 0:
+                del counts[productID]
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # assignedProductIDs Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def assignedProductIDs(self, comID: int, periodID: int, outletID: int = None):
+
+        """
+        Method:
+
+            set-like assignedProductIDs
+            (
+                int comID,
+                int periodID,
+                int outletID
+            )
+
+        Description:
+            Returns the IDs of the products assigned to TPOs of the commodity class during the given period, as a read-only set-like
+            view that reflects later assignments. If outletID is not None, only the TPOs of the given outlet are considered.
+        """
+
+        # Register the key, so that the view also reflects the assignments made after the call
+        return self.assigned.setdefault((comID, periodID, outletID), {}).keys()
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # containsUnassigned Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def containsUnassigned(self, comID: int, periodID: int) -> bool:
+
+        """
+        Method:
+
+            bool containsUnassigned
+            (
+                int comID,
+                int periodID
+            )
+
+        Description:
+            Returns True if any TPO of the commodity class is unassigned or out of stock during the given period.
+        """
+
+        return self.unassignedCounts.get((comID, periodID), 0) > 0
@@ -0,0 +1,753 @@
+import multiprocessing as mp
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+import catalog as cat
+import dataset as ds
+import homogeneity as hom
+import product as pro
+import substitution as sub
+import vectorstore as vs
+
+"""
+Description:
+    Provides benchmarks that compare the performance of various stages of the Substituter against their previous implementation.
+    Every measurement is taken in a fresh process, so that the peak memory of one measurement does not leak into the next.
+"""
+
+#------------------------------------------------------------------------------------------------------------------------------------------
+# peakMemory Method
+#------------------------------------------------------------------------------------------------------------------------------------------
+def peakMemory() -> int:
+
+    """
+    Method:
+
+        int peakMemory()
+
+    Description:
+        Returns the peak resident set size of the current process in bytes. On platforms without the resource module (i.e. Windows),
+        the peak memory traced by tracemalloc is returned instead.
+    """
+
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is given in bytes on macOS and in kilobytes elsewhere
+        return peak if sys.platform == 'darwin' else peak * 1024
+    except ImportError:
+        return tracemalloc.get_traced_memory()[1]
+
+#------------------------------------------------------------------------------------------------------------------------------------------
+# measureLoader Method
+#------------------------------------------------------------------------------------------------------------------------------------------
+def measureLoader(filePath: str, schemaKey: str = None) -> tuple:
+
+    """
+    Method:
+
+        tuple<float, int, int, int> measureLoader
+        (
+            string filePath,
+            string schemaKey
+        )
+
+    Description:
+        Loads a file with ds.fromFile and measures the cost of doing so. If schemaKey is None, the file is loaded with the previous
+        loader; i.e. with inferred dtypes, followed by the conversion of the description columns to strings.
+
+    Output:
+        tuple<float, int, int, int> { seconds, peakBefore, peakAfter, frameBytes }
+    """
+
+    tracemalloc.start()
+    peakBefore = peakMemory()
+    start = time.perf_counter()
+
+    df = ds.fromFile(filePath, schemaKey)
+    if schemaKey is None:
+        # The previous loader converted every description column to str in the Substituter constructor
+        for colName in df.columns.values:
+            if colName not in ['ProductID', 'CommodityID'] and df[colName].dtype == object:
+                df[colName] = df[colName].where(df[colName].isnull(), df[colName].astype(str))
+
+    seconds = time.perf_counter() - start
+    peakAfter = peakMemory()
+    tracemalloc.stop()
+
+    return seconds, peakBefore, peakAfter, int(df.memory_usage(deep=True).sum())
+
+#------------------------------------------------------------------------------------------------------------------------------------------
+# benchmarkLoader Method
+#------------------------------------------------------------------------------------------------------------------------------------------
+def benchmarkLoader(filePath: str, schemaKey: str, repeat: int = 3) -> pd.DataFrame:
+
+    """
+    Method:
+
+        DataFrame benchmarkLoader
+        (
+            string filePath,
+            string schemaKey,
+            int repeat
+        )
+
+    Description:
+        Compares the wall time and the peak resident memory of the schema-aware loader against the previous loader, which inferred
+        every dtype. Each measurement is repeated in a new process and the median is reported.
+
+    Arguments
+        string filePath:
+            Location of the file to be loaded.
+        string schemaKey:
+            Name of the schema to be applied; see schema.py.
+        int repeat:
+            Number of measurements per loader.
+    """
+
+    context = mp.get_context('spawn')
+
+    results = ds.fromDict(['Loader', 'Seconds', 'Peak RSS Increase (MB)', 'Frame Size (MB)'])
+    for label, key in [('inferred', None), ('schema', schemaKey)]:
+
+        measurements = []
+        for i in range(0, repeat):
+            with context.Pool(1) as pool:
+                measurements.append(pool.apply(measureLoader, (filePath, key)))
+
+        measurements = pd.DataFrame(measurements, columns=['seconds', 'peakBefore', 'peakAfter', 'frameBytes']).median()
+        ds.addRow(results, [label,
+                            measurements['seconds'],
+                            (measurements['peakAfter'] - measurements['peakBefore']) / 2**20,
+                            measurements['frameBytes'] / 2**20])
+
+    print(results.to_string(index=False))
+    return results
+
+#------------------------------------------------------------------------------------------------------------------------------------------
+# syntheticSample Method
+#------------------------------------------------------------------------------------------------------------------------------------------
+def syntheticSample(periodCount: int, outletCount: int = 500, productCount: int = 20000, rowsPerPeriod: int = 100000, seed: int = 0) -> tuple:
+
+    """
+    Method:
+
+        tuple<DataFrame, dict<int, DataFrame>, dict<int, DataFrame>> syntheticSample
+        (
+            int periodCount,
+            int outletCount,
+            int productCount,
+            int rowsPerPeriod,
+            int seed
+        )
+
+    Description:
+        Generates random product descriptions, and the sales and outlets of periodCount periods, in the layout expected by the
+        Substituter. Some outlets only appear in a subset of the periods, and their site IDs change from one period to the next.
+
+    Output:
+        tuple<DataFrame, dict<int, DataFrame>, dict<int, DataFrame>> { productDescData, salesDataSets, outletDataSets }
+    """
+
+    rng = np.random.RandomState(seed)
+    words = np.array(['milk', 'bread', 'cheese', 'apple', 'juice', 'organic', 'lite', 'family', 'pack', 'fresh', 'whole', 'red'])
+
+    productDescData = pd.DataFrame({'ProductID': np.arange(productCount, dtype='int64'),
+                                    'CommodityID': rng.randint(0, 50, productCount).astype('int32'),
+                                    'StdUOM': pd.Categorical(rng.choice(['g', 'ml', 'ea'], productCount)),
+                                    'BrandType': pd.Categorical(rng.choice(['PL', 'NB'], productCount)),
+                                    'Brand': rng.choice(words, productCount).astype(object),
+                                    'ProdDesc': pd.Series(rng.choice(words, productCount)).str.cat(pd.Series(rng.choice(words, productCount)), sep=' ').values})
+
+    salesDataSets = {}
+    outletDataSets = {}
+    for periodID in range(0, periodCount):
+        outletIDs = np.flatnonzero(rng.rand(outletCount) < 0.95).astype('int32')
+        outletDataSets[periodID] = pd.DataFrame({'OutletID': outletIDs,
+                                                 'SiteID': (outletIDs * 100 + periodID).astype('int32'),
+                                                 'Province': pd.Categorical(np.array(['ON', 'QC', 'BC'])[outletIDs % 3]),
+                                                 'City': pd.Categorical(np.array(['A', 'B', 'C', 'D', 'E'])[outletIDs % 5])})
+        sites = rng.choice(outletDataSets[periodID]['SiteID'].values, rowsPerPeriod)
+        salesDataSets[periodID] = pd.DataFrame({'ProductID': rng.randint(0, productCount, rowsPerPeriod).astype('int64'),
+                                                'SiteID': sites,
+                                                'PeriodID': np.full(rowsPerPeriod, periodID, dtype='int16'),
+                                                'QtyUnits': rng.randint(1, 100, rowsPerPeriod).astype('float64'),
+                                                'Sales': rng.uniform(1, 500, rowsPerPeriod)})
+
+    return productDescData, salesDataSets, outletDataSets
+
+#------------------------------------------------------------------------------------------------------------------------------------------
+# syntheticDescriptions Method
+#------------------------------------------------------------------------------------------------------------------------------------------
+def syntheticDescriptions(productCount: int = 20000, commodityCount: int = 50, wordCount: int = 50000, seed: int = 0) -> pd.DataFrame:
+
+    """
+    Method:
+
+        DataFrame syntheticDescriptions
+        (
+            int productCount,
+            int commodityCount,
+            int wordCount,
+            int seed
+        )
+
+    Description:
+        Generates random product descriptions over a vocabulary of wordCount words, which are drawn with Zipf-distributed frequencies
+        as in real descriptions, in the layout expected by the Substituter. Unlike syntheticSample, whose vocabulary only has a dozen
+        words, the descriptions are suited to measuring the quality of the description distances.
+    """
+
+    rng = np.random.RandomState(seed)
+    words = np.array(['word' + str(i) for i in range(0, wordCount)])
+    frequencies = 1 / np.arange(1, wordCount + 1)
+    frequencies /= frequencies.sum()
+    describe = lambda: ' '.join(rng.choice(words, rng.randint(2, 12), p = frequencies))
+
+    return pd.DataFrame({'ProductID': np.arange(productCount, dtype='int64'),
+                         'CommodityID': rng.randint(0, commodityCount, productCount).astype('int32'),
+                         'StdUOM': pd.Categorical(rng.choice(['g', 'ml', 'ea'], productCount)),
+                         'BrandType': pd.Categorical(rng.choice(['PL', 'NB'], productCount)),
+                         'ProdDesc': [describe() for i in range(0, productCount)]})
+
+#------------------------------------------------------------------------------------------------------------------------------------------
+# legacyAssignSample Method
+#------------------------------------------------------------------------------------------------------------------------------------------
+def legacyAssignSample(substituter, salesDataSets: dict, outletDataSets: dict):
+
+    """
+    Method:
+
+        void legacyAssignSample
+        (
+            Substituter substituter,
+            dict<int, DataFrame> salesDataSets,
+            dict<int, DataFrame> outletDataSets
+        )
+
+    Description:
+        Previous implementation of Substituter.assignSample, kept as the reference of benchmarkAssignSample. The frames are grown one
+        period at a time and the descriptions are concatenated row by row. DataFrame.append is replaced by the equivalent pd.concat.
+    """
+
+    s = substituter
+    periodIDs = list(outletDataSets.keys())
+    b = periodIDs[0]
+
+    s.outletData = outletDataSets[b]
+    s.outletData = s.outletData.rename(columns={s.retailerSiteIDKey:s.retailerSiteIDKey + '_' + str(b)})
+
+    for i in outletDataSets:
+        if i != b:
+            union = s.outletData.merge(outletDataSets[i][[s.outletIDKey, s.retailerSiteIDKey]], how='outer', on=s.outletIDKey)
+            s.outletData = union.rename(columns={s.retailerSiteIDKey:s.retailerSiteIDKey + '_' + str(i)})
+
+    for i, periodID in enumerate(salesDataSets):
+        salesDF = salesDataSets[periodID].merge(outletDataSets[periodID][[s.outletIDKey, s.retailerSiteIDKey]], how='left', on=s.retailerSiteIDKey)
+        if i == 0:
+            s.productData = salesDF
+        else:
+            s.productData = pd.concat([s.productData, salesDF])
+
+    descriptions = s.productDescData[[s.productIDKey, s.commodityIDKey, s.uomKey, s.brandTypeKey]].copy()
+    features = s.productDescData.drop(columns = [s.productIDKey, s.commodityIDKey])
+    features = features.astype(object).fillna('')
+    descriptions['Desc'] = features.iloc[:,:].apply(lambda x: ' '.join(x), axis=1)
+    s.productData = s.productData.merge(descriptions, how='left', on=s.productIDKey)
+
+#------------------------------------------------------------------------------------------------------------------------------------------
+# benchmarkAssignSample Method
+#------------------------------------------------------------------------------------------------------------------------------------------
+def benchmarkAssignSample(periodCounts: list = [1, 6, 24], rowsPerPeriod: int = 100000) -> pd.DataFrame:
+
+    """
+    Method:
+
+        DataFrame benchmarkAssignSample
+        (
+            list<int> periodCounts,
+            int rowsPerPeriod
+        )
+
+    Description:
+        Compares the wall time and the peak traced memory of Substituter.assignSample against its previous implementation on synthetic
+        samples of the given numbers of periods. Both implementations are checked to produce the same product and outlet DataFrames.
+    """
+
+    results = ds.fromDict(['Periods', 'Implementation', 'Seconds', 'Peak Memory (MB)'])
+    for periodCount in periodCounts:
+
+        productDescData, salesDataSets, outletDataSets = syntheticSample(periodCount, rowsPerPeriod=rowsPerPeriod)
+        substituter = sub.Substituter(productDescData)
+
+        outputs = {}
+        for label, assign in [('legacy', lambda: legacyAssignSample(substituter, salesDataSets, outletDataSets)),
+                              ('vectorized', lambda: substituter.assignSample(salesDataSets, outletDataSets))]:
+            tracemalloc.start()
+            start = time.perf_counter()
+            assign()
+            seconds = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            outputs[label] = (substituter.productData.reset_index(drop=True), substituter.outletData.reset_index(drop=True))
+            ds.addRow(results, [periodCount, label, seconds, peak / 2**20])
+
+        pd.testing.assert_frame_equal(outputs['legacy'][0], outputs['vectorized'][0])
+        pd.testing.assert_frame_equal(outputs['legacy'][1], outputs['vectorized'][1], check_dtype=False)
+
+    print(results.to_string(index=False))
+    return results
+
+#------------------------------------------------------------------------------------------------------------------------------------------
+# commodityClusters Method
+#------------------------------------------------------------------------------------------------------------------------------------------
+def commodityClusters(catalog: cat.ProductCatalog) -> list:
+
+    """
+    Method:
+
+        list<tuple<T, dict<T, Product>>> commodityClusters
+        (
+            ProductCatalog catalog
+        )
+
+    Description:
+        Returns the products of each commodity class of the catalog, along with its commodity class ID, to be used as clusters.
+    """
+
+    comIDs = pd.Series(catalog.commodityIDs)
+    clusters = []
+    for comID, positions in comIDs.groupby(comIDs, sort=False).indices.items():
+        clusters.append((comID, {catalog.productIDs[i]: pro.Product(catalog.productIDs[i], catalog.uoms[i], catalog.brandTypes[i], catalog.descs[i])
+                                 for i in positions}))
+    return clusters
+
+#------------------------------------------------------------------------------------------------------------------------------------------
+# verifyDescriptionMatrix Method
+#------------------------------------------------------------------------------------------------------------------------------------------
+def verifyDescriptionMatrix(productDescData: pd.DataFrame, referenceCount: int = 20, neighbourCount: int = 10, tolerance: float = 1e-6) -> pd.DataFrame:
+
+    """
+    Method:
+
+        DataFrame verifyDescriptionMatrix
+        (
+            DataFrame productDescData,
+            int referenceCount,
+            int neighbourCount,
+            float tolerance
+        )
+
+    Description:
+        Compares the distances of DistanceIndex objects sliced out of a DescriptionMatrix against those of DistanceIndex objects fitted to
+        every cluster, taking the products of each commodity class as a cluster and up to referenceCount of them as references. The
+        'cluster' scope must reproduce the fitted distances within the tolerance. For the other scopes, which compute the IDF over more
+        documents, the largest distance difference and the overlap of the neighbourCount nearest neighbours are reported.
+
+    Output:
+        DataFrame
+        Columns: 'IDF Scope', 'Build Seconds', 'Index Seconds', 'Max Difference', 'Neighbour Overlap'
+    """
+
+    nearest = lambda neighbours: set(sorted(neighbours, key=neighbours.get)[:neighbourCount])
+
+    catalog = cat.ProductCatalog(productDescData)
+    clusters = commodityClusters(catalog)
+
+    # Distances of the indices fitted to every cluster
+    start = time.perf_counter()
+    fitted = []
+    for comID, products in clusters:
+        index = hom.DistanceIndex(products)
+        references = list(products.values())[:referenceCount]
+        fitted.append([index.query(pd.Series([product.desc]), len(products)) for product in references])
+    fitSeconds = time.perf_counter() - start
+
+    results = ds.fromDict(['IDF Scope', 'Build Seconds', 'Index Seconds', 'Max Difference', 'Neighbour Overlap'])
+    ds.addRow(results, ['fitted', 0.0, fitSeconds, 0.0, 1.0])
+
+    for idfScope in ['cluster', 'commodity', 'corpus']:
+
+        start = time.perf_counter()
+        descriptionMatrix = hom.DescriptionMatrix(catalog, idfScope)
+        buildSeconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        maxDifference = 0.0
+        overlaps = []
+        for (comID, products), fittedNeighbours in zip(clusters, fitted):
+            index = hom.DistanceIndex(products, descriptionMatrix, comID)
+            references = list(products.values())[:referenceCount]
+            for product, expected in zip(references, fittedNeighbours):
+                actual = index.query(pd.Series([product.desc]), len(products))
+                maxDifference = max(maxDifference, max(abs(actual[productID] - distance) for productID, distance in expected.items()))
+                overlaps.append(len(nearest(actual) & nearest(expected)) / min(neighbourCount, len(products)))
+        indexSeconds = time.perf_counter() - start
+
+        if idfScope == 'cluster' and maxDifference > tolerance:
+            raise AssertionError("Error: The 'cluster' scope differs from the fitted distances by " + str(maxDifference) + ".")
+
+        ds.addRow(results, [idfScope, buildSeconds, indexSeconds, maxDifference, float(np.mean(overlaps))])
+
+    print(results.to_string(index=False))
+    return results
+
+#------------------------------------------------------------------------------------------------------------------------------------------
+# benchmarkDistanceKernel Method
+#------------------------------------------------------------------------------------------------------------------------------------------
+def benchmarkDistanceKernel(productCounts: list = [100, 1000, 10000, 100000], referenceCount: int = 20, neighbourCount: int = 10, seed: int = 0) -> pd.DataFrame:
+
+    """
+    Method:
+
+        DataFrame benchmarkDistanceKernel
+        (
+            list<int> productCounts,
+            int referenceCount,
+            int neighbourCount,
+            int seed
+        )
+
+    Description:
+        Compares the search of a DistanceIndex against the previous brute-force search with sklearn.neighbors.NearestNeighbors, on
+        clusters of random descriptions of the given sizes. Both searches are timed for every candidate (neighbourCount = None) and
+        for the neighbourCount nearest candidates; the fitting of the TF-IDF model is shared and not timed. The distances are checked
+        to be bit-for-bit identical.
+    """
+
+    from sklearn.neighbors import NearestNeighbors
+
+    rng = np.random.RandomState(seed)
+    words = np.array(['word' + str(i) for i in range(0, 5000)])
+    describe = lambda: ' '.join(rng.choice(words, rng.randint(2, 12)))
+
+    results = ds.fromDict(['Products', 'Neighbours', 'Implementation', 'Seconds'])
+    for productCount in productCounts:
+
+        products = {productID: pro.Product(productID, 'ea', 'NB', describe()) for productID in range(0, productCount)}
+        references = [describe() for i in range(0, referenceCount)]
+        index = hom.DistanceIndex(products)
+
+        for count in [productCount, min(neighbourCount, productCount)]:
+
+            start = time.perf_counter()
+            estimator = NearestNeighbors()
+            estimator.fit(index.candidates)
+            expectedDistances, expectedIndices = estimator.kneighbors(index.transformer.transform(references), n_neighbors = count)
+            ds.addRow(results, [productCount, count, 'NearestNeighbors', time.perf_counter() - start])
+
+            start = time.perf_counter()
+            distances, indices = index.kneighbors(references, count)
+            ds.addRow(results, [productCount, count, 'kernel', time.perf_counter() - start])
+
+            if count == productCount:
+                # The kernel returns every candidate in the order of the index
+                expected = np.empty(expectedDistances.shape)
+                np.put_along_axis(expected, expectedIndices, expectedDistances, axis = 1)
+                np.testing.assert_array_equal(distances, expected)
+            else:
+                # Equally distant candidates may be selected in a different order
+                np.testing.assert_array_equal(distances, expectedDistances)
+
+    print(results.to_string(index=False))
+    return results
+
+#------------------------------------------------------------------------------------------------------------------------------------------
+# evaluateApproximateIndex Method
+#------------------------------------------------------------------------------------------------------------------------------------------
+def evaluateApproximateIndex(productCounts: list = [10000, 50000],
+                             settings: list = [(8, 8), (16, 8), (32, 8), (16, 6), (32, 10)],
+                             featureCounts: list = [None, 2**20],
+                             referenceCount: int = 100,
+                             neighbourCount: int = 10,
+                             relaunchDistanceCutoff: float = 0.5,
+                             seed: int = 0) -> pd.DataFrame:
+
+    """
+    Method:
+
+        DataFrame evaluateApproximateIndex
+        (
+            list<int> productCounts,
+            list<tuple<int, int>> settings,
+            list<int> featureCounts,
+            int referenceCount,
+            int neighbourCount,
+            float relaunchDistanceCutoff,
+            int seed
+        )
+
+    Description:
+        Evaluates ApproximateDistanceIndex against the exhaustive DistanceIndex on clusters of random descriptions of the given sizes,
+        for each (hashTableCount, hashBitCount) of settings. The references are variants of random products of the cluster, with one 
+        word replaced, as relaunched products would be. Every reference is searched for every candidate, as assignTPO does when 
+        neighbourCount is None.
+
+        For each of featureCounts, the indices are either fitted to the cluster (None), or sliced from a DescriptionMatrix whose terms
+        are hashed into that many columns with idfScope='corpus', as substitute does with hashFeatureCount; the hyperplanes then span
+        the whole hashed feature space rather than the terms of the cluster. The following are reported:
+            'Recall': fraction of the neighbourCount nearest neighbours that are retrieved; neighbours at the same distance as the
+                last of them count as equivalent
+            'Relaunch Recall': fraction of the candidates within relaunchDistanceCutoff of a reference that are retrieved
+            'Retrieved': average fraction of the candidates that are retrieved per reference
+            'Speedup': query time of the exhaustive search divided by that of the approximate search
+            'Peak MB': peak memory traced by tracemalloc while the index is built and queried
+    """
+
+    rng = np.random.RandomState(seed)
+    brands = np.array(['brand' + str(i) for i in range(0, 300)])
+    words = np.array(['word' + str(i) for i in range(0, 3000)])
+    sizes = np.array([str(size) + unit for size in [100, 200, 250, 500, 750, 1000] for unit in ['g', 'ml']])
+
+    # Builds and queries an index, along with the time and peak memory
+    def measure(build) -> tuple:
+        tracemalloc.start()
+        start = time.perf_counter()
+        index = build()
+        buildSeconds = time.perf_counter() - start
+        start = time.perf_counter()
+        neighbours = index.queryBatch(references, productCount)
+        querySeconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return neighbours, buildSeconds, querySeconds, peak
+
+    results = ds.fromDict(['Products', 'Features', 'Tables', 'Bits', 'Build Seconds', 'Query Seconds', 'Speedup', 'Recall', 'Relaunch Recall', 'Retrieved', 'Peak MB'])
+    for productCount in productCounts:
+
+        descs = [' '.join([rng.choice(brands)] + list(rng.choice(words, rng.randint(2, 6))) + [rng.choice(sizes)]) for i in range(0, productCount)]
+        catalog = cat.ProductCatalog(pd.DataFrame({'ProductID': np.arange(0, productCount), 'CommodityID': 0, 'StdUOM': 'ea', 'BrandType': 'NB', 'Desc': descs}))
+        comID, products = commodityClusters(catalog)[0]
+
+        references = []
+        for productID in rng.randint(0, productCount, referenceCount):
+            tokens = catalog.descs[productID].split(' ')
+            tokens[rng.randint(0, len(tokens))] = rng.choice(words)
+            references.append(' '.join(tokens))
+
+        for featureCount in featureCounts:
+
+            descriptionMatrix = None if featureCount is None else hom.DescriptionMatrix(catalog, 'corpus', featureCount)
+            features = 'fitted' if featureCount is None else str(featureCount)
+
+            exact, buildSeconds, exactSeconds, peak = measure(lambda: hom.DistanceIndex(products, descriptionMatrix, comID))
+            ds.addRow(results, [productCount, features, 0, 0, buildSeconds, exactSeconds, 1.0, 1.0, 1.0, 1.0, peak / 2**20])
+
+            for tableCount, bitCount in settings:
+
+                approximate, buildSeconds, seconds, peak = measure(lambda: hom.ApproximateDistanceIndex(products, descriptionMatrix, comID,
+                                                                                                         tableCount = tableCount,
+                                                                                                         bitCount = bitCount))
+
+                recalls = []
+                relaunchRecalls = []
+                for expected, actual in zip(exact, approximate):
+                    # Distances of retrieved candidates are exact
+                    for productID, distance in actual.items():
+                        if distance != expected[productID]:
+                            raise AssertionError("Error: The distance of a retrieved candidate differs from its exact distance.")
+
+                    cutoff = sorted(expected.values())[neighbourCount - 1]
+                    nearest = sorted(actual.values())[:neighbourCount]
+                    recalls.append(sum(1 for distance in nearest if distance <= cutoff) / neighbourCount)
+
+                    relaunched = [productID for productID, distance in expected.items() if distance <= relaunchDistanceCutoff]
+                    if len(relaunched) > 0:
+                        relaunchRecalls.append(sum(1 for productID in relaunched if productID in actual) / len(relaunched))
+
+                ds.addRow(results, [productCount,
+                                    features,
+                                    tableCount,
+                                    bitCount,
+                                    buildSeconds,
+                                    seconds,
+                                    exactSeconds / seconds,
+                                    float(np.mean(recalls)),
+                                    float(np.mean(relaunchRecalls)) if len(relaunchRecalls) > 0 else np.nan,
+                                    float(np.mean([len(actual) / productCount for actual in approximate])),
+                                    peak / 2**20])
+
+    print(results.to_string(index=False))
+    return results
+
+#------------------------------------------------------------------------------------------------------------------------------------------
+# compareHashedDistances Method
+#------------------------------------------------------------------------------------------------------------------------------------------
+def compareHashedDistances(productDescData: pd.DataFrame,
+                           featureCounts: list = [2**10, 2**14, 2**18, 2**20],
+                           idfScope: str = 'corpus',
+                           referenceCount: int = 20,
+                           neighbourCount: int = 10) -> pd.DataFrame:
+
+    """
+    Method:
+
+        DataFrame compareHashedDistances
+        (
+            DataFrame productDescData,
+            list<int> featureCounts,
+            string idfScope,
+            int referenceCount,
+            int neighbourCount
+        )
+
+    Description:
+        Compares the distances of DescriptionMatrix objects that hash the terms into each of the given numbers of columns against those
+        of a DescriptionMatrix with a vocabulary and the same IDF scope, which isolates the effect of hash collisions, and against those
+        of DistanceIndex objects fitted to every cluster, as computeDistance does by default. The products of each commodity class are
+        taken as a cluster and up to referenceCount of them as references.
+
+        For each matrix, the time taken to build it and the size of its model (the pickled vectorizer, including any vocabulary, and the
+        IDF tables) are reported, along with the largest distance difference and the overlap of the neighbourCount nearest neighbours.
+
+    Output:
+        DataFrame
+        Columns: 'Features', 'Build Seconds', 'Model Bytes', 'Scope Max Difference', 'Scope Overlap', 'Fitted Max Difference',
+                 'Fitted Overlap'
+    """
+
+    nearest = lambda neighbours: set(sorted(neighbours, key=neighbours.get)[:neighbourCount])
+
+    catalog = cat.ProductCatalog(productDescData)
+    clusters = commodityClusters(catalog)
+
+    def queryAll(descriptionMatrix: hom.DescriptionMatrix) -> list:
+        distances = []
+        for comID, products in clusters:
+            index = hom.DistanceIndex(products, descriptionMatrix, comID)
+            references = list(products.values())[:referenceCount]
+            distances.append([index.query(pd.Series([product.desc]), len(products)) for product in references])
+        return distances
+
+    def compare(actualDistances: list, expectedDistances: list) -> tuple:
+        maxDifference = 0.0
+        overlaps = []
+        for (comID, products), actualNeighbours, expectedNeighbours in zip(clusters, actualDistances, expectedDistances):
+            for actual, expected in zip(actualNeighbours, expectedNeighbours):
+                maxDifference = max(maxDifference, max(abs(actual[productID] - distance) for productID, distance in expected.items()))
+                overlaps.append(len(nearest(actual) & nearest(expected)) / min(neighbourCount, len(products)))
+        return maxDifference, float(np.mean(overlaps))
+
+    fitted = queryAll(None)
+
+    results = ds.fromDict(['Features', 'Build Seconds', 'Model Bytes', 'Scope Max Difference', 'Scope Overlap', 'Fitted Max Difference', 'Fitted Overlap'])
+    exact = None
+
+    for featureCount in [None] + list(featureCounts):
+
+        start = time.perf_counter()
+        descriptionMatrix = hom.DescriptionMatrix(catalog, idfScope, featureCount)
+        buildSeconds = time.perf_counter() - start
+
+        modelBytes = len(pickle.dumps(descriptionMatrix.vectorizer)) + sum(idf.nbytes for idf in descriptionMatrix.idfs.values())
+
+        distances = queryAll(descriptionMatrix)
+        if exact is None:
+            exact = distances
+
+        scopeDifference, scopeOverlap = compare(distances, exact)
+        fittedDifference, fittedOverlap = compare(distances, fitted)
+        ds.addRow(results, ['vocabulary (' + str(descriptionMatrix.counts.shape[1]) + ')' if featureCount is None else str(featureCount),
+                            buildSeconds, modelBytes, scopeDifference, scopeOverlap, fittedDifference, fittedOverlap])
+
+    print(results.to_string(index=False))
+    return results
+
+#------------------------------------------------------------------------------------------------------------------------------------------
+# benchmarkVectorStore Method
+#------------------------------------------------------------------------------------------------------------------------------------------
+def benchmarkVectorStore(productCount: int = 100000, changedFraction: float = 0.05, featureCounts: list = [None, 2**18], seed: int = 0) -> pd.DataFrame:
+
+    """
+    Method:
+
+        DataFrame benchmarkVectorStore
+        (
+            int productCount,
+            float changedFraction,
+            list<int> featureCounts,
+            int seed
+        )
+
+    Description:
+        Times the construction of a DescriptionMatrix without a VectorStore, with an empty store ('cold'), and with the store of the
+        previous run after changedFraction of the descriptions have changed ('warm'), as in a monthly cycle. The store is written to a
+        temporary directory, and the time taken to save it is included. The term counts of the warm matrix are checked to be identical
+        to those of the matrix built without a store.
+    """
+
+    rng = np.random.RandomState(seed)
+    previous = syntheticDescriptions(productCount, seed = seed)
+    current = previous.copy()
+    changed = rng.rand(productCount) < changedFraction
+    current.loc[changed, 'ProdDesc'] = current.loc[changed, 'ProdDesc'] + ' new'
+
+    previousCatalog = cat.ProductCatalog(previous)
+    currentCatalog = cat.ProductCatalog(current)
+
+    results = ds.fromDict(['Features', 'Store', 'Seconds', 'Vectorized'])
+    for featureCount in featureCounts:
+
+        storePath = os.path.join(tempfile.mkdtemp(), 'vectors')
+        try:
+            start = time.perf_counter()
+            expected = hom.DescriptionMatrix(currentCatalog, 'corpus', featureCount)
+            ds.addRow(results, [str(featureCount), 'none', time.perf_counter() - start, productCount])
+
+            for label, catalog in [('cold', previousCatalog), ('warm', currentCatalog)]:
+                start = time.perf_counter()
+                vectorStore = vs.VectorStore(storePath, featureCount)
+                descriptionMatrix = hom.DescriptionMatrix(catalog, 'corpus', featureCount, vectorStore)
+                vectorStore.save()
+                ds.addRow(results, [str(featureCount), label, time.perf_counter() - start, vectorStore.vectorizedCount])
+
+            # The stored rows are presented exactly as a fitted vectorizer returns them, down to the order of the terms of each row
+            actual = descriptionMatrix.counts
+            if (actual.shape != expected.counts.shape or not np.array_equal(actual.indptr, expected.counts.indptr) or 
+                not np.array_equal(actual.indices, expected.counts.indices) or not np.array_equal(actual.data, expected.counts.data)):
+                raise AssertionError("Error: The term counts of the vector store differ from those of the DescriptionMatrix.")
+        finally:
+            shutil.rmtree(os.path.dirname(storePath))
+
+    print(results.to_string(index=False))
+    return results
+
+if __name__ == '__main__':
+
+    # python benchmark.py loader <filePath> <schemaKey>
+    # python benchmark.py sample
+    # python benchmark.py tfidf [<productDescFilePath>]
+    # python benchmark.py kernel
+    # python benchmark.py approximate
+    # python benchmark.py hashing [<productDescFilePath>]
+    # python benchmark.py store
+    if len(sys.argv) >= 4 and sys.argv[1] == 'loader':
+        benchmarkLoader(sys.argv[2], sys.argv[3])
+    elif len(sys.argv) >= 2 and sys.argv[1] == 'sample':
+        benchmarkAssignSample()
+    elif len(sys.argv) >= 2 and sys.argv[1] == 'tfidf':
+        verifyDescriptionMatrix(ds.fromFile(sys.argv[2], 'descriptions') if len(sys.argv) >= 3 else syntheticSample(1)[0])
+    elif len(sys.argv) >= 2 and sys.argv[1] == 'kernel':
+        benchmarkDistanceKernel()
+    elif len(sys.argv) >= 2 and sys.argv[1] == 'approximate':
+        evaluateApproximateIndex()
+    elif len(sys.argv) >= 2 and sys.argv[1] == 'hashing':
+        compareHashedDistances(ds.fromFile(sys.argv[2], 'descriptions') if len(sys.argv) >= 3 else syntheticDescriptions())
+    elif len(sys.argv) >= 2 and sys.argv[1] == 'store':
+        benchmarkVectorStore()
+    else:
+        print("Usage: python benchmark.py loader <filePath> <schemaKey>")
+        print("       python benchmark.py sample")
+        print("       python benchmark.py tfidf [<productDescFilePath>]")
+        print("       python benchmark.py kernel")
+        print("       python benchmark.py approximate")
+        print("       python benchmark.py hashing [<productDescFilePath>]")
+        print("       python benchmark.py store")
@@ -0,0 +1,219 @@
+import numpy as np
+import pandas as pd
+
+import dataset as ds
+
+#==========================================================================================================================================
+# ProductCatalog Class
+#==========================================================================================================================================
+class ProductCatalog:
+
+    """
+    Class:     ProductCatalog
+
+    Description:
+        Hash index over the product descriptions. Looking up a product by its ID costs O(1), rather than a scan of the whole description
+        DataFrame. If a product ID occurs more than once, the first occurrence is used, as with productDescData.loc[...].iloc[0].
+
+        IDs are matched by value, so that 123, 123.0 and numpy.int64(123) all refer to the same product. IDs that are not in the
+        catalog (including missing values and empty strings) are never matched.
+
+    Instance Variables:
+        dict<int, int> positions:
+            Position of each product in the catalog arrays.
+            Key: product ID
+            Value: position
+        Index index:
+            Product IDs of the catalog, in the order of the catalog arrays; used for bulk lookups.
+        ndarray productIDs:
+            Product ID of each product.
+        ndarray commodityIDs:
+            Commodity class ID of each product.
+        ndarray uoms:
+            Unit of measure of each product.
+        ndarray brandTypes:
+            Brand type of each product.
+        ndarray descs:
+            Text features of each product, other than its product ID and its commodity class ID, joined by spaces. Missing features are
+            joined as empty strings.
+    """
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # Constructor
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def __init__(self,
+                 productDescData: pd.DataFrame,
+                 productIDKey: str = 'ProductID',
+                 commodityIDKey: str = 'CommodityID',
+                 uomKey: str = 'StdUOM',
+                 brandTypeKey: str = 'BrandType'):
+
+        """
+        Constructor:
+
+            ProductCatalog
+            (
+                DataFrame productDescData,
+                string productIDKey,
+                string commodityIDKey,
+                string uomKey,
+                string brandTypeKey
+            )
+
+        Description:
+            Constructs a ProductCatalog object from the product descriptions.
+        """
+
+        self.productIDKey = productIDKey
+        self.commodityIDKey = commodityIDKey
+        self.uomKey = uomKey
+        self.brandTypeKey = brandTypeKey
+
+        # Keep the first occurrence of every product ID
+        first = ~productDescData[productIDKey].duplicated(keep='first').to_numpy()
+        productDescData = productDescData.loc[first]
+
+        self.productIDs = productDescData[productIDKey].to_numpy()
+        self.commodityIDs = productDescData[commodityIDKey].to_numpy()
+        self.uoms = productDescData[uomKey].to_numpy(dtype=object)
+        self.brandTypes = productDescData[brandTypeKey].to_numpy(dtype=object)
+        self.descs = ds.concatenateColumns(productDescData, ' ', [productIDKey, commodityIDKey]).to_numpy(dtype=object)
+
+        self.index = pd.Index(self.productIDs)
+        self.positions = dict(zip(self.productIDs.tolist(), range(0, len(self.productIDs))))
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # __len__ Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def __len__(self) -> int:
+        return len(self.productIDs)
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # __contains__ Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def __contains__(self, productID) -> bool:
+        return self.position(productID) >= 0
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # position Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def position(self, productID) -> int:
+
+        """
+        Method:
+
+            int position
+            (
+                T productID
+            )
+
+        Description:
+            Returns the position of a product in the catalog arrays, or -1 if the product is not in the catalog.
+        """
+
+        try:
+            return self.positions.get(productID, -1)
+        except TypeError:
+            # Unhashable IDs are never in the catalog
+            return -1
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # find Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def find(self, productID) -> int:
+
+        """
+        Method:
+
+            int find
+            (
+                T productID
+            )
+
+        Description:
+            Returns the position of a product in the catalog arrays. Raises a KeyError if the product is not in the catalog.
+        """
+
+        position = self.position(productID)
+        if position < 0:
+            raise KeyError("Error: Product " + str(productID) + " is not in the product catalog.")
+        return position
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # commodity Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def commodity(self, productID):
+        return self.commodityIDs[self.find(productID)]
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # uom Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def uom(self, productID):
+        return self.uoms[self.find(productID)]
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # brandType Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def brandType(self, productID):
+        return self.brandTypes[self.find(productID)]
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # desc Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def desc(self, productID) -> str:
+        return self.descs[self.find(productID)]
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # positionsOf Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def positionsOf(self, productIDs) -> np.ndarray:
+
+        """
+        Method:
+
+            ndarray positionsOf
+            (
+                array-like productIDs
+            )
+
+        Description:
+            Returns the position of each of the given products in the catalog arrays, with -1 for products that are not in the catalog.
+        """
+
+        return self.index.get_indexer(pd.Index(productIDs))
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # lookup Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def lookup(self, productIDs) -> pd.DataFrame:
+
+        """
+        Method:
+
+            DataFrame lookup
+            (
+                array-like productIDs
+            )
+
+        Description:
+            Bulk lookup of the given products. Returns one row per given ID, in the same order, with the commodity class ID, the unit of
+            measure, the brand type and the joined description of the product. Products that are not in the catalog have missing
+            values.
+
+        Output:
+            DataFrame
+            Columns: 'ProductID', 'CommodityID', 'StdUOM', 'BrandType', 'Desc'
+        """
+
+        positions = self.positionsOf(productIDs)
+        found = positions >= 0
+
+        def take(values: np.ndarray) -> pd.Series:
+            series = pd.Series(values[np.where(found, positions, 0)] if len(values) > 0 else np.full(len(positions), np.nan))
+            return series.where(found)
+
+        return pd.DataFrame({self.productIDKey: np.asarray(productIDs),
+                             self.commodityIDKey: take(self.commodityIDs),
+                             self.uomKey: take(self.uoms),
+                             self.brandTypeKey: take(self.brandTypes),
+                             'Desc': take(self.descs)})
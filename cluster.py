@@ -2,8 +2,9 @@ import math
 import pdb
 import scipy.stats as stat
 
-import dataset as ds
+import homogeneity as hom
 import product as pro
+import resultbuilder as rb
 
 #==========================================================================================================================================
 # Cluster Class
@@ -34,18 +35,55 @@ class Cluster:
             A collection of sets of product IDs. Each set is a subset of the products property.
             Key: name of the filter set
             Value: set object containing product IDs.
+        
+        int version:
+            Counter that is incremented whenever a product is added to or removed from the cluster.
+        
+        DistanceIndex distanceIndex:
+            Distance index fitted to the products of the cluster, if it has been built; see getDistanceIndex.
+        
+        tuple distanceIndexKey:
+            Version of the cluster to which distanceIndex was fitted, along with the arguments of getDistanceIndex.
+        
+        dict<T, string> normalizedDescs:
+            Descriptions of the products of the cluster, normalized by hom.normalizeText; see getNormalizedDescs. Unused if the cluster
+            has a descriptionCache.
+        
+        DescriptionCache descriptionCache:
+            Cache of preprocessed descriptions that is shared with the other clusters, or None.
+        
+        int salesVersion:
+            Counter that is incremented whenever sales are added to a product of the cluster.
+        
+        PriceMatrix priceMatrix:
+            Price matrix of the products of the cluster, if it has been built; see getPriceMatrix.
+        
+        tuple priceMatrixKey:
+            Versions of the cluster to which priceMatrix was built.
+        
+        dict<T, Product> removedProducts:
+            Products that were removed from the cluster, whose sales may still serve as a reference; see getProduct.
             
     """
     
     #--------------------------------------------------------------------------------------------------------------------------------------
     # Constructor
     #--------------------------------------------------------------------------------------------------------------------------------------
-    def __init__(self, commodity, geography):
+    def __init__(self, commodity, geography, descriptionCache = None):
         self.commodity = commodity
         self.geography = geography
         self.tpoIDs = []
         self.products = {}
         self.filterSets = {}
+        self.version = 0
+        self.distanceIndex = None
+        self.distanceIndexKey = None
+        self.normalizedDescs = {}
+        self.descriptionCache = descriptionCache
+        self.salesVersion = 0
+        self.priceMatrix = None
+        self.priceMatrixKey = None
+        self.removedProducts = {}
     
     #--------------------------------------------------------------------------------------------------------------------------------------
     # hasDuplicates Method
@@ -101,7 +139,9 @@ class Cluster:
         
         if productID not in self.products:
             self.products[productID] = pro.Product(productID, UOM, brandType, desc)
+            self.version += 1
         self.products[productID].addProperties(periodID, outletID, unitSize, unitCount, sales)
+        self.salesVersion += 1
     
     #--------------------------------------------------------------------------------------------------------------------------------------
     # removeProduct Method
@@ -114,19 +154,151 @@ class Cluster:
                     )
         
         Description: 
-            This method removes the product associated with the given product ID from all sets.
+            This method removes the product associated with the given product ID from all sets. The Product object is kept in
+            removedProducts.
             
         Arguments:
             T productID: Unique identifier of the product to be removed.
         """
         
-        self.products.pop(productID)
+        self.removedProducts[productID] = self.products.pop(productID)
+        self.version += 1
         for setName, filterSet in self.filterSets.items():
             try:
                 filterSet.remove(productID)
             except KeyError:
                 pass
     
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # getProduct Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def getProduct(self, productID):
+        """
+        Method:     Product getProduct
+                    (
+                        T productID
+                    )
+        
+        Description: 
+            This method returns the Product object of the given product ID, whether it is in the cluster or was removed from it, or None
+            if the product was never added to the cluster.
+            
+        Arguments:
+            T productID: Unique identifier of the product.
+        
+        Output:
+            Product
+        """
+        
+        product = self.products.get(productID)
+        if product is None:
+            product = self.removedProducts.get(productID)
+        return product
+    
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # getPriceMatrix Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def getPriceMatrix(self) -> hom.PriceMatrix:
+        """
+        Method:     PriceMatrix getPriceMatrix()
+        
+        Description: 
+            This method returns the price matrix of the products of the cluster. The matrix is built on the first call and reused by
+            later calls, until a product is added to or removed from the cluster or sales are added to one of its products.
+        
+        Output:
+            PriceMatrix
+        """
+        
+        key = (self.version, self.salesVersion)
+        if self.priceMatrix is None or self.priceMatrixKey != key:
+            self.priceMatrix = hom.PriceMatrix(self.products)
+            self.priceMatrixKey = key
+        return self.priceMatrix
+    
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # getDistanceIndex Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def getDistanceIndex(self, 
+                         descriptionMatrix: hom.DescriptionMatrix = None, 
+                         approximateClusterSize: int = None, 
+                         hashTableCount: int = 16, 
+                         hashBitCount: int = 8) -> hom.DistanceIndex:
+        """
+        Method:     DistanceIndex getDistanceIndex
+                    (
+                        DescriptionMatrix descriptionMatrix,
+                        int approximateClusterSize,
+                        int hashTableCount,
+                        int hashBitCount
+                    )
+        
+        Description: 
+            This method returns a distance index fitted to the descriptions of the products of the cluster. The index is fitted on the
+            first call and reused by later calls, until a product is added to or removed from the cluster or different arguments are
+            given.
+            
+        Arguments:
+            DescriptionMatrix descriptionMatrix: Precomputed TF-IDF matrix from which the products are sliced. If None, a vectorizer is
+            fitted to the descriptions of the products of the cluster.
+            int approximateClusterSize: Number of products from which the cluster is searched with an ApproximateDistanceIndex. If
+            None, the cluster is always searched exhaustively.
+            int hashTableCount: Number of hash tables of an ApproximateDistanceIndex.
+            int hashBitCount: Number of bits per hash table of an ApproximateDistanceIndex.
+        
+        Output:
+            DistanceIndex
+        """
+        
+        approximate = approximateClusterSize is not None and len(self.products) >= approximateClusterSize
+        key = (self.version, id(descriptionMatrix), approximate, hashTableCount if approximate else None, hashBitCount if approximate else None)
+        
+        if self.distanceIndex is None or self.distanceIndexKey != key:
+            if approximate:
+                self.distanceIndex = hom.ApproximateDistanceIndex(self.products, 
+                                                                  descriptionMatrix, 
+                                                                  self.commodity.ID, 
+                                                                  hashTableCount, 
+                                                                  hashBitCount, 
+                                                                  descriptionCache = self.descriptionCache)
+            else:
+                self.distanceIndex = hom.DistanceIndex(self.products, descriptionMatrix, self.commodity.ID, self.descriptionCache)
+            self.distanceIndexKey = key
+        return self.distanceIndex
+    
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # getNormalizedDescs Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def getNormalizedDescs(self, productIDs: list) -> list:
+        """
+        Method:     list<string> getNormalizedDescs
+                    (
+                        list<T> productIDs
+                    )
+        
+        Description: 
+            This method returns the descriptions of the given products, normalized by hom.normalizeText for word similarity scoring.
+            Each description is normalized once and kept for later calls, in the descriptionCache of the cluster if it has one.
+            
+        Arguments:
+            list<T> productIDs: Unique identifiers of products of the cluster.
+        
+        Output:
+            list<string>
+        """
+        
+        if self.descriptionCache is not None:
+            return [self.descriptionCache.normalizedText(productID, self.products[productID].desc) for productID in productIDs]
+        
+        normalizedDescs = []
+        for productID in productIDs:
+            normalizedDesc = self.normalizedDescs.get(productID)
+            if normalizedDesc is None:
+                normalizedDesc = hom.normalizeText(self.products[productID].desc)
+                self.normalizedDescs[productID] = normalizedDesc
+            normalizedDescs.append(normalizedDesc)
+        return normalizedDescs
+    
     #--------------------------------------------------------------------------------------------------------------------------------------
     # find Method
     #--------------------------------------------------------------------------------------------------------------------------------------
@@ -484,7 +656,7 @@ class Cluster:
     #--------------------------------------------------------------------------------------------------------------------------------------
     # toFile Method
     #--------------------------------------------------------------------------------------------------------------------------------------  
-    def toDataFrame(self, periodID: int, tpoID: int, varLabels: list, setName: str = None):
+    def toDataFrame(self, periodID: int, tpoID: int, varLabels: list, setName: str = None, filterLabels: list = None):
         
         """
         Method:     DataFrame toDataFrame
@@ -492,7 +664,8 @@ class Cluster:
                         int periodID,
                         int tpoID,
                         list<string> varLabels,
-                        string setName
+                        string setName,
+                        list<string> filterLabels
                     )
         
         Description: 
@@ -504,6 +677,10 @@ class Cluster:
             int tpoID: Unique identifier of the TPO that this cluster is associated with.
             list<string> varLabels: Additional columns to be added to the output. Each varLabel corresponds to a variable in the 
                 variables property of each Product object.
+            string setName: Name of the filter set whose products are output. If None, every product of the cluster is output.
+            list<string> filterLabels: Filter sets for which a membership column is added to the output. If None, a column is added for
+                every filter set of the cluster, in the order in which they were created. Products are never members of a listed filter 
+                set that the cluster does not have, so that clusters with different filter sets still produce the same columns.
         """
         
         if setName == None:
@@ -511,12 +688,11 @@ class Cluster:
         else:
             productIDList = list(self.filterSets[setName])
         
-        filterLabels = []
-        for filterLabel in self.filterSets:
-            filterLabels.append(filterLabel)
+        if filterLabels == None:
+            filterLabels = list(self.filterSets)
         
         colLabels = ['TPO_ID', 'ProductID', 'UOM', 'Description', 'Unit Size', 'Quantity Units', 'Sales'] + varLabels + filterLabels
-        df = ds.fromDict(colLabels)
+        results = rb.ResultBuilder(colLabels)
         
         for productID in productIDList:
             
@@ -534,14 +710,14 @@ class Cluster:
                         
                 filters = []
                 for filterLabel in filterLabels:
-                    if productID in self.filterSets[filterLabel]:
+                    if productID in self.filterSets.get(filterLabel, ()):
                         filters.append(1)
                     else:
                         filters.append(0)
                 
-                ds.addRow(df, [tpoID, productID, product.UOM, product.desc, props.unitSize, props.unitCount, props.sales] + variables + filters)
+                results.addRow([tpoID, productID, product.UOM, product.desc, props.unitSize, props.unitCount, props.sales] + variables + filters)
         
-        return df
+        return results.toDataFrame()
                 
     #--------------------------------------------------------------------------------------------------------------------------------------
     # toString Method
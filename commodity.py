@@ -12,20 +12,23 @@ class Commodity:
     Instance Variables:
         int ID:
             Unique ID of the commodity class.
-        list<TargetProductOffer> tpos:
-            List of TPO IDs that fall within the commodity class.
+        set<int> tpoIDs:
+            Set of TPO IDs that fall within the commodity class.
+        AssignmentRegistry registry:
+            Registry with which the TPOs of the commodity class are registered, or None; see assignment.py.
     """
     
     #--------------------------------------------------------------------------------------------------------------------------------------
     # Constructor
     #--------------------------------------------------------------------------------------------------------------------------------------
-    def __init__(self, ID: int):        
+    def __init__(self, ID: int, registry = None):        
         """
         Constructor:
             
             Outlet
             (
-                int ID
+                int ID,
+                AssignmentRegistry registry
             )
             
         Description:
@@ -34,10 +37,35 @@ class Commodity:
         Arguments:
             int ID:
                 Unique identifier of the commodity class.
+            AssignmentRegistry registry:
+                If not None, the assigned products of the commodity class are retrieved from the registry rather than from its TPOs.
         """
         
         self.ID = int(ID)
         self.tpoIDs = set()
+        self.registry = registry
+    
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # addTPO Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def addTPO(self, tpo):
+        """
+        Method:
+            
+            void addTPO
+            (
+                TargetProductOffer tpo
+            )
+            
+        Description:
+            Associates a TPO with the commodity class, and registers it with the registry, if any.
+        """
+        
+        if tpo.ID not in self.tpoIDs:
+            self.tpoIDs.add(tpo.ID)
+        
+        if self.registry is not None:
+            self.registry.register(self.ID, tpo)
     
     #--------------------------------------------------------------------------------------------------------------------------------------
     # containsUnassignedTPOs Method
@@ -68,6 +96,9 @@ class Commodity:
             False otherwise
         """
         
+        if self.registry is not None:
+            return self.registry.containsUnassigned(self.ID, periodID)
+        
         for tpoID in self.tpoIDs:
             if not tpos[tpoID].isAssigned(periodID):
                 return True
@@ -76,11 +107,11 @@ class Commodity:
     #--------------------------------------------------------------------------------------------------------------------------------------
     # getAssignedProductIDs Method
     #--------------------------------------------------------------------------------------------------------------------------------------
-    def getAssignedProductIDs(self, tpos: dict, periodID: int, outletID: int = None) -> set:
+    def getAssignedProductIDs(self, tpos: dict, periodID: int, outletID: int = None):
         """
         Method:
             
-            set<int> getAssignedProductIDs
+            set-like<int> getAssignedProductIDs
             (
                 dict<int, TargetProductOffer> tpos,
                 int periodID,
@@ -100,9 +131,13 @@ class Commodity:
             int outletID: If not None, the search is limited to the given outlet.
                 
         Output:
-            set<int>
+            set-like<int>; a read-only view of the registry that reflects later assignments, if the commodity class has a registry, and 
+            a set otherwise.
         """
         
+        if self.registry is not None:
+            return self.registry.assignedProductIDs(self.ID, periodID, outletID)
+        
         assignedProductIDs = list()
         
         # Iterate over all TPOs associated with this commodity class.
@@ -1,16 +1,186 @@
+import numpy as np
 import pandas as pd
 
+import schema as sch
+
 """
 Description:
     Provides various utility functions to manipulate pandas dataframes.
 """
     
+#--------------------------------------------------------------------------------------------------------------------------------------
+# fileFormat Method
+#--------------------------------------------------------------------------------------------------------------------------------------
+def fileFormat(filePath: str) -> str:
+    lowerPath = filePath.lower()
+    if lowerPath.endswith(('.parquet', '.pq')):
+        return 'parquet'
+    if lowerPath.endswith(('.feather', '.arrow', '.ipc')):
+        return 'feather'
+    return 'csv'
+
 #--------------------------------------------------------------------------------------------------------------------------------------
 # fromFile Method
 #--------------------------------------------------------------------------------------------------------------------------------------
-def fromFile(filePath: str):
+def fromFile(filePath: str, schemaKey: str = None, filters: dict = None):
     print("\nConstructing DataFrame from file: \n'" + filePath + "'")
-    return pd.read_csv(filePath)
+    
+    # filters: dict<string, list> mapping a column name (e.g. 'CommodityID' or 'PeriodID') to the values to be kept.
+    # Filters on columns that the file does not contain are ignored.
+    if fileFormat(filePath) == 'csv':
+        return applyFilters(readCSV(filePath, schemaKey), filters)
+    
+    return readArrow(filePath, schemaKey, filters)
+
+#--------------------------------------------------------------------------------------------------------------------------------------
+# applyFilters Method
+#--------------------------------------------------------------------------------------------------------------------------------------
+def applyFilters(df, filters: dict = None):
+    if filters is not None:
+        for columnName, values in filters.items():
+            if columnName in df.columns:
+                df = df.loc[df[columnName].isin(values)].reset_index(drop=True)
+    return df
+
+#--------------------------------------------------------------------------------------------------------------------------------------
+# readCSV Method
+#--------------------------------------------------------------------------------------------------------------------------------------
+def readCSV(filePath: str, schemaKey: str = None, chunkSize: int = None):
+    
+    # If chunkSize is given, an iterator over DataFrames of at most chunkSize rows is returned instead
+    if schemaKey is None:
+        return pd.read_csv(filePath, chunksize=chunkSize)
+    
+    # Parse only the declared columns, with the declared dtypes
+    schema = sch.getSchema(schemaKey)
+    header = pd.read_csv(filePath, nrows=0).columns.tolist()
+    columns = schema.resolveColumns(header)
+    df = pd.read_csv(filePath, usecols=columns, dtype=schema.dtypeMap(columns), chunksize=chunkSize)
+    if chunkSize is not None:
+        return (schema.narrowColumns(chunk) for chunk in df)
+    
+    df = schema.narrowColumns(df)
+    df.attrs['schema'] = schemaKey
+    return df
+
+#--------------------------------------------------------------------------------------------------------------------------------------
+# readArrow Method
+#--------------------------------------------------------------------------------------------------------------------------------------
+def readArrow(filePath: str, schemaKey: str = None, filters: dict = None):
+    
+    source, columns, expression = scanArrow(filePath, schemaKey, filters)
+    df = source.to_table(columns=columns, filter=expression).to_pandas()
+    
+    if schemaKey is not None:
+        df = applySchema(df, schemaKey, copy=False)
+    return df
+
+#--------------------------------------------------------------------------------------------------------------------------------------
+# scanArrow Method
+#--------------------------------------------------------------------------------------------------------------------------------------
+def scanArrow(filePath: str, schemaKey: str = None, filters: dict = None) -> tuple:
+    
+    try:
+        import pyarrow.dataset as pads
+    except ImportError:
+        raise ImportError("Error: pyarrow is required to read '" + filePath + "'.")
+    
+    arrowFormat = 'parquet' if fileFormat(filePath) == 'parquet' else 'ipc'
+    source = pads.dataset(filePath, format=arrowFormat)
+    header = source.schema.names
+    
+    # Project the declared columns
+    columns = None
+    if schemaKey is not None:
+        columns = sch.getSchema(schemaKey).resolveColumns(header)
+    
+    # Push the filters down into the scan, so that row groups without any matching value are skipped
+    expression = None
+    if filters is not None:
+        for columnName, values in filters.items():
+            if columnName in header:
+                condition = pads.field(columnName).isin(list(values))
+                expression = condition if expression is None else expression & condition
+    
+    return source, columns, expression
+
+#--------------------------------------------------------------------------------------------------------------------------------------
+# iterFile Method
+#--------------------------------------------------------------------------------------------------------------------------------------
+def iterFile(filePath: str, schemaKey: str = None, chunkSize: int = 1000000, filters: dict = None):
+    
+    # Yields the rows of a file as DataFrames of at most chunkSize rows
+    if fileFormat(filePath) == 'csv':
+        for chunk in readCSV(filePath, schemaKey, chunkSize):
+            yield applyFilters(chunk, filters)
+    else:
+        source, columns, expression = scanArrow(filePath, schemaKey, filters)
+        for batch in source.to_batches(columns=columns, filter=expression, batch_size=chunkSize):
+            chunk = batch.to_pandas()
+            yield chunk if schemaKey is None else applySchema(chunk, schemaKey, copy=False)
+
+#--------------------------------------------------------------------------------------------------------------------------------------
+# applySchema Method
+#--------------------------------------------------------------------------------------------------------------------------------------
+def applySchema(df, schemaKey: str, copy: bool = True):
+    
+    # Converts the columns of a copy of the frame, or of the frame itself if copy is False and the caller owns it
+    # Frames parsed with the same schema are already typed
+    if df.attrs.get('schema') == schemaKey:
+        return df
+    
+    schema = sch.getSchema(schemaKey)
+    dtypes = schema.dtypeMap([colName for colName in df.columns if colName in schema.dtypes or schema.usecols is None])
+    
+    if copy:
+        df = df.copy()
+    for colName, T in dtypes.items():
+        # Nullable columns without missing values are converted to their declared dtype directly
+        if colName in schema.nullableCols and not df[colName].isnull().any():
+            T = schema.dtypes[colName]
+        if T is str:
+            # Convert to string while marking missing values (None or NaN) as NaN
+            df[colName] = df[colName].astype(str).where(df[colName].notnull(), np.nan)
+        elif str(df[colName].dtype) != str(T):
+            df[colName] = df[colName].astype(T)
+    
+    df.attrs['schema'] = schemaKey
+    return df
+
+#--------------------------------------------------------------------------------------------------------------------------------------
+# aggregateSales Method
+#--------------------------------------------------------------------------------------------------------------------------------------
+def aggregateSales(filePath: str, outletData, chunkSize: int = 1000000, filters: dict = None):
+    print("\nAggregating sales from file: \n'" + filePath + "'")
+    
+    # Streams a sales file in chunks of at most chunkSize rows. Each chunk is joined to the SiteID -> OutletID mapping of outletData and 
+    # summed by (OutletID, ProductID, PeriodID); since a product belongs to a single commodity class, this is also the 
+    # (CommodityID, OutletID, ProductID, PeriodID) granularity at which clusters are populated. Sales at sites that are not mapped to an 
+    # outlet are dropped, as they can never be part of a cluster. As in the join of assignSample, the sales of a site that is mapped to 
+    # several outlets are attributed to every one of them.
+    # Peak memory is bounded by a few chunks plus the aggregated output, rather than by the size of the file.
+    siteMap = outletData[['SiteID', 'OutletID']]
+    keys = ['OutletID', 'ProductID', 'PeriodID']
+    values = ['QtyUnits', 'Sales']
+    
+    partials = []
+    partialRows = 0
+    aggregatedRows = 0
+    for chunk in iterFile(filePath, 'sales', chunkSize, filters):
+        chunk = chunk.merge(siteMap, how='inner', on='SiteID')
+        partial = chunk.groupby(keys, sort=False)[values].sum()
+        partials.append(partial)
+        partialRows += len(partial)
+        
+        # Fold the partial aggregates together once they outgrow the aggregated output
+        if partialRows > max(2 * aggregatedRows, chunkSize):
+            partials = [pd.concat(partials).groupby(level=keys, sort=False).sum()]
+            partialRows = aggregatedRows = len(partials[0])
+    
+    if len(partials) == 0:
+        return fromDict(keys + values)
+    
+    return pd.concat(partials).groupby(level=keys, sort=False).sum().reset_index()
 
 #--------------------------------------------------------------------------------------------------------------------------------------
 # fromDict Method
@@ -28,7 +198,7 @@ def rowCount(df) -> int:
 # appendDataSet Method
 #--------------------------------------------------------------------------------------------------------------------------------------
 def appendDataSet(df_top, df_bottom):
-    return df_top.append(df_bottom)
+    return pd.concat([df_top, df_bottom])
 
 #--------------------------------------------------------------------------------------------------------------------------------------
 # filterData Method
@@ -71,6 +241,20 @@ def concatenateRow(df, index: int = 0, delimiter: str = ',', dropColumns: list =
     tokens = [str(token) for token in tokens]
     return delimiter.join(tokens)
 
+#--------------------------------------------------------------------------------------------------------------------------------------
+# concatenateColumns Method
+#--------------------------------------------------------------------------------------------------------------------------------------
+def concatenateColumns(df, delimiter: str = ',', dropColumns: list = None):
+    
+    # Vectorized counterpart of concatenateRow over every row; missing values are concatenated as empty strings
+    if dropColumns != None:
+        df = df.drop(columns=dropColumns)
+    
+    columns = [df.iloc[:, i].astype(object).fillna('').astype(str) for i in range(0, len(df.columns))]
+    if len(columns) == 0:
+        return pd.Series('', index=df.index)
+    return columns[0].str.cat(columns[1:], sep=delimiter)
+
 #--------------------------------------------------------------------------------------------------------------------------------------
 # addRow Method
 #--------------------------------------------------------------------------------------------------------------------------------------
@@ -108,6 +292,38 @@ def cellValue(df, columnName: str, rowIndex: int = 0):
 #--------------------------------------------------------------------------------------------------------------------------------------
 def generateFile(df, outputFilePath: str, index: bool = False):
     print("\nGenerating file: \n'" + outputFilePath + "' ...")
-    df.to_csv(outputFilePath, encoding='utf-8', index=index)       
+    
+    outputFormat = fileFormat(outputFilePath)
+    if outputFormat == 'csv':
+        df.to_csv(outputFilePath, encoding='utf-8', index=index)
+        return
+    
+    # Columnar formats require unique column names and a single type per column
+    df = df.reset_index(drop=not index)
+    df.columns = uniqueColumns(df.columns)
+    df = df.infer_objects()
+    
+    if outputFormat == 'parquet':
+        df.to_parquet(outputFilePath, index=False)
+    else:
+        df.to_feather(outputFilePath)
+
+#--------------------------------------------------------------------------------------------------------------------------------------
+# uniqueColumns Method
+#--------------------------------------------------------------------------------------------------------------------------------------
+def uniqueColumns(columnNames) -> list:
+    
+    # Duplicate names are suffixed in the same way as pd.read_csv does; e.g. 'Sales', 'Sales.1'
+    counts = {}
+    names = []
+    for name in columnNames:
+        name = str(name)
+        if name in counts:
+            counts[name] += 1
+            names.append(name + '.' + str(counts[name]))
+        else:
+            counts[name] = 0
+            names.append(name)
+    return names       
     
             
\ No newline at end of file
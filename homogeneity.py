@@ -1,18 +1,28 @@
+import collections
 import math
+import numpy as np
 import pandas as pd
 import pdb
 import re
-from sklearn.neighbors import NearestNeighbors
+import scipy.sparse as sps
+import sys
 from sklearn.pipeline import make_pipeline
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import normalize
+from sklearn.utils import murmurhash3_32
+from sklearn.utils.extmath import row_norms, safe_sparse_dot
+from sklearn.feature_extraction.text import CountVectorizer, HashingVectorizer, TfidfVectorizer
 import unicodedata as ucd
 
+import catalog as cat
 import product as pro
 
+# Analyzer of the TfidfVectorizer of DistanceIndex, which tokenizes descriptions
+TEXT_ANALYZER = TfidfVectorizer(encoding = "latin-1").build_analyzer()
+
 #------------------------------------------------------------------------------------------------------------------------------------------
 # computePriceHomogeneity Method
 #------------------------------------------------------------------------------------------------------------------------------------------       
-def computePriceHomogeneity(varName: str, refProduct: pro.Product, products: dict):
+def computePriceHomogeneity(varName: str, refProduct: pro.Product, products: dict, priceMatrix = None):
     
     """
     Method:
@@ -20,12 +30,15 @@ def computePriceHomogeneity(varName: str, refProduct: pro.Product, products: dic
         void computePriceHomogeneity
         (
             string varName,
-            int refProduct,
-            dict<int, Product> products
+            Product refProduct,
+            dict<int, Product> products,
+            PriceMatrix priceMatrix
         )
         
     Description:
-        Computes a price homogeneity score for each product in the product map.
+        Computes a price homogeneity score for each product in the product map: the mean squared difference between the price relatives 
+        of the product and those of the reference product, over every pair of consecutive periods during which both products were sold.
+        Products that share no such pair of periods with the reference product have a score of infinity.
     
     Arguments
         string varName:
@@ -34,40 +47,1207 @@ def computePriceHomogeneity(varName: str, refProduct: pro.Product, products: dic
             Product that will serve as the reference.
         dict<int, Product> products:
             Map of candidate products.
+        PriceMatrix priceMatrix:
+            Price matrix of the candidate products, if it was already built; see Cluster.getPriceMatrix.
     """
     
-    if len(refProduct) == None:
+    if refProduct is None:
         raise ValueError("Error: The reference product has not been instantiated.")
     if len(products) == 0:
         raise ValueError("Error: The product map is empty.")
     
-    if len(refProduct.properties) > 0:
-        periodIDs = list(refProduct.properties.keys())
-        refPriceRelatives = {}
+    if priceMatrix is None:
+        priceMatrix = PriceMatrix(products)
+    
+    scores = priceMatrix.computeHomogeneities([refProduct])[0]
+    for productID, score in zip(priceMatrix.productIDs, scores.tolist()):
+        products[productID].variables[varName] = score
+
+#------------------------------------------------------------------------------------------------------------------------------------------
+# computePriceHomogeneities Method
+#------------------------------------------------------------------------------------------------------------------------------------------
+def computePriceHomogeneities(references: list, products: dict, priceMatrix = None) -> list:
+    
+    """
+    Method:
+        
+        list<dict<T, float>> computePriceHomogeneities
+        (
+            list<Product> references,
+            dict<int, Product> products,
+            PriceMatrix priceMatrix
+        )
+        
+    Description:
+        Computes the price homogeneity scores of the candidate products against each of the reference products at once, as 
+        computePriceHomogeneity does for a single reference product.
+    
+    Arguments
+        list<Product> references:
+            Products that will serve as the references.
+        dict<int, Product> products:
+            Map of candidate products.
+        PriceMatrix priceMatrix:
+            Price matrix of the candidate products, if it was already built; see Cluster.getPriceMatrix.
+            
+    Output:
+        list<dict<T, float>>
+        One map of product IDs to price homogeneity scores per reference, in the order of references.
+    """
+    
+    if len(products) == 0:
+        raise ValueError("Error: The product map is empty.")
+    if len(references) == 0:
+        return []
+    
+    if priceMatrix is None:
+        priceMatrix = PriceMatrix(products)
+    
+    return [dict(zip(priceMatrix.productIDs, scores.tolist())) for scores in priceMatrix.computeHomogeneities(references)]
+
+#==========================================================================================================================================
+# PriceMatrix Class
+#==========================================================================================================================================
+class PriceMatrix:
+    
+    """
+    Class:     PriceMatrix
+    
+    Description:
+        Unit prices of a set of products, as a dense matrix with one row per product and one column per period, from which the price
+        relatives between consecutive periods are computed once. The price homogeneity scores of every product against any number of 
+        reference products are then computed in a single NumPy expression, rather than by walking the ProductProperties of every 
+        product and period.
+        
+        Prices that are missing, or not finite because no unit was sold, are NaN; so are the price relatives that involve them, which are
+        left out of the scores.
+        
+    Instance Variables:
+        list<T> productIDs:
+            Product IDs, in the order of the rows.
+        ndarray periodIDs:
+            Period IDs during which any of the products was sold, in ascending order, in the order of the columns of prices.
+        ndarray prices:
+            Unit price of each product during each period.
+        ndarray basePeriodIDs:
+            Periods p such that period p + 1 is also in periodIDs, in the order of the columns of relatives.
+        ndarray relatives:
+            Price relative of each product between periods p + 1 and p, for each period p of basePeriodIDs.
+    """
+    
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # Constructor
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def __init__(self, products: dict):
+        
+        """
+        Constructor:
+            
+            PriceMatrix
+            (
+                dict<int, Product> products
+            )
+            
+        Description:
+            Builds the price matrix and the price relatives of the given products.
+        """
+        
+        self.productIDs = list(products.keys())
+        self.periodIDs = np.array(sorted(set(periodID for product in products.values() for periodID in product.properties)), dtype = np.int64)
+        self.prices = self.computePrices(products.values())
+        
+        consecutive = np.flatnonzero(np.diff(self.periodIDs) == 1)
+        self.basePeriodIDs = self.periodIDs[consecutive]
+        self.relatives = PriceMatrix.computeRelatives(self.prices, consecutive)
+    
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # __len__ Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def __len__(self) -> int:
+        return len(self.productIDs)
+    
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # computePrices Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def computePrices(self, products) -> np.ndarray:
+        
+        """
+        Method:
+            
+            ndarray computePrices
+            (
+                iterable<Product> products
+            )
+            
+        Description:
+            Returns the unit price of each of the given products during each period of periodIDs, one row per product. Periods during 
+            which a product was not sold are NaN, and periods that are not in periodIDs are ignored.
+        """
+        
+        columns = dict(zip(self.periodIDs.tolist(), range(0, len(self.periodIDs))))
+        rows = []
+        cols = []
+        sales = []
+        unitCounts = []
+        productCount = 0
+        for row, product in enumerate(products):
+            productCount += 1
+            for periodID, prop in product.properties.items():
+                col = columns.get(periodID)
+                if col is not None:
+                    rows.append(row)
+                    cols.append(col)
+                    sales.append(prop.sales)
+                    unitCounts.append(prop.unitCount)
+        
+        prices = np.full((productCount, len(self.periodIDs)), np.nan)
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            prices[rows, cols] = np.divide(sales, unitCounts, dtype = np.float64)
+        prices[~np.isfinite(prices)] = np.nan
+        return prices
+    
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # computeRelatives Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    @staticmethod
+    def computeRelatives(prices: np.ndarray, consecutive: np.ndarray) -> np.ndarray:
+        
+        """
+        Method:
+            
+            ndarray computeRelatives
+            (
+                ndarray prices,
+                ndarray consecutive
+            )
+            
+        Description:
+            Returns the price relatives between columns c + 1 and c of the given prices, for each column c of consecutive. Relatives 
+            that are not finite are NaN.
+        """
+        
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            relatives = prices[:, consecutive + 1] / prices[:, consecutive]
+        relatives[~np.isfinite(relatives)] = np.nan
+        return relatives
+    
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # computeHomogeneities Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def computeHomogeneities(self, references: list) -> np.ndarray:
+        
+        """
+        Method:
+            
+            ndarray computeHomogeneities
+            (
+                list<Product> references
+            )
+            
+        Description:
+            Returns the price homogeneity score of every product of the matrix against each of the reference products, one row per
+            reference and one column per product; see computePriceHomogeneity. The reference products need not be in the matrix.
+        """
+        
+        consecutive = np.flatnonzero(np.diff(self.periodIDs) == 1)
+        refRelatives = PriceMatrix.computeRelatives(self.computePrices(references), consecutive)
+        
+        scores = np.empty((len(references), len(self.productIDs)))
+        
+        # Bound the size of the dense difference array of each chunk of references to about chunkBytes
+        chunkBytes = 2**26
+        chunkSize = max(1, chunkBytes // (8 * max(1, self.relatives.size)))
+        
+        for start in range(0, len(references), chunkSize):
+            differences = refRelatives[start:start + chunkSize, np.newaxis, :] - self.relatives[np.newaxis, :, :]
+            counts = np.count_nonzero(~np.isnan(differences), axis = 2)
+            squaredSums = np.nansum(differences**2, axis = 2)
+            scores[start:start + chunkSize] = np.divide(squaredSums, counts, out = np.full(counts.shape, math.inf), where = counts > 0)
+        
+        return scores
+
+#==========================================================================================================================================
+# CachedDescription Class
+#==========================================================================================================================================
+class CachedDescription:
+    
+    """
+    Class:     CachedDescription
+    
+    Description:
+        Preprocessed forms of a product description, as held by a DescriptionCache.
+        
+    Instance Variables:
+        string desc:
+            Concatenated text features of the product.
+        string normalizedText:
+            Description normalized by normalizeText, for word similarity scoring.
+        list<string> tokens:
+            Tokens of the description, as produced by the analyzer of the TfidfVectorizer of DistanceIndex.
+        ndarray tokenHashes:
+            Signed 32-bit MurmurHash3 of each token (seed 0), as used by sklearn's HashingVectorizer.
+        int byteCount:
+            Approximate memory held by the entry, excluding desc, which is shared with the Product object.
+    """
+    
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # Constructor
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def __init__(self, desc: str, normalizedText: str = None):
+        
+        """
+        Constructor:
+            
+            CachedDescription
+            (
+                string desc,
+                string normalizedText
+            )
+            
+        Description:
+            Normalizes, tokenizes and hashes a description. The description is not normalized again if its normalizedText is given.
+        """
+        
+        self.desc = desc
+        self.normalizedText = normalizeText(desc) if normalizedText is None else normalizedText
+        self.tokens = analyzeText(desc)
+        self.tokenHashes = np.array([murmurhash3_32(token, seed = 0) for token in self.tokens], dtype = np.int32)
+        
+        self.byteCount = sys.getsizeof(self) + sys.getsizeof(self.normalizedText) + sys.getsizeof(self.tokens) + self.tokenHashes.nbytes
+        self.byteCount += sum(sys.getsizeof(token) for token in self.tokens)
+
+#==========================================================================================================================================
+# DescriptionCache Class
+#==========================================================================================================================================
+class DescriptionCache:
+    
+    """
+    Class:     DescriptionCache
+    
+    Description:
+        Bounded cache of preprocessed product descriptions, keyed by product ID and shared by every cluster and TPO of a Substituter, so
+        that each description is normalized, tokenized and hashed once rather than once per cluster and TPO that contains it. Once the 
+        entries hold more than maxBytes, the least recently used entries are evicted.
+        
+        An entry is only returned for the description from which it was built; if a product is looked up with a different description,
+        the entry is rebuilt. If the cache has a VectorStore, the normalized descriptions of new entries are read from the store.
+        
+    Instance Variables:
+        int maxBytes:
+            Memory above which entries are evicted, as accounted by CachedDescription.byteCount.
+        OrderedDict<T, CachedDescription> entries:
+            Cached descriptions, from the least to the most recently used.
+        int byteCount:
+            Memory held by the entries.
+        int hits:
+            Number of lookups that were answered from the cache.
+        int misses:
+            Number of lookups that required the description to be preprocessed.
+        int evictions:
+            Number of entries that were evicted.
+        VectorStore vectorStore:
+            Persistent store of normalized descriptions, or None; see vectorstore.py.
+    """
+    
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # Constructor
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def __init__(self, maxBytes: int = 256 * 2**20):
         
-        for i in range(0, len(periodIDs) - 1):
-            if periodIDs[i] + 1 in periodIDs:
-                refPriceRelatives[periodIDs[i]] = refProduct.priceRelative(periodIDs[i] + 1, periodIDs[i])
+        """
+        Constructor:
+            
+            DescriptionCache
+            (
+                int maxBytes
+            )
+            
+        Description:
+            Constructs an empty DescriptionCache object.
+        """
+        
+        if maxBytes < 0:
+            raise ValueError("Error: The size of the description cache cannot be negative.")
+        
+        self.maxBytes = maxBytes
+        self.entries = collections.OrderedDict()
+        self.byteCount = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.vectorStore = None
+    
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # __len__ Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def __len__(self) -> int:
+        return len(self.entries)
+    
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # get Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def get(self, productID, desc: str) -> CachedDescription:
+        
+        """
+        Method:
+            
+            CachedDescription get
+            (
+                T productID,
+                string desc
+            )
+            
+        Description:
+            Returns the preprocessed description of a product, which is built and cached if it is not in the cache yet.
+        """
+        
+        entry = self.entries.get(productID)
+        if entry is not None and (entry.desc is desc or entry.desc == desc):
+            self.hits += 1
+            self.entries.move_to_end(productID)
+            return entry
+        
+        self.misses += 1
+        if entry is not None:
+            self.byteCount -= self.entries.pop(productID).byteCount
+        
+        entry = CachedDescription(desc, None if self.vectorStore is None else self.vectorStore.normalizedText(productID, desc))
+        self.entries[productID] = entry
+        self.byteCount += entry.byteCount
+        
+        # Evict the least recently used entries, but never the one that was just added
+        while self.byteCount > self.maxBytes and len(self.entries) > 1:
+            self.byteCount -= self.entries.popitem(last = False)[1].byteCount
+            self.evictions += 1
+        
+        return entry
+    
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # normalizedText Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def normalizedText(self, productID, desc: str) -> str:
+        return self.get(productID, desc).normalizedText
+    
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # tokens Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def tokens(self, productID, desc: str) -> list:
+        return self.get(productID, desc).tokens
+    
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # tokenHashes Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def tokenHashes(self, productID, desc: str) -> np.ndarray:
+        return self.get(productID, desc).tokenHashes
+    
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # stats Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def stats(self) -> dict:
+        
+        """
+        Method:
+            
+            dict<string, T> stats()
+            
+        Description:
+            Returns the counters of the cache, for sizing it: 'entries', 'bytes', 'maxBytes', 'hits', 'misses', 'evictions' and
+            'hitRate' (fraction of the lookups answered from the cache).
+        """
+        
+        lookupCount = self.hits + self.misses
+        return {'entries': len(self.entries),
+                'bytes': self.byteCount,
+                'maxBytes': self.maxBytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hitRate': self.hits / lookupCount if lookupCount > 0 else 0.0}
+    
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # clear Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def clear(self):
+        
+        """
+        Method:
+            
+            void clear()
+            
+        Description:
+            Discards every entry and resets the counters.
+        """
+        
+        self.entries.clear()
+        self.byteCount = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+#==========================================================================================================================================
+# DescriptionMatrix Class
+#==========================================================================================================================================
+class DescriptionMatrix:
+    
+    """
+    Class:     DescriptionMatrix
+    
+    Description:
+        Term counts of every product description of a ProductCatalog, tokenized once and stored as a sparse CSR matrix with one row per
+        product. Distance indices built from the matrix slice the rows of their candidates out of it, instead of tokenizing and
+        vectorizing the descriptions of every cluster again.
+        
+        The tokenization is that of TfidfVectorizer, and the TF-IDF weights are computed as in TfidfVectorizer (smoothed IDF, l2
+        normalization). The documents over which the IDF is computed are given by idfScope:
+            'cluster': the products of each cluster, as when a TfidfVectorizer is fitted to every cluster; the distances are those of a
+                DistanceIndex built without a DescriptionMatrix, up to floating-point rounding (see benchmark.verifyDescriptionMatrix)
+            'commodity': every product of the commodity class in the catalog; the IDF is computed once per commodity class
+            'corpus': every product in the catalog; the IDF is computed once
+        
+        Terms that do not occur in any of the documents over which the IDF is computed have a weight of zero, as terms outside the
+        vocabulary of a fitted TfidfVectorizer.
+        
+        If featureCount is given, the terms are hashed into featureCount columns by a HashingVectorizer instead of being looked up in a 
+        vocabulary. No vocabulary is built or kept, the rows of every product can be computed independently of the others (their columns
+        are the absolute tokenHashes of a CachedDescription modulo featureCount), and the matrix is cheap to pickle and ship to workers.
+        The IDF table of each scope is then a dense array of featureCount entries, which is still computed once per scope.
+        
+        If a VectorStore is given, the term counts are read from it, and only the descriptions that are not in the store yet are tokenized;
+        the columns of the matrix are then those of the store, which are the same across runs. See vectorstore.py. Terms whose hashes
+        collide share a column, which perturbs the distances slightly; see benchmark.compareHashedDistances for their effect.
+        
+    Instance Variables:
+        ProductCatalog catalog:
+            Catalog whose descriptions are vectorized. The rows of the matrix follow the order of the catalog arrays.
+        string idfScope: = 'cluster' or 'commodity' or 'corpus'
+            Documents over which the IDF is computed.
+        int featureCount:
+            Number of columns into which the terms are hashed, or None if the terms are looked up in a vocabulary.
+        CountVectorizer or HashingVectorizer vectorizer:
+            Vectorizer fitted to every description of the catalog, or HashingVectorizer, which needs no fitting.
+        csr_matrix counts:
+            Term counts of every product of the catalog.
+        dict<T, ndarray> idfs:
+            IDF of each term, by commodity class ID for the 'commodity' scope and under the key None for the 'corpus' scope.
+        csr_matrix weights:
+            Normalized TF-IDF weights of every product of the catalog, for the 'commodity' and 'corpus' scopes; None otherwise.
+    """
+    
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # Constructor
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def __init__(self, catalog: cat.ProductCatalog, idfScope: str = 'cluster', featureCount: int = None, vectorStore = None):
+        
+        """
+        Constructor:
+            
+            DescriptionMatrix
+            (
+                ProductCatalog catalog,
+                string idfScope,
+                int featureCount,
+                VectorStore vectorStore
+            )
+            
+        Description:
+            Tokenizes every description of the catalog and, unless idfScope is 'cluster', computes the TF-IDF weights of every product.
+            If featureCount is not None, the terms are hashed into featureCount columns rather than looked up in a vocabulary. If 
+            vectorStore is not None, the term counts are read from it instead, and the store must have the same featureCount.
+        """
+        
+        if idfScope not in ['cluster', 'commodity', 'corpus']:
+            raise ValueError("Error: '" + str(idfScope) + "' is not a valid IDF scope.")
+        if featureCount is not None and featureCount < 1:
+            raise ValueError("Error: The number of hashed features must be positive.")
+        if vectorStore is not None and vectorStore.featureCount != featureCount:
+            raise ValueError("Error: The vector store was built with " + str(vectorStore.featureCount) + " hashed features rather than " + 
+                             str(featureCount) + ".")
+        if len(catalog) == 0:
+            raise ValueError("Error: The product catalog is empty.")
+        
+        self.catalog = catalog
+        self.idfScope = idfScope
+        self.featureCount = featureCount
+        
+        # The vectorizer of a TfidfVectorizer, which tokenizes the same way, or a hashing vectorizer with the same tokenization
+        if vectorStore is not None:
+            self.counts = vectorStore.vectorize(catalog.productIDs.tolist(), catalog.descs.tolist())
+            self.vectorizer = vectorStore.buildVectorizer()
+        elif featureCount is None:
+            self.vectorizer = CountVectorizer(encoding = "latin-1", dtype = np.float64)
+            self.counts = sps.csr_matrix(self.vectorizer.fit_transform(catalog.descs.tolist()))
+        else:
+            self.vectorizer = HashingVectorizer(encoding = "latin-1", n_features = featureCount, alternate_sign = False, norm = None, dtype = np.float64)
+            self.counts = sps.csr_matrix(self.vectorizer.transform(catalog.descs.tolist()))
+        
+        self.idfs = {}
+        self.weights = None
+        
+        if idfScope == 'corpus':
+            self.idfs[None] = DescriptionMatrix.computeIDF(self.counts)
+            self.weights = DescriptionMatrix.weigh(self.counts, self.idfs[None])
+            
+        elif idfScope == 'commodity':
+            # Every row is weighted by the IDF of its own commodity class
+            comIDs = pd.Series(catalog.commodityIDs)
+            blocks = []
+            order = []
+            for comID, positions in comIDs.groupby(comIDs, sort=False, dropna=False).indices.items():
+                self.idfs[comID] = DescriptionMatrix.computeIDF(self.counts[positions])
+                blocks.append(DescriptionMatrix.weigh(self.counts[positions], self.idfs[comID]))
+                order.append(positions)
+            self.weights = sps.vstack(blocks, format = 'csr')[np.argsort(np.concatenate(order), kind = 'stable')]
+    
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # computeIDF Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    @staticmethod
+    def computeIDF(counts: sps.csr_matrix) -> np.ndarray:
+        
+        """
+        Method:
+            
+            ndarray computeIDF
+            (
+                csr_matrix counts
+            )
+            
+        Description:
+            Returns the smoothed IDF of each term over the given documents, as computed by TfidfVectorizer. Terms that do not occur in
+            any of the documents have an IDF of zero.
+        """
+        
+        documentCount = counts.shape[0]
+        documentFrequencies = np.bincount(counts.indices, minlength = counts.shape[1])
+        idf = np.log((1 + documentCount) / (1 + documentFrequencies)) + 1
+        idf[documentFrequencies == 0] = 0
+        return idf
+    
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # weigh Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    @staticmethod
+    def weigh(counts: sps.csr_matrix, idf: np.ndarray) -> sps.csr_matrix:
+        
+        """
+        Method:
+            
+            csr_matrix weigh
+            (
+                csr_matrix counts,
+                ndarray idf
+            )
+            
+        Description:
+            Returns the l2-normalized TF-IDF weights of the given term counts.
+        """
+        
+        weights = sps.csr_matrix(counts, copy = True)
+        weights.data *= idf[weights.indices]
+        weights.eliminate_zeros()
+        return normalize(weights, copy = False)
+    
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # slice Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def slice(self, productIDs: list, descs: list, comID = None) -> tuple:
+        
+        """
+        Method:
+            
+            tuple<csr_matrix, ndarray> slice
+            (
+                list<T> productIDs,
+                list<string> descs,
+                T comID
+            )
+            
+        Description:
+            Returns the TF-IDF weights of the given products, one row per product, along with the IDF with which they were weighted. 
+            Products of the catalog are sliced out of the matrix; the descriptions of the other products are tokenized.
+        
+        Arguments
+            list<T> productIDs:
+                Product IDs of the candidates.
+            list<string> descs:
+                Concatenated text features of the candidates, in the same order; only used for products that are not in the catalog.
+            T comID:
+                Commodity class of the candidates; used by the 'commodity' scope.
                 
-    counter = 0
-    for productID, product in products.items():
+        Output:
+            tuple<csr_matrix, ndarray> { weights, idf }
+        """
+        
+        positions = self.catalog.positionsOf(productIDs)
+        found = positions >= 0
         
-        distance = 0
-        for periodID in periodIDs:
-            if periodID in product.properties and periodID + 1 in product.properties:
-                priceRelative = product.priceRelative(periodID + 1, periodID)
-                distance += (refPriceRelatives[periodID] - priceRelative) ^ 2
-                counter += 1
+        counts = self.counts[np.where(found, positions, 0)]
+        
+        # Tokenize the descriptions of the products that are missing from the catalog
+        if not found.all():
+            missing = np.flatnonzero(~found)
+            present = np.flatnonzero(found)
+            missingCounts = sps.csr_matrix(self.vectorizer.transform([descs[i] for i in missing]))
+            counts = sps.vstack([counts[present], missingCounts], format = 'csr')[np.argsort(np.concatenate([present, missing]), kind = 'stable')]
+        
+        if self.idfScope == 'cluster':
+            idf = DescriptionMatrix.computeIDF(counts)
+            return DescriptionMatrix.weigh(counts, idf), idf
+        
+        idf = self.idfs.get(comID if self.idfScope == 'commodity' else None)
+        if idf is None:
+            # A commodity class without any product in the catalog is weighted over the candidates themselves
+            idf = DescriptionMatrix.computeIDF(counts)
+        elif found.all() and (self.idfScope == 'corpus' or (self.catalog.commodityIDs[positions] == comID).all()):
+            # The precomputed rows were weighted by the same IDF
+            return self.weights[positions], idf
+        
+        return DescriptionMatrix.weigh(counts, idf), idf
+    
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # transform Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def transform(self, descs: list, idf: np.ndarray) -> sps.csr_matrix:
         
-        if counter > 0:
-            product.variables[varName] = distance / counter
+        """
+        Method:
+            
+            csr_matrix transform
+            (
+                list<string> descs,
+                ndarray idf
+            )
+            
+        Description:
+            Tokenizes the given descriptions and returns their TF-IDF weights under the given IDF, as returned by slice.
+        """
+        
+        return DescriptionMatrix.weigh(sps.csr_matrix(self.vectorizer.transform(descs)), idf)
+
+#==========================================================================================================================================
+# DistanceIndex Class
+#==========================================================================================================================================
+class DistanceIndex:
+    
+    """
+    Class:     DistanceIndex
+    
+    Description:
+        TF-IDF model and nearest-neighbour index fitted to the descriptions of a map of candidate products. Fitting is by far the most
+        expensive part of computeDistance, so the index is meant to be built once per product map and reused for every reference product;
+        each query only transforms the reference and searches the fitted index.
+        
+        The index is searched by a dedicated kernel rather than by NearestNeighbors. The Euclidean distances between the references and
+        the candidates are computed from a single sparse dot product, as ||x||^2 + ||y||^2 - 2 x.y, in the same order of operations as
+        sklearn, so that the distances are bit-for-bit those of NearestNeighbors. Since the rows are l2-normalized, this is a function
+        of their cosine similarity. Candidates are only partially sorted (numpy.argpartition) when fewer neighbours than candidates are
+        requested; otherwise every candidate is returned as is.
+        
+        The index reflects the product map at the time it was built. It must be rebuilt whenever products are added to or removed from the
+        map; see Cluster.getDistanceIndex.
+        
+        If a DescriptionMatrix is given, the candidates are sliced out of it rather than vectorized, and the IDF is computed over the
+        documents given by its idfScope. Otherwise, if a DescriptionCache is given, the tokens of the candidates are taken from the cache
+        rather than tokenized again.
+        
+    Instance Variables:
+        Pipeline transformer:
+            TF-IDF vectorizer fitted to the candidate descriptions, or to their cached tokens; None if the index was built from a 
+            DescriptionMatrix.
+        DescriptionMatrix descriptionMatrix:
+            Matrix from which the candidates were sliced, if any.
+        ndarray idf:
+            IDF with which the candidates were weighted, if the index was built from a DescriptionMatrix.
+        list<T> candidateKeys:
+            Product IDs of the candidates, in the order of the rows of the index.
+        csr_matrix candidates:
+            TF-IDF weights of the candidates, one row per candidate.
+        ndarray candidateNorms:
+            Squared l2 norm of each row of candidates.
+    """
+    
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # Constructor
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def __init__(self, products: dict, descriptionMatrix: DescriptionMatrix = None, comID = None, descriptionCache: DescriptionCache = None):
+        
+        """
+        Constructor:
+            
+            DistanceIndex
+            (
+                dict<int, Product> products,
+                DescriptionMatrix descriptionMatrix,
+                T comID,
+                DescriptionCache descriptionCache
+            )
+            
+        Description:
+            Fits the TF-IDF model and the nearest-neighbour index to the descriptions of the given products. If descriptionMatrix is not
+            None, the TF-IDF weights of the products are sliced out of it instead; comID is the commodity class of the products.
+        """
+        
+        if len(products) == 0:
+            raise ValueError("Error: The product map is empty.")
+        
+        self.descriptionMatrix = descriptionMatrix
+        self.transformer = None
+        self.idf = None
+        
+        # Tranform the data
+        self.candidateKeys = list(products.keys())
+        candidateFeatures = [product.desc for product in products.values()]
+        if descriptionMatrix is None and descriptionCache is not None:
+            # The cached tokens are those of the default analyzer, which the vectorizer is given as is
+            self.transformer = make_pipeline(TfidfVectorizer(encoding = "latin-1", analyzer = passTokens))
+            candidateTokens = [descriptionCache.tokens(productID, product.desc) for productID, product in products.items()]
+            transformedCandidates = self.transformer.fit_transform(candidateTokens)
+        elif descriptionMatrix is None:
+            self.transformer = make_pipeline(TfidfVectorizer(encoding = "latin-1"))
+            transformedCandidates = self.transformer.fit_transform(candidateFeatures)
         else:
-            product.variables[varName] = math.inf
+            transformedCandidates, self.idf = descriptionMatrix.slice(self.candidateKeys, candidateFeatures, comID)
+        
+        # Index the entire set
+        self.candidates = sps.csr_matrix(transformedCandidates)
+        self.candidateNorms = row_norms(self.candidates, squared = True)[np.newaxis, :]
+    
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # __len__ Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def __len__(self) -> int:
+        return len(self.candidateKeys)
+    
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # query Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def query(self, reference: pd.Series, neighbourCount: int = 10) -> dict:
+        
+        """
+        Method:
+            
+            dict<T, float> query
+            (
+                Series reference,
+                int neighbourCount
+            )
+            
+        Description:
+            Returns the distances between the reference and its nearest neighbours among the candidates.
+        
+        Arguments
+            Series reference:
+                Series of concatenated text features.
+            int neighbourCount:
+                Number of neighbours to return. If it exceeds the number of candidates, every candidate is returned.
+                
+        Output:
+            dict<T, float>
+            Key: product ID of a nearest neighbour
+            Value: distance to the reference
+        """
+        
+        distances, indices = self.kneighbors(reference.tolist(), neighbourCount)
+        
+        # Keep the first occurrence of each neighbour, as with a search of the flattened results
+        neighbours = {}
+        for index, distance in zip(indices.flatten().tolist(), distances.flatten().tolist()):
+            if index >= 0:
+                neighbours.setdefault(self.candidateKeys[index], distance)
+        return neighbours
+    
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # queryBatch Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def queryBatch(self, references: list, neighbourCount: int = 10) -> list:
+        
+        """
+        Method:
+            
+            list<dict<T, float>> queryBatch
+            (
+                list<string> references,
+                int neighbourCount
+            )
+            
+        Description:
+            Returns the nearest neighbours of several references at once; i.e. the result of query for each reference. The references
+            are transformed and searched in a single call, which computes the distances between every reference and every candidate as
+            one sparse matrix product. Identical references are only searched once.
+        
+        Arguments
+            list<string> references:
+                Concatenated text features of each reference.
+            int neighbourCount:
+                Number of neighbours to return per reference.
+                
+        Output:
+            list<dict<T, float>>
+            One map of nearest neighbours to their distance per reference, in the order of references.
+        """
+        
+        if len(references) == 0:
+            return []
+        
+        rows = {}
+        for reference in references:
+            rows.setdefault(reference, len(rows))
+        
+        distances, indices = self.kneighbors(list(rows.keys()), neighbourCount)
+        
+        candidateKeys = self.candidateKeys
+        neighbours = [{candidateKeys[index]: distance for index, distance in zip(indices[i].tolist(), distances[i].tolist()) if index >= 0}
+                      for i in range(0, len(rows))]
+        return [neighbours[rows[reference]] for reference in references]
+    
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # kneighbors Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def kneighbors(self, references: list, neighbourCount: int) -> tuple:
+        
+        """
+        Method:
+            
+            tuple<ndarray, ndarray> kneighbors
+            (
+                list<string> references,
+                int neighbourCount
+            )
+            
+        Description:
+            Transforms the references and searches the index for their nearest neighbours. Returns the distances and the positions of
+            the neighbours of each reference, one row per reference. If neighbourCount is smaller than the number of candidates, the
+            neighbours of each reference are sorted by distance; otherwise, every candidate is returned in the order of the index.
+        """
+        
+        # If the neighbourCount exceeds the number of candidates, then it is readjusted.
+        if neighbourCount > len(self.candidateKeys):
+            neighbourCount = len(self.candidateKeys)
+        
+        transformedReferences = self.transform(references)
+        
+        # Bound the size of the dense distance matrix of each chunk of references to about chunkBytes
+        chunkBytes = 2**26
+        chunkSize = max(1, chunkBytes // (8 * len(self.candidateKeys)))
+        
+        distanceChunks = []
+        indexChunks = []
+        for start in range(0, transformedReferences.shape[0], chunkSize):
+            distances = self.computeDistances(transformedReferences[start:start + chunkSize])
+            
+            if neighbourCount == len(self.candidateKeys):
+                indices = np.broadcast_to(np.arange(0, neighbourCount), distances.shape)
+            else:
+                # Partial selection of the nearest neighbours, which are then sorted
+                indices = np.argpartition(distances, neighbourCount - 1, axis = 1)[:, :neighbourCount]
+                distances = np.take_along_axis(distances, indices, axis = 1)
+                order = np.argsort(distances, axis = 1, kind = 'stable')
+                indices = np.take_along_axis(indices, order, axis = 1)
+                distances = np.take_along_axis(distances, order, axis = 1)
+            
+            distanceChunks.append(distances)
+            indexChunks.append(indices)
+        
+        return np.concatenate(distanceChunks), np.concatenate(indexChunks)
+    
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # transform Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def transform(self, references: list) -> sps.csr_matrix:
+        
+        """
+        Method:
+            
+            csr_matrix transform
+            (
+                list<string> references
+            )
+            
+        Description:
+            Returns the TF-IDF weights of the references, one row per reference.
+        """
+        
+        if self.descriptionMatrix is None and self.transformer.steps[0][1].analyzer is passTokens:
+            transformedReferences = self.transformer.transform([analyzeText(reference) for reference in references])
+        elif self.descriptionMatrix is None:
+            transformedReferences = self.transformer.transform(references)
+        else:
+            transformedReferences = self.descriptionMatrix.transform(references, self.idf)
+        transformedReferences = sps.csr_matrix(transformedReferences)
+        
+        if transformedReferences.shape[0] == 0:
+            raise ValueError("Error: No reference was given.")
+        return transformedReferences
+    
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # computeDistances Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def computeDistances(self, transformedReferences: sps.csr_matrix, positions: np.ndarray = None) -> np.ndarray:
+        
+        """
+        Method:
+            
+            ndarray computeDistances
+            (
+                csr_matrix transformedReferences,
+                ndarray positions
+            )
+            
+        Description:
+            Returns the dense matrix of the Euclidean distances between every transformed reference (rows) and every candidate
+            (columns), or only the candidates at the given positions if positions is not None. The operations are those of 
+            sklearn.metrics.pairwise.euclidean_distances.
+        """
+        
+        candidates = self.candidates
+        candidateNorms = self.candidateNorms
+        if positions is not None:
+            candidates = candidates[positions]
+            candidateNorms = candidateNorms[:, positions]
+        
+        referenceNorms = row_norms(transformedReferences, squared = True)[:, np.newaxis]
+        
+        distances = -2 * safe_sparse_dot(transformedReferences, candidates.T, dense_output = True)
+        distances += referenceNorms
+        distances += candidateNorms
+        np.maximum(distances, 0, out = distances)
+        return np.sqrt(distances, out = distances)
 
+#==========================================================================================================================================
+# ApproximateDistanceIndex Class
+#==========================================================================================================================================
+class ApproximateDistanceIndex(DistanceIndex):
+    
+    """
+    Class:     ApproximateDistanceIndex
+    
+    Description:
+        DistanceIndex that only computes the distances to the candidates that are likely to be near the reference, for clusters too large
+        for an exhaustive search. Candidates are hashed by random-projection locality-sensitive hashing (SimHash): each of tableCount
+        hash tables assigns a candidate the signs of its projections onto bitCount random hyperplanes. A query retrieves the candidates
+        that share a bucket with the reference in any table, and computes their exact distances with the kernel of DistanceIndex.
+        Candidates that are not retrieved are treated as beyond the nearest neighbours; i.e. they are assigned a distance of infinity by
+        computeDistance.
+        
+        Two descriptions are hashed to the same bucket of a table with a probability of (1 - angle / pi)^bitCount, where angle is the
+        angle between their TF-IDF vectors. More tables raise the recall; more bits per table reduce the number of retrieved candidates
+        and thereby raise the speed. Near duplicates, such as relaunched products, are retrieved with a high probability. See 
+        benchmark.evaluateApproximateIndex for the recall, the speedup and the memory of various settings.
+        
+        The hyperplanes span every column of the TF-IDF weights, which may be the whole vocabulary or hashed feature space of a
+        DescriptionMatrix. Rather than being drawn as a dense matrix, the component of every hyperplane along a column is derived from a
+        hash of the column, the hyperplane and the seed (see projectPlanes), so that only the components along the columns present in
+        the hashed rows are ever materialized. Every index with the same seed therefore projects onto the same hyperplanes, and the
+        results are reproducible.
+        
+    Instance Variables:
+        int tableCount:
+            Number of hash tables.
+        int bitCount:
+            Number of hyperplanes (bits) per hash table.
+        int seed:
+            Seed from which the hyperplanes are derived.
+        ndarray order:
+            Positions of the candidates sorted by their code, one column per table.
+        ndarray sortedCodes:
+            Codes of the candidates in the order of order, one column per table.
+    """
+    
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # Constructor
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def __init__(self, 
+                 products: dict, 
+                 descriptionMatrix: DescriptionMatrix = None, 
+                 comID = None, 
+                 tableCount: int = 16, 
+                 bitCount: int = 8, 
+                 seed: int = 0, 
+                 descriptionCache: DescriptionCache = None):
+        
+        """
+        Constructor:
+            
+            ApproximateDistanceIndex
+            (
+                dict<int, Product> products,
+                DescriptionMatrix descriptionMatrix,
+                T comID,
+                int tableCount,
+                int bitCount,
+                int seed,
+                DescriptionCache descriptionCache
+            )
+            
+        Description:
+            Fits the TF-IDF model to the descriptions of the given products, as DistanceIndex, and hashes every product into the hash 
+            tables.
+        """
+        
+        if tableCount < 1:
+            raise ValueError("Error: An approximate index requires at least one hash table.")
+        if bitCount < 1 or bitCount > 62:
+            raise ValueError("Error: The number of bits per hash table must be between 1 and 62.")
+        
+        DistanceIndex.__init__(self, products, descriptionMatrix, comID, descriptionCache)
+        
+        self.tableCount = tableCount
+        self.bitCount = bitCount
+        self.seed = seed
+        
+        codes = self.hash(self.candidates)
+        self.order = np.argsort(codes, axis = 0, kind = 'stable')
+        self.sortedCodes = np.take_along_axis(codes, self.order, axis = 0)
+    
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # hash Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def hash(self, transformed: sps.csr_matrix) -> np.ndarray:
+        
+        """
+        Method:
+            
+            ndarray hash
+            (
+                csr_matrix transformed
+            )
+            
+        Description:
+            Returns the code of every row of the given TF-IDF weights in every hash table; one row per row of transformed and one column
+            per table.
+        """
+        
+        # Only project onto the components of the hyperplanes along the columns that are present
+        columns, localColumns = np.unique(transformed.indices, return_inverse = True)
+        compact = sps.csr_matrix((transformed.data, localColumns.ravel(), transformed.indptr), shape = (transformed.shape[0], len(columns)))
+        
+        bits = safe_sparse_dot(compact, self.projectPlanes(columns), dense_output = True) > 0
+        bits = bits.reshape(transformed.shape[0], self.tableCount, self.bitCount)
+        return (bits * (np.int64(1) << np.arange(0, self.bitCount, dtype = np.int64))).sum(axis = 2)
+    
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # projectPlanes Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def projectPlanes(self, columns: np.ndarray) -> np.ndarray:
+        
+        """
+        Method:
+            
+            ndarray projectPlanes
+            (
+                ndarray columns
+            )
+            
+        Description:
+            Returns the components of the hyperplanes of every table along the given columns; one row per column and one column per 
+            hyperplane. Every component is a standard normal deviate, derived by the Box-Muller transform from two uniform deviates that
+            are hashed from the seed, the column and the hyperplane by SplitMix64. A component therefore does not depend on the other
+            columns or on the width of the feature space.
+        """
+        
+        def mix(keys: np.ndarray) -> np.ndarray:
+            keys = keys + np.uint64(0x9E3779B97F4A7C15)
+            keys = (keys ^ (keys >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+            keys = (keys ^ (keys >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+            return keys ^ (keys >> np.uint64(31))
+        
+        planeCount = self.tableCount * self.bitCount
+        keys = np.asarray(columns, dtype = np.uint64)[:, None] * np.uint64(2 * planeCount) + np.arange(0, 2 * planeCount, 2, dtype = np.uint64)
+        
+        with np.errstate(over = 'ignore'):
+            keys = keys ^ mix(np.full(1, self.seed, dtype = np.uint64))
+            uniforms = [((mix(keys + np.uint64(offset)) >> np.uint64(11)) + np.uint64(1)) * 2.0**-53 for offset in [0, 1]]
+        
+        return np.sqrt(-2 * np.log(uniforms[0])) * np.cos(2 * math.pi * uniforms[1])
+    
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # retrieve Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def retrieve(self, codes: np.ndarray) -> np.ndarray:
+        
+        """
+        Method:
+            
+            ndarray retrieve
+            (
+                ndarray codes
+            )
+            
+        Description:
+            Returns the sorted positions of the candidates that share a bucket with the given codes of a reference in any table.
+        """
+        
+        positions = []
+        for table in range(0, self.tableCount):
+            start = np.searchsorted(self.sortedCodes[:, table], codes[table], side = 'left')
+            stop = np.searchsorted(self.sortedCodes[:, table], codes[table], side = 'right')
+            positions.append(self.order[start:stop, table])
+        return np.unique(np.concatenate(positions))
+    
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # kneighbors Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def kneighbors(self, references: list, neighbourCount: int) -> tuple:
+        
+        """
+        Method:
+            
+            tuple<ndarray, ndarray> kneighbors
+            (
+                list<string> references,
+                int neighbourCount
+            )
+            
+        Description:
+            Transforms the references and searches the retrieved candidates for their nearest neighbours, sorted by distance. Returns
+            the distances and the positions of the neighbours of each reference, one row per reference. The rows are as wide as the
+            largest number of neighbours found for a reference, at most neighbourCount; shorter rows are padded with a distance of 
+            infinity and a position of -1.
+        """
+        
+        # If the neighbourCount exceeds the number of candidates, then it is readjusted.
+        if neighbourCount > len(self.candidateKeys):
+            neighbourCount = len(self.candidateKeys)
+        
+        transformedReferences = self.transform(references)
+        codes = self.hash(transformedReferences)
+        
+        neighbours = []
+        for i in range(0, transformedReferences.shape[0]):
+            positions = self.retrieve(codes[i])
+            if len(positions) == 0:
+                neighbours.append((positions, np.empty(0)))
+                continue
+            
+            retrievedDistances = self.computeDistances(transformedReferences[i], positions)[0]
+            if len(positions) > neighbourCount:
+                selection = np.argpartition(retrievedDistances, neighbourCount - 1)[:neighbourCount]
+                positions = positions[selection]
+                retrievedDistances = retrievedDistances[selection]
+            
+            order = np.argsort(retrievedDistances, kind = 'stable')
+            neighbours.append((positions[order], retrievedDistances[order]))
+        
+        # The rows are only as wide as the largest number of neighbours found
+        width = max(len(positions) for positions, retrievedDistances in neighbours)
+        distances = np.full((len(neighbours), width), math.inf)
+        indices = np.full((len(neighbours), width), -1, dtype = np.int64)
+        for i, (positions, retrievedDistances) in enumerate(neighbours):
+            distances[i, :len(positions)] = retrievedDistances
+            indices[i, :len(positions)] = positions
+        
+        return distances, indices
+    
 #------------------------------------------------------------------------------------------------------------------------------------------
 # computeDistance Method
 #------------------------------------------------------------------------------------------------------------------------------------------
-def computeDistance(varKey: str, reference: pd.Series, products: dict, neighbourCount: int = 10):
+def computeDistance(varKey: str, 
+                    reference: pd.Series, 
+                    products: dict, 
+                    neighbourCount: int = 10, 
+                    index: DistanceIndex = None, 
+                    neighbours: dict = None, 
+                    descriptionCache: DescriptionCache = None):
     
     """
     Method:
@@ -77,7 +1257,10 @@ def computeDistance(varKey: str, reference: pd.Series, products: dict, neighbour
             string varName,
             Series reference,
             dict<int, Product> products,
-            int neighbourCount
+            int neighbourCount,
+            DistanceIndex index,
+            dict<T, float> neighbours,
+            DescriptionCache descriptionCache
         )
         
     Description:
@@ -94,54 +1277,130 @@ def computeDistance(varKey: str, reference: pd.Series, products: dict, neighbour
             Map of candidate products.
         int neighbourCount:
             Number of neighbours to return.
+        DistanceIndex index:
+            Index fitted to the product map. If None, a new index is fitted for this call only; callers that compute distances for
+            several references over the same product map should build the index once and pass it instead. See DistanceIndex for
+            building it from a DescriptionMatrix.
+        dict<T, float> neighbours:
+            Nearest neighbours of the reference, as returned by computeDistances. If given, the reference is not searched again.
+        DescriptionCache descriptionCache:
+            Cache of the tokens of the products, used if a new index is fitted.
     """
     
-    # If the neighbourCount exceeds the size of the product map, then it is readjusted.
-    if neighbourCount > len(products):
-        neighbourCount = len(products)
+    if neighbours is None:
+        if index is None:
+            index = DistanceIndex(products, descriptionCache = descriptionCache)
+        neighbours = index.query(reference, neighbourCount)
     
-    # Initialize the transformer
-    transformer = make_pipeline(TfidfVectorizer(encoding = "latin-1"))
+     # Iterate through all products in the product map
+    for productID, product in products.items():
+        
+        # Case 1: The product is among the nearest neighbours: assign the actual distance.
+        # Case 2: The product is not among the nearest neighbours: assign a distance of infinity.
+        product.variables[varKey] = neighbours.get(productID, math.inf)
     
-    # Tranform the data
-    candidates = list(map(lambda productID: [productID, products[productID]], products))
-    candidateKeys = list(map(lambda candidate: candidate[0], candidates))
-    candidateFeatures = list(map(lambda candidate: candidate[1].desc, candidates))
-    transformedCandidates = transformer.fit_transform(candidateFeatures)
+#------------------------------------------------------------------------------------------------------------------------------------------
+# computeDistances Method
+#------------------------------------------------------------------------------------------------------------------------------------------
+def computeDistances(references: list, products: dict, neighbourCount: int = 10, index: DistanceIndex = None) -> list:
     
-    transformedReference = transformer.transform(reference.tolist())
-                
-    #fit to entire set
-    estimator = NearestNeighbors(n_neighbors = neighbourCount)
-    estimator.fit(transformedCandidates)
+    """
+    Method:
+        
+        list<dict<T, float>> computeDistances
+        (
+            list<string> references,
+            dict<int, Product> products,
+            int neighbourCount,
+            DistanceIndex index
+        )
         
-    distances, indices = estimator.kneighbors(transformedReference, n_neighbors = neighbourCount)
+    Description:
+        Computes the nearest neighbours of several reference products within the product map at once, so that every reference of a
+        cluster is searched in a single operation. Each returned map may be passed to computeDistance to assign the distances of its
+        reference.
+    
+    Arguments
+        list<string> references:
+            Concatenated text features of each reference product.
+        dict<int, Product> products:
+            Map of candidate products.
+        int neighbourCount:
+            Number of neighbours to return per reference.
+        DistanceIndex index:
+            Index fitted to the product map. If None, a new index is fitted.
+            
+    Output:
+        list<dict<T, float>>
+        One map of nearest neighbours to their distance per reference, in the order of references.
+    """
     
-    candidateKeys = pd.Series(candidateKeys)
-    candidateKeys = candidateKeys[indices.flatten()].tolist() # 
+    if index is None:
+        index = DistanceIndex(products)
     
-    distances = list(distances.flatten())
+    return index.queryBatch(references, neighbourCount)
     
-    #pdb.set_trace()
+#------------------------------------------------------------------------------------------------------------------------------------------
+# normalizeText Method
+#------------------------------------------------------------------------------------------------------------------------------------------
+def normalizeText(text: str) -> str:
     
-     # Iterate through all products in the product map
-    for productID, product in products.items():
+    """
+    Method:
         
-        # Case 1: The product is among the nearest neighbours.
-        if productID in candidateKeys:
-            # Assign the actual distance.
-            cIndex = candidateKeys.index(productID)
-            products[productID].variables[varKey] = distances[cIndex]
-            
-        # Case 2: The product is not among the nearest neighbours.
-        else:
-            # Assign a distance of infinity.
-            products[productID].variables[varKey] = math.inf
+        string normalizeText
+        (
+            string text
+        )
+        
+    Description:
+        Returns the casefolded NFKD normal form of a string, in which words are compared by computeWordSimilarity.
+    """
     
+    return ucd.normalize("NFKD", text.casefold())
+
+#------------------------------------------------------------------------------------------------------------------------------------------
+# analyzeText Method
+#------------------------------------------------------------------------------------------------------------------------------------------
+def analyzeText(text: str) -> list:
+    
+    """
+    Method:
+        
+        list<string> analyzeText
+        (
+            string text
+        )
+        
+    Description:
+        Returns the tokens of a string, as produced by the analyzer of the TfidfVectorizer of DistanceIndex.
+    """
+    
+    return TEXT_ANALYZER(text)
+
+#------------------------------------------------------------------------------------------------------------------------------------------
+# passTokens Method
+#------------------------------------------------------------------------------------------------------------------------------------------
+def passTokens(tokens: list) -> list:
+    
+    """
+    Method:
+        
+        list<string> passTokens
+        (
+            list<string> tokens
+        )
+        
+    Description:
+        Analyzer of the vectorizers that are given tokens that were already produced by analyzeText.
+    """
+    
+    return tokens
+
 #------------------------------------------------------------------------------------------------------------------------------------------
 # computeWordSimilarity Method
 #------------------------------------------------------------------------------------------------------------------------------------------
-def computeWordSimilarity(subSentence: str, sentence: str, delimiters: str = '\s') -> float:
+def computeWordSimilarity(subSentence: str, sentence: str, delimiters: str = '\s', productID = None, descriptionCache: DescriptionCache = None) -> float:
     
     """
     Method:
@@ -150,12 +1409,16 @@ def computeWordSimilarity(subSentence: str, sentence: str, delimiters: str = '\s
         (
             string subSentence,
             string sentence,
-            string delimiters
+            string delimiters,
+            T productID,
+            DescriptionCache descriptionCache
         )
         
     Description:
         Computes a word similarity score between a string and a substring. The presence of each word in the substring is checked in the main
         string. A score of 1 is given if all words are present. A score of 0 is given if none of the words are present.
+        
+        To score a substring against many strings, use computeWordSimilarities instead.
     
     Arguments
         string subSentence:
@@ -164,18 +1427,68 @@ def computeWordSimilarity(subSentence: str, sentence: str, delimiters: str = '\s
             String of words.
         string delimiters:
             String of one or more delimiting characters. Separate each delimitor with a '|'.
+        T productID:
+            Unique identifier of the product described by sentence, under which its normalized form is cached, if a descriptionCache
+            is given.
+        DescriptionCache descriptionCache:
+            Cache of normalized descriptions.
     """
     
-    # Normalize the sub-string and the main string
-    subSentence = ucd.normalize("NFKD", subSentence.casefold())
-    sentence = ucd.normalize("NFKD", sentence.casefold())
+    if productID is not None and descriptionCache is not None:
+        return float(computeWordSimilarities(subSentence, [descriptionCache.normalizedText(productID, sentence)], delimiters, True)[0])
+    return float(computeWordSimilarities(subSentence, [sentence], delimiters)[0])
+
+#------------------------------------------------------------------------------------------------------------------------------------------
+# computeWordSimilarities Method
+#------------------------------------------------------------------------------------------------------------------------------------------
+def computeWordSimilarities(subSentence: str, sentences: list, delimiters: str = '\s', normalized: bool = False) -> np.ndarray:
     
-    # Split the sib-string into words
-    words = re.split(delimiters, subSentence)
+    """
+    Method:
+        
+        ndarray computeWordSimilarities
+        (
+            string subSentence,
+            list<string> sentences,
+            string delimiters,
+            bool normalized
+        )
+        
+    Description:
+        Computes the word similarity score of computeWordSimilarity between a substring and each of several strings at once. The
+        substring is normalized and split into words once, and each distinct word is searched in every string in a single vectorized
+        call. The scores are identical to those of computeWordSimilarity; in particular, words are matched as substrings, and the empty
+        words produced by consecutive delimiters are present in every string.
     
-    # Check whether each word is present in the main string
-    score = 0.0
+    Arguments
+        string subSentence:
+            String of words separated by delimiters.
+        list<string> sentences:
+            Strings of words.
+        string delimiters:
+            String of one or more delimiting characters. Separate each delimitor with a '|'.
+        bool normalized:
+            True if the strings have already been normalized by normalizeText, e.g. by Cluster.getNormalizedDescs.
+            
+    Output:
+        ndarray
+        Word similarity score of each string, in the order of sentences.
+    """
+    
+    # Normalize the sub-string and split it into words
+    words = re.split(delimiters, normalizeText(subSentence))
+    
+    # Normalize the main strings
+    if not normalized:
+        sentences = [normalizeText(sentence) for sentence in sentences]
+    sentences = np.array(sentences, dtype = str)
+    
+    # Check whether each word is present in the main strings; repeated words count once per occurrence
+    wordCounts = {}
     for word in words:
-        if word in sentence:
-            score += 1
-    return score / len(words)
\ No newline at end of file
+        wordCounts[word] = wordCounts.get(word, 0) + 1
+    
+    counts = np.zeros(len(sentences), dtype = np.int64)
+    for word, wordCount in wordCounts.items():
+        counts += wordCount * (np.char.find(sentences, word) >= 0)
+    return counts / len(words)
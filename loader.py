@@ -0,0 +1,192 @@
+import concurrent.futures as cf
+import os
+import time
+import pandas as pd
+
+import dataset as ds
+
+#------------------------------------------------------------------------------------------------------------------------------------------
+# readFile Method
+#------------------------------------------------------------------------------------------------------------------------------------------
+def readFile(key, filePath: str, schemaKey: str = None, filters: dict = None, outletData = None) -> tuple:
+
+    """
+    Method:
+
+        tuple<T, DataFrame, float> readFile
+        (
+            T key,
+            string filePath,
+            string schemaKey,
+            dict<string, list> filters,
+            DataFrame outletData
+        )
+
+    Description:
+        Reads a single file of a manifest. If outletData is given, the file is read as a sales file and pre-aggregated by outlet; see
+        ds.aggregateSales. Defined at module level so that it can be sent to worker processes.
+
+    Output:
+        tuple<T, DataFrame, float> { key, df, seconds }
+    """
+
+    start = time.perf_counter()
+    if outletData is not None:
+        df = ds.aggregateSales(filePath, outletData, filters=filters)
+    else:
+        df = ds.fromFile(filePath, schemaKey, filters)
+    return key, df, time.perf_counter() - start
+
+#==========================================================================================================================================
+# Loader Class
+#==========================================================================================================================================
+class Loader:
+
+    """
+    Class:     Loader
+
+    Description:
+        Reads the files of a manifest concurrently, with either a thread pool or a process pool, and keeps a report of the cost of each
+        file.
+
+    Instance Variables:
+        int maxWorkers:
+            Maximum number of files read at once. If None, the default of concurrent.futures is used.
+        bool useProcesses:
+            True if files are read in worker processes rather than threads.
+        DataFrame report:
+            One row per file read by the last call to load.
+            Columns: 'Key', 'FilePath', 'Bytes', 'Rows', 'Seconds'
+    """
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # Constructor
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def __init__(self, maxWorkers: int = None, useProcesses: bool = False):
+
+        """
+        Constructor:
+
+            Loader
+            (
+                int maxWorkers,
+                bool useProcesses
+            )
+
+        Description:
+            Constructs a Loader object.
+        """
+
+        self.maxWorkers = maxWorkers
+        self.useProcesses = useProcesses
+        self.report = None
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # load Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def load(self, manifest: dict, schemaKey: str = None, filterByPeriod: bool = False, outletDataSets: dict = None) -> dict:
+
+        """
+        Method:
+
+            dict<T, DataFrame> load
+            (
+                dict<T, string> manifest,
+                string schemaKey,
+                bool filterByPeriod,
+                dict<T, DataFrame> outletDataSets
+            )
+
+        Description:
+            Reads every file of the manifest concurrently and returns the resulting DataFrames under the same keys. When the keys are
+            period IDs, the output can be passed directly to Substituter.assignSample.
+
+        Arguments:
+            dict<T, string> manifest:
+                Files to be read.
+                Key: period ID (or any other identifier)
+                Value: location of the file
+            string schemaKey:
+                Name of the schema applied to every file; see schema.py.
+            bool filterByPeriod:
+                True if only the rows whose 'PeriodID' matches the key of their file are to be kept.
+            dict<T, DataFrame> outletDataSets:
+                If given, the files are read as sales files and pre-aggregated by outlet with the outlet DataFrame of the same key; see
+                ds.aggregateSales.
+
+        Output:
+            dict<T, DataFrame>
+        """
+
+        if self.useProcesses:
+            executor = cf.ProcessPoolExecutor(max_workers=self.maxWorkers)
+        else:
+            executor = cf.ThreadPoolExecutor(max_workers=self.maxWorkers)
+
+        dataSets = {}
+        seconds = {}
+        with executor:
+            futures = []
+            for key, filePath in manifest.items():
+                filters = {'PeriodID': [key]} if filterByPeriod else None
+                outletData = None if outletDataSets is None else outletDataSets[key]
+                futures.append(executor.submit(readFile, key, filePath, schemaKey, filters, outletData))
+
+            for future in cf.as_completed(futures):
+                key, df, elapsed = future.result()
+                dataSets[key] = df
+                seconds[key] = elapsed
+
+        # Report the cost of each file, in the order of the manifest
+        self.report = ds.fromDict(['Key', 'FilePath', 'Bytes', 'Rows', 'Seconds'])
+        for key, filePath in manifest.items():
+            ds.addRow(self.report, [key, filePath, os.path.getsize(filePath), ds.rowCount(dataSets[key]), seconds[key]])
+
+        print("\nLoaded " + str(len(manifest)) + " files:")
+        print(self.report.to_string(index=False))
+
+        # Preserve the order of the manifest
+        return {key: dataSets[key] for key in manifest}
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # loadSample Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def loadSample(self, salesManifest: dict, outletManifest: dict, aggregate: bool = False) -> tuple:
+
+        """
+        Method:
+
+            tuple<dict<int, DataFrame>, dict<int, DataFrame>> loadSample
+            (
+                dict<int, string> salesManifest,
+                dict<int, string> outletManifest,
+                bool aggregate
+            )
+
+        Description:
+            Reads the outlet files of every period concurrently, followed by the sales files of every period. The output can be passed
+            directly to Substituter.assignSample.
+
+        Arguments:
+            dict<int, string> salesManifest:
+                Sales files to be read.
+                Key: period ID
+                Value: location of the file
+            dict<int, string> outletManifest:
+                Outlet files to be read.
+                Key: period ID
+                Value: location of the file
+            bool aggregate:
+                True if the sales are to be streamed and pre-aggregated by outlet; see ds.aggregateSales.
+
+        Output:
+            tuple<dict<int, DataFrame>, dict<int, DataFrame>> { salesDataSets, outletDataSets }
+        """
+
+        outletDataSets = self.load(outletManifest, 'outlets')
+        outletReport = self.report
+
+        salesDataSets = self.load(salesManifest, 'sales', filterByPeriod=True, outletDataSets=outletDataSets if aggregate else None)
+        self.report = pd.concat([outletReport, self.report], ignore_index=True)
+
+        return salesDataSets, outletDataSets
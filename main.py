@@ -1,4 +1,6 @@
 import dataset as ds
+import loader as ld
+import snapshot as snap
 import substitution as sub
 import timer as tim
 
@@ -6,20 +8,36 @@ tim.Timer.startTimer()
 
 path = "P:\\Research\\CPI ADS Initiative\\4-Scanner Data (Sept 2016 on)\\Simple Implementation Plus (SI+)\\Data\\"
 
-# Construct the product sales DataFrame
-prodSalesDataSets = {9: ds.fromFile(path + "aggregatedSales_9.csv")}
+# File extension of the input and output files; '.csv', '.parquet' or '.feather'
+ext = ".csv"
 
-# Construct the product description DataFrame
-prodDescData = ds.fromFile(path + "productDescriptions.csv")
+salesFilePaths = {9: path + "aggregatedSales_9" + ext}
+outletFilePaths = {9: path + "outlets_9" + ext}
+descFilePath = path + "productDescriptions" + ext
+
+# Fingerprint the input files before any of them is read, so that a file that changes while the sample is prepared invalidates the snapshot.
+# Every file is hashed once; the snapshot is validated against the same fingerprints.
+inputFilePaths = list(salesFilePaths.values()) + list(outletFilePaths.values()) + [descFilePath]
+inputFingerprints = snap.fingerprintFiles(inputFilePaths)
 
-# Construct the outlet DataFrames
-outletDataSets = {9: ds.fromFile(path + "outlets_9.csv")}
+# Construct the product description DataFrame
+prodDescData = ds.fromFile(descFilePath, "descriptions")
 
 # Generate a dataset of TPOs
-tpoData = ds.fromFile(path + "tpos_unassigned_9.csv")
+tpoData = ds.fromFile(path + "tpos_unassigned_9" + ext, "tpos", filters={"PeriodID": [9]})
 
 # Construct the Substituter
-substituter = sub.Substituter(prodDescData, prodSalesDataSets, outletDataSets)
+substituter = sub.Substituter(prodDescData)
+
+# Reopen the prepared sample from its snapshot, unless any of the input files have changed since it was written
+if not substituter.loadSnapshot(path + "snapshot_9", inputFilePaths, inputFingerprints=inputFingerprints):
+    
+    # Construct the outlet and product sales DataFrames of every period concurrently.
+    # The sales are pre-aggregated by outlet while being read in chunks.
+    prodSalesDataSets, outletDataSets = ld.Loader().loadSample(salesFilePaths, outletFilePaths, aggregate=True)
+    
+    substituter.assignSample(prodSalesDataSets, outletDataSets)
+    substituter.saveSnapshot(path + "snapshot_9", inputFingerprints)
 
 # Substitute missing products
 substituter.substitute(tpoData,
@@ -32,10 +50,10 @@ substituter.substitute(tpoData,
                        lowerDistanceCutoff = 0.5,
                        upperDistanceCutoff = 1,
                        samplingStrategy = 'top_proportional',
-                       tpoMatchedFilePath = path + "tposMatched.csv",
+                       tpoMatchedFilePath = path + "tposMatched" + ext,
                        details = True,
-                       suggestionsFilePath = path + "suggestions.csv",
+                       suggestionsFilePath = path + "suggestions" + ext,
                        suggest = False,
-                       summaryFilePath = path + "summary.csv")
+                       summaryFilePath = path + "summary" + ext)
 
 print("\nElapsed time: " + str(tim.Timer.elapsedTime()))
\ No newline at end of file
@@ -0,0 +1,204 @@
+import numpy as np
+import pandas as pd
+
+#==========================================================================================================================================
+# ResultBuilder Class
+#==========================================================================================================================================
+class ResultBuilder:
+
+    """
+    Class:     ResultBuilder
+
+    Description:
+        Accumulates the rows of an output table in one buffer per column and materializes them as a DataFrame in a single step. Unlike
+        ds.addRow, which reallocates the DataFrame for every row, the cost of adding a row does not grow with the size of the table.
+
+        Columns are addressed by position, so that a table may contain several columns of the same name. Once chunkSize rows are
+        buffered, they are flushed into a DataFrame chunk. If a sink is given, every chunk is passed to it and then discarded, which bounds
+        the memory held by the builder.
+
+    Instance Variables:
+        list<string> columnNames:
+            Names of the columns of the table, in order. Names need not be unique.
+        list<T> dtypes:
+            Dtype of each column. A dtype of None means that the dtype of the column is inferred from its values.
+        int chunkSize:
+            Number of buffered rows after which the buffer is flushed. If None, the buffer is only flushed on demand.
+        function sink:
+            Function that is passed every flushed chunk as a DataFrame. If None, the chunks are kept until toDataFrame is called.
+        list<list<T>> buffers:
+            Values of the buffered rows; one list per column.
+        list<DataFrame> chunks:
+            Flushed chunks that have not been passed to a sink.
+        int rowCount:
+            Number of rows added since the builder was constructed or last cleared.
+    """
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # Constructor
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def __init__(self, columnNames: list, dtypes: list = None, chunkSize: int = None, sink = None):
+
+        """
+        Constructor:
+
+            ResultBuilder
+            (
+                list<string> columnNames,
+                list<T> dtypes,
+                int chunkSize,
+                function sink
+            )
+
+        Description:
+            Constructs a ResultBuilder object.
+        """
+
+        self.columnNames = list(columnNames)
+        self.dtypes = [None] * len(self.columnNames) if dtypes is None else list(dtypes)
+        self.chunkSize = chunkSize
+        self.sink = sink
+        self.chunks = []
+        self.rowCount = 0
+
+        if len(self.dtypes) != len(self.columnNames):
+            raise ValueError("Error: " + str(len(self.dtypes)) + " dtypes were given for " + str(len(self.columnNames)) + " columns.")
+
+        self.buffers = [[] for colName in self.columnNames]
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # addRow Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def addRow(self, row: list):
+
+        """
+        Method:
+
+            void addRow
+            (
+                list<T> row
+            )
+
+        Description:
+            Appends a row to the table. The row must contain one value per column, in the order of columnNames.
+        """
+
+        if len(row) != len(self.buffers):
+            raise ValueError("Error: A row of " + str(len(row)) + " values was given for " + str(len(self.buffers)) + " columns.")
+
+        for buffer, value in zip(self.buffers, row):
+            buffer.append(value)
+        self.rowCount += 1
+
+        if self.chunkSize is not None and len(self.buffers[0]) >= self.chunkSize:
+            self.flush()
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # bufferedRowCount Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def bufferedRowCount(self) -> int:
+
+        """
+        Method:
+
+            int bufferedRowCount()
+
+        Description:
+            Returns the number of rows that have been added since the last flush.
+        """
+
+        return len(self.buffers[0]) if len(self.buffers) > 0 else 0
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # buildChunk Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def buildChunk(self) -> pd.DataFrame:
+
+        """
+        Method:
+
+            DataFrame buildChunk()
+
+        Description:
+            Materializes the buffered rows as a DataFrame and empties the buffer.
+        """
+
+        data = {}
+        for i, buffer in enumerate(self.buffers):
+            if self.dtypes[i] is None:
+                data[i] = pd.Series(buffer, dtype=object if len(buffer) == 0 else None)
+            else:
+                data[i] = pd.Series(np.asarray(buffer, dtype=self.dtypes[i]) if len(buffer) > 0 else buffer, dtype=self.dtypes[i])
+
+        df = pd.DataFrame(data)
+        df.columns = self.columnNames
+
+        self.buffers = [[] for colName in self.columnNames]
+        return df
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # flush Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def flush(self):
+
+        """
+        Method:
+
+            void flush()
+
+        Description:
+            Materializes the buffered rows as a DataFrame chunk, which is either passed to the sink or kept until toDataFrame is called.
+        """
+
+        if self.bufferedRowCount() == 0:
+            return
+
+        chunk = self.buildChunk()
+        if self.sink is not None:
+            self.sink(chunk)
+        else:
+            self.chunks.append(chunk)
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # toDataFrame Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def toDataFrame(self) -> pd.DataFrame:
+
+        """
+        Method:
+
+            DataFrame toDataFrame()
+
+        Description:
+            Returns every row that has been added and not passed to a sink as a single DataFrame with a RangeIndex. The rows remain in
+            the builder, so that further rows may be added afterwards.
+        """
+
+        if self.bufferedRowCount() > 0:
+            self.chunks.append(self.buildChunk())
+
+        if len(self.chunks) == 0:
+            return self.buildChunk()
+
+        if len(self.chunks) > 1:
+            self.chunks = [pd.concat(self.chunks, ignore_index=True)]
+
+        return self.chunks[0]
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # clear Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def clear(self):
+
+        """
+        Method:
+
+            void clear()
+
+        Description:
+            Discards every row held by the builder.
+        """
+
+        self.buffers = [[] for colName in self.columnNames]
+        self.chunks = []
+        self.rowCount = 0
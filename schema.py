@@ -0,0 +1,247 @@
+"""
+Description:
+    Declares the parsing schema of every input file consumed by the Substituter. A schema lists the columns to be loaded, the dtype of
+    each column and the columns that are to be stored as categoricals, so that pandas does not have to infer anything while parsing.
+"""
+
+# Integer widths of the identifier columns
+productIDType = 'int64'
+commodityIDType = 'int32'
+outletIDType = 'int32'
+siteIDType = 'int32'
+periodIDType = 'int16'
+statusIDType = 'int8'
+tpoIDType = 'int64'
+
+#==========================================================================================================================================
+# Schema Class
+#==========================================================================================================================================
+class Schema:
+
+    """
+    Class:     Schema
+
+    Description:
+        Describes how a single kind of input file is to be parsed.
+
+    Instance Variables:
+        string name:
+            Name of the input kind; e.g. 'sales'.
+        dict<string, string> dtypes:
+            Declared dtype of each known column.
+            Key: column name
+            Value: dtype
+        list<string> usecols:
+            Obligatory columns to be loaded. If None, every column of the file is loaded.
+        list<string> optionalCols:
+            Columns that are loaded if, and only if, they are present in the file.
+        list<string> categoricals:
+            Columns that are stored as pandas categoricals.
+        type defaultDType:
+            Dtype of every loaded column that is not declared in dtypes. If None, the dtype of such columns is inferred.
+        list<string> nullableCols:
+            Integer columns that may contain missing values. They are parsed as float64, as pandas infers for integers with missing
+            values, and only converted to their declared dtype by narrowColumns if no value is missing.
+    """
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # Constructor
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def __init__(self,
+                 name: str,
+                 dtypes: dict,
+                 usecols: list = None,
+                 optionalCols: list = None,
+                 categoricals: list = None,
+                 defaultDType = None,
+                 nullableCols: list = None):
+
+        """
+        Constructor:
+
+            Schema
+            (
+                string name,
+                dict<string, string> dtypes,
+                list<string> usecols,
+                list<string> optionalCols,
+                list<string> categoricals,
+                type defaultDType,
+                list<string> nullableCols
+            )
+
+        Description:
+            Constructs a Schema object.
+        """
+
+        self.name = name
+        self.dtypes = dict(dtypes)
+        self.usecols = None if usecols is None else list(usecols)
+        self.optionalCols = [] if optionalCols is None else list(optionalCols)
+        self.categoricals = [] if categoricals is None else list(categoricals)
+        self.defaultDType = defaultDType
+        self.nullableCols = [] if nullableCols is None else list(nullableCols)
+
+        for colName in self.categoricals:
+            self.dtypes[colName] = 'category'
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # resolveColumns Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def resolveColumns(self, header: list) -> list:
+
+        """
+        Method:
+
+            list<string> resolveColumns
+            (
+                list<string> header
+            )
+
+        Description:
+            Returns the columns of the given header that are to be loaded, in the order in which they appear in the header.
+
+        Arguments:
+            list<string> header:
+                Column names of the file, as they appear in its header.
+
+        Output:
+            list<string>
+        """
+
+        if self.usecols is None:
+            return list(header)
+
+        missing = [colName for colName in self.usecols if colName not in header]
+        if len(missing) > 0:
+            raise ValueError("Error: The '" + self.name + "' input is missing the following columns: " + ', '.join(missing))
+
+        keep = set(self.usecols) | set(self.optionalCols)
+        return [colName for colName in header if colName in keep]
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # dtypeMap Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def dtypeMap(self, columns: list) -> dict:
+
+        """
+        Method:
+
+            dict<string, T> dtypeMap
+            (
+                list<string> columns
+            )
+
+        Description:
+            Returns the dtype with which each of the given columns is parsed. Undeclared columns are mapped to defaultDType, or omitted if
+            defaultDType is None. Nullable columns are mapped to float64; see narrowColumns.
+
+        Arguments:
+            list<string> columns:
+                Names of the columns to be loaded.
+
+        Output:
+            dict<string, T>
+        """
+
+        dtypes = {}
+        for colName in columns:
+            if colName in self.nullableCols:
+                dtypes[colName] = 'float64'
+            elif colName in self.dtypes:
+                dtypes[colName] = self.dtypes[colName]
+            elif self.defaultDType is not None:
+                dtypes[colName] = self.defaultDType
+        return dtypes
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # narrowColumns Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def narrowColumns(self, df):
+
+        """
+        Method:
+
+            DataFrame narrowColumns
+            (
+                DataFrame df
+            )
+
+        Description:
+            Converts every nullable column of a parsed DataFrame to its declared integer dtype, in place, unless it contains missing
+            values, in which case it is left as float64. Returns the DataFrame.
+        """
+
+        for colName in self.nullableCols:
+            if colName in df.columns and not df[colName].isnull().any():
+                df[colName] = df[colName].astype(self.dtypes[colName])
+        return df
+
+#------------------------------------------------------------------------------------------------------------------------------------------
+# Schema Registry
+#------------------------------------------------------------------------------------------------------------------------------------------
+schemas = {
+
+    # aggregatedSales_<period>.csv
+    'sales': Schema('sales',
+                    dtypes = {'ProductID': productIDType,
+                              'SiteID': siteIDType,
+                              'PeriodID': periodIDType,
+                              'QtyUnits': 'float64',
+                              'Sales': 'float64'},
+                    usecols = ['ProductID', 'SiteID', 'PeriodID', 'QtyUnits', 'Sales'],
+                    nullableCols = ['SiteID']),
+
+    # outlets_<period>.csv
+    'outlets': Schema('outlets',
+                      dtypes = {'OutletID': outletIDType,
+                                'SiteID': siteIDType},
+                      usecols = ['OutletID', 'SiteID', 'Province', 'City'],
+                      categoricals = ['Province', 'City'],
+                      nullableCols = ['OutletID', 'SiteID']),
+
+    # productDescriptions.csv
+    # Every column other than the identifiers is a text feature of the product, and is therefore loaded as a string.
+    'descriptions': Schema('descriptions',
+                           dtypes = {'ProductID': productIDType,
+                                     'CommodityID': commodityIDType},
+                           categoricals = ['StdUOM', 'BrandType'],
+                           defaultDType = str,
+                           nullableCols = ['CommodityID']),
+
+    # tpos_<status>_<period>.csv
+    # The product ID is left undeclared, since it is empty for uninitialized TPOs.
+    'tpos': Schema('tpos',
+                   dtypes = {'TPO_ID': tpoIDType,
+                             'OutletID': outletIDType,
+                             'PeriodID': periodIDType,
+                             'StatusID': statusIDType},
+                   usecols = ['TPO_ID', 'RPName', 'OutletID', 'PeriodID', 'StatusID', 'ProductID'],
+                   optionalCols = ['CommodityID', 'City', 'Province'],
+                   categoricals = ['RPName', 'City', 'Province'])
+}
+
+#------------------------------------------------------------------------------------------------------------------------------------------
+# getSchema Method
+#------------------------------------------------------------------------------------------------------------------------------------------
+def getSchema(key: str) -> Schema:
+
+    """
+    Method:
+
+        Schema getSchema
+        (
+            string key
+        )
+
+    Description:
+        Returns the registered schema of the given input kind.
+
+    Arguments
+        string key: = 'sales' or 'outlets' or 'descriptions' or 'tpos'
+            Name of the input kind.
+    """
+
+    if key not in schemas:
+        raise KeyError("Error: No schema is registered under '" + str(key) + "'. Registered schemas: " + ', '.join(schemas))
+    return schemas[key]
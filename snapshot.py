@@ -0,0 +1,392 @@
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+import writer as wr
+
+"""
+Description:
+    Stores prepared DataFrames as a directory of .npy arrays that can be reopened via memory mapping. Numeric columns are stored as-is,
+    and string columns are stored as categorical codes plus a table of unique UTF-8 strings. Since the arrays are mapped read-only,
+    several processes that open the same snapshot share the pages of the numeric columns and of the codes. The tables of unique strings
+    are decoded into Python strings, as pandas requires for the categories, and are therefore held by every process; their size is
+    that of the unique values of a column rather than of its rows.
+
+    The manifest of a snapshot records the size, modification time and hash of every input file from which the tables were prepared.
+    A snapshot is only reopened if all of them are unchanged.
+"""
+
+formatVersion = 1
+manifestFileName = 'manifest.json'
+
+#------------------------------------------------------------------------------------------------------------------------------------------
+# fingerprint Method
+#------------------------------------------------------------------------------------------------------------------------------------------
+def fingerprint(filePath: str, hashFile: bool = True) -> dict:
+
+    """
+    Method:
+
+        dict<string, T> fingerprint
+        (
+            string filePath,
+            bool hashFile
+        )
+
+    Description:
+        Returns the size, the modification time and, if hashFile is True, the BLAKE2 hash of the contents of a file.
+
+    Arguments
+        string filePath:
+            Location of the file.
+        bool hashFile:
+            True if the contents of the file are to be hashed.
+    """
+
+    stat = os.stat(filePath)
+    result = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'hash': None}
+
+    if hashFile:
+        digest = hashlib.blake2b(digest_size=20)
+        with open(filePath, 'rb') as file:
+            for block in iter(lambda: file.read(2**24), b''):
+                digest.update(block)
+        result['hash'] = digest.hexdigest()
+
+    return result
+
+#------------------------------------------------------------------------------------------------------------------------------------------
+# fingerprintFiles Method
+#------------------------------------------------------------------------------------------------------------------------------------------
+def fingerprintFiles(filePaths: list) -> dict:
+
+    """
+    Method:
+
+        dict<string, dict> fingerprintFiles
+        (
+            list<string> filePaths
+        )
+
+    Description:
+        Returns the fingerprint of every file, keyed by its absolute path; see fingerprint. The input files of a snapshot must be
+        fingerprinted before they are read, so that a file that changes while the tables are prepared invalidates the snapshot rather
+        than being recorded with the tables prepared from its previous contents.
+    """
+
+    return {os.path.abspath(filePath): fingerprint(filePath) for filePath in filePaths}
+
+#------------------------------------------------------------------------------------------------------------------------------------------
+# replaceDirectory Method
+#------------------------------------------------------------------------------------------------------------------------------------------
+def replaceDirectory(tempPath: str, directory: str):
+
+    """
+    Method:
+
+        void replaceDirectory
+        (
+            string tempPath,
+            string directory
+        )
+
+    Description:
+        Renames the directory at tempPath to directory, replacing any existing directory. The existing directory is renamed aside to
+        <directory>.old first and only deleted once the new one is in place, so that a crash in between leaves it to be restored by
+        restoreDirectory rather than leaving no directory at all.
+    """
+
+    directory = directory.rstrip('/\\')
+    oldPath = directory + '.old'
+
+    if os.path.exists(oldPath):
+        shutil.rmtree(oldPath)
+    if os.path.exists(directory):
+        os.replace(directory, oldPath)
+    os.replace(tempPath, directory)
+    wr.syncDirectory(os.path.dirname(os.path.abspath(directory)))
+
+    if os.path.exists(oldPath):
+        shutil.rmtree(oldPath)
+
+#------------------------------------------------------------------------------------------------------------------------------------------
+# restoreDirectory Method
+#------------------------------------------------------------------------------------------------------------------------------------------
+def restoreDirectory(directory: str):
+
+    """
+    Method:
+
+        void restoreDirectory
+        (
+            string directory
+        )
+
+    Description:
+        Restores the previous version of a directory that replaceDirectory renamed aside, if it was interrupted before the new version
+        was in place.
+    """
+
+    directory = directory.rstrip('/\\')
+    oldPath = directory + '.old'
+
+    if not os.path.exists(directory) and os.path.exists(oldPath):
+        os.replace(oldPath, directory)
+
+#------------------------------------------------------------------------------------------------------------------------------------------
+# writeStrings Method
+#------------------------------------------------------------------------------------------------------------------------------------------
+def writeStrings(filePrefix: str, strings: list):
+
+    """
+    Method:
+
+        void writeStrings
+        (
+            string filePrefix,
+            list<string> strings
+        )
+
+    Description:
+        Stores a list of strings as a UTF-8 byte buffer (<filePrefix>.bytes.npy) and an offset table (<filePrefix>.offsets.npy).
+    """
+
+    encoded = [string.encode('utf-8') for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype='int64')
+    offsets[1:] = np.cumsum([len(token) for token in encoded], dtype='int64')
+
+    np.save(filePrefix + '.bytes.npy', np.frombuffer(b''.join(encoded), dtype='uint8'))
+    np.save(filePrefix + '.offsets.npy', offsets)
+
+#------------------------------------------------------------------------------------------------------------------------------------------
+# readStrings Method
+#------------------------------------------------------------------------------------------------------------------------------------------
+def readStrings(filePrefix: str) -> list:
+
+    """
+    Method:
+
+        list<string> readStrings
+        (
+            string filePrefix
+        )
+
+    Description:
+        Reads a list of strings stored by writeStrings. Every string is decoded directly from the memory-mapped byte buffer, which is
+        never copied as a whole.
+    """
+
+    buffer = memoryview(np.load(filePrefix + '.bytes.npy', mmap_mode='r'))
+    offsets = np.load(filePrefix + '.offsets.npy').tolist()
+    return [str(buffer[offsets[i]:offsets[i + 1]], 'utf-8') for i in range(0, len(offsets) - 1)]
+
+#------------------------------------------------------------------------------------------------------------------------------------------
+# writeTable Method
+#------------------------------------------------------------------------------------------------------------------------------------------
+def writeTable(directory: str, name: str, df: pd.DataFrame) -> dict:
+
+    """
+    Method:
+
+        dict writeTable
+        (
+            string directory,
+            string name,
+            DataFrame df
+        )
+
+    Description:
+        Stores every column of a DataFrame in the given directory and returns the description of the table to be kept in the manifest.
+        Numeric and boolean columns are stored as they are. All other columns are stored as categoricals of strings; missing values are
+        preserved.
+    """
+
+    columns = []
+    for i, colName in enumerate(df.columns):
+
+        series = df.iloc[:, i]
+        filePrefix = name + '_' + str(i)
+
+        isCategorical = isinstance(series.dtype, pd.CategoricalDtype)
+        
+        # Case 1: Numeric column
+        if not isCategorical and (pd.api.types.is_numeric_dtype(series.dtype) or pd.api.types.is_bool_dtype(series.dtype)):
+            np.save(os.path.join(directory, filePrefix + '.npy'), series.to_numpy())
+            columns.append({'name': colName, 'kind': 'numeric', 'file': filePrefix})
+
+        # Case 2: Categorical or string column
+        else:
+            if not isCategorical:
+                series = series.where(series.isnull(), series.astype(str)).astype('category')
+            categories = [str(category) for category in series.cat.categories]
+            np.save(os.path.join(directory, filePrefix + '.codes.npy'), series.cat.codes.to_numpy())
+            writeStrings(os.path.join(directory, filePrefix + '.categories'), categories)
+            columns.append({'name': colName, 'kind': 'categorical', 'file': filePrefix, 'ordered': bool(series.cat.ordered)})
+
+    return {'rows': len(df), 'columns': columns}
+
+#------------------------------------------------------------------------------------------------------------------------------------------
+# readTable Method
+#------------------------------------------------------------------------------------------------------------------------------------------
+def readTable(directory: str, table: dict) -> pd.DataFrame:
+
+    """
+    Method:
+
+        DataFrame readTable
+        (
+            string directory,
+            dict table
+        )
+
+    Description:
+        Reopens a table stored by writeTable. Numeric columns and categorical codes are memory-mapped read-only and are not copied.
+    """
+
+    data = {}
+    for column in table['columns']:
+        filePrefix = os.path.join(directory, column['file'])
+        if column['kind'] == 'numeric':
+            data[column['name']] = np.load(filePrefix + '.npy', mmap_mode='r')
+        else:
+            codes = np.load(filePrefix + '.codes.npy', mmap_mode='r')
+            categories = readStrings(filePrefix + '.categories')
+            data[column['name']] = pd.Categorical.from_codes(codes, categories, ordered=column['ordered'])
+
+    return pd.DataFrame(data, copy=False)
+
+#------------------------------------------------------------------------------------------------------------------------------------------
+# save Method
+#------------------------------------------------------------------------------------------------------------------------------------------
+def save(snapshotPath: str, tables: dict, inputFingerprints: dict):
+
+    """
+    Method:
+
+        void save
+        (
+            string snapshotPath,
+            dict<string, DataFrame> tables,
+            dict<string, dict> inputFingerprints
+        )
+
+    Description:
+        Writes a snapshot of the given tables to the directory given by snapshotPath, replacing any existing snapshot. The snapshot is
+        written to a temporary directory first, so that an interrupted write never leaves a partial snapshot behind, and then swapped
+        in by replaceDirectory.
+
+    Arguments
+        string snapshotPath:
+            Directory of the snapshot.
+        dict<string, DataFrame> tables:
+            Tables to be stored.
+            Key: name of the table
+            Value: DataFrame
+        dict<string, dict> inputFingerprints:
+            Fingerprints of the files from which the tables were prepared, taken by fingerprintFiles before they were read.
+    """
+
+    print("\nWriting snapshot: \n'" + snapshotPath + "' ...")
+
+    tempPath = snapshotPath.rstrip('/\\') + '.tmp'
+    if os.path.exists(tempPath):
+        shutil.rmtree(tempPath)
+    os.makedirs(tempPath)
+
+    manifest = {'version': formatVersion, 'inputs': dict(inputFingerprints), 'tables': {}}
+    for name, df in tables.items():
+        manifest['tables'][name] = writeTable(tempPath, name, df)
+
+    with open(os.path.join(tempPath, manifestFileName), 'w') as file:
+        json.dump(manifest, file, indent=1)
+
+    replaceDirectory(tempPath, snapshotPath)
+
+#------------------------------------------------------------------------------------------------------------------------------------------
+# isValid Method
+#------------------------------------------------------------------------------------------------------------------------------------------
+def isValid(snapshotPath: str, inputFilePaths: list, verifyHash: bool = True, inputFingerprints: dict = None) -> bool:
+
+    """
+    Method:
+
+        bool isValid
+        (
+            string snapshotPath,
+            list<string> inputFilePaths,
+            bool verifyHash,
+            dict<string, dict> inputFingerprints
+        )
+
+    Description:
+        Returns True if a snapshot exists at snapshotPath and was prepared from exactly the given input files, none of which have changed
+        in size, modification time or, if verifyHash is True, contents. The sizes and modification times are compared first, so that
+        the contents of a file are only hashed if they match. If inputFingerprints is given (see fingerprintFiles), the input files are
+        compared by those fingerprints instead of being fingerprinted again.
+    """
+
+    restoreDirectory(snapshotPath)
+
+    manifestPath = os.path.join(snapshotPath, manifestFileName)
+    if not os.path.exists(manifestPath):
+        return False
+
+    with open(manifestPath) as file:
+        manifest = json.load(file)
+
+    if manifest.get('version') != formatVersion:
+        return False
+
+    inputs = manifest['inputs']
+    if set(inputs) != set(os.path.abspath(filePath) for filePath in inputFilePaths):
+        return False
+
+    for filePath, recorded in inputs.items():
+        current = None if inputFingerprints is None else inputFingerprints.get(filePath)
+        if current is None:
+            if not os.path.exists(filePath):
+                return False
+            current = fingerprint(filePath, hashFile=False)
+        if current['size'] != recorded['size'] or current['mtime'] != recorded['mtime']:
+            return False
+        if verifyHash and (current['hash'] or fingerprint(filePath)['hash']) != recorded['hash']:
+            return False
+
+    return True
+
+#------------------------------------------------------------------------------------------------------------------------------------------
+# load Method
+#------------------------------------------------------------------------------------------------------------------------------------------
+def load(snapshotPath: str, inputFilePaths: list, verifyHash: bool = True, inputFingerprints: dict = None) -> dict:
+
+    """
+    Method:
+
+        dict<string, DataFrame> load
+        (
+            string snapshotPath,
+            list<string> inputFilePaths,
+            bool verifyHash,
+            dict<string, dict> inputFingerprints
+        )
+
+    Description:
+        Reopens the tables of a snapshot via memory mapping. Returns None if the snapshot does not exist or is stale; see isValid.
+    """
+
+    if not isValid(snapshotPath, inputFilePaths, verifyHash, inputFingerprints):
+        print("\nSnapshot is missing or out of date: \n'" + snapshotPath + "'")
+        return None
+
+    print("\nOpening snapshot: \n'" + snapshotPath + "'")
+
+    with open(os.path.join(snapshotPath, manifestFileName)) as file:
+        manifest = json.load(file)
+
+    tables = {}
+    for name, table in manifest['tables'].items():
+        tables[name] = readTable(snapshotPath, table)
+    return tables
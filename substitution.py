@@ -2,16 +2,23 @@
 import numpy as np
 import pandas as pd
 import pdb
+import time
 
 ### Import project files ###
 import dataset as ds
+import assignment as asg
+import catalog as cat
 import cluster as clu
 import commodity as com
 import geography as geo
 import homogeneity as hom
+import resultbuilder as rb
 import sampling as sam
+import snapshot as snap
 import targetproductoffer as tpro
 import timer as tim
+import vectorstore as vs
+import writer as wr
 
 #==========================================================================================================================================
 # Substituter Class
@@ -32,13 +39,42 @@ class Substituter():
             the retailer hierarchy and the unit of measure.
         DataFrame outletData:
             Describes all outlets within the sample at each period.
+        ProductCatalog productCatalog:
+            Index of productDescData by product ID; see catalog.py.
+        DescriptionMatrix descriptionMatrix:
+            Term counts of every product description, tokenized once; None unless substitute was given an idfScope. See homogeneity.py.
+        VectorStore vectorStore:
+            Persistent store of the term counts of the product descriptions, as given to substitute; None otherwise. See vectorstore.py.
+        int approximateClusterSize, hashTableCount, hashBitCount:
+            Settings of the approximate distance search, as given to substitute.
+        DescriptionCache descriptionCache:
+            Normalized and tokenized product descriptions, shared by every cluster; None if the cache is disabled. See homogeneity.py.
+        ndarray salesOrder:
+            Positions of the rows of productData, stably sorted by commodity class ID and outlet ID.
+        dict<tuple<int, int>, tuple<int, int>> salesIndex:
+            Partition of productData by commodity class and outlet.
+                Key := (commodity class ID, outlet ID)
+                Value := (start, stop) of the rows of the partition within salesOrder
+        dict<tuple<string, string, int>, list<int>> geographyIndex:
+            Outlets of each geographic class at the level given by geographyIndexKey.
+                Key := (province, city, outlet ID), where the levels below geographyIndexKey are empty strings
+                Value := list of outlet IDs, in the order of outletData
+        string geographyIndexKey:
+            Geographic level of geographyIndex; see buildClusterList.
         DataFrame tpoMatchedData:
-            Contains a dataframe where each row corresponds to a previously-unassigned TPO that was assigned a substitute product. This 
-            dataframe serves as the output of the algorithm and is converted into a .csv file at the end.
-        DataFrame suggestionsData:
-            Contains all possible candidates for each substituted TPO.
+            Contains a dataframe where each row corresponds to a previously-unassigned TPO that was assigned a substitute product. It is 
+            only materialized, once every TPO has been processed, if substitute is not given a matched TPO file; otherwise the rows are 
+            streamed to the file by tpoMatchedResults rather than held in memory, and tpoMatchedData is None.
+        AsyncWriter suggestionsWriter:
+            Streams all possible candidates for each substituted TPO to the suggestions file; see writer.py. The candidates are flushed
+            once per commodity class, so that they are never held in memory as a whole, and are written on a background thread.
         DataFrame summary:
             Contains various summary statistics.
+        ResultBuilder tpoMatchedResults:
+            Accumulates the rows of tpoMatchedData while TPOs are being substituted, and passes them to the matched TPO file once per 
+            commodity class; see resultbuilder.py.
+        ResultBuilder summaryResults:
+            Accumulates the rows of summary; one row per call to substitute.
         dict<int, Commodity> comMap:
             A map of Commodity objects.
                 Key := commodity class ID
@@ -47,6 +83,8 @@ class Substituter():
             A map of TargetProductOffer objects.
                 Key := TPO ID
                 Value := TargetProductOffer object
+        AssignmentRegistry assignments:
+            Assigned products of every commodity class, by period and outlet; kept up to date by the TPOs; see assignment.py.
         int unclassifiedCount:
             Number of TPOs with previous product IDs that are unclassified.
     """
@@ -54,7 +92,11 @@ class Substituter():
     #--------------------------------------------------------------------------------------------------------------------------------------
     # Constructor
     #--------------------------------------------------------------------------------------------------------------------------------------
-    def __init__(self, productDescData: pd.DataFrame, productSalesDataSets: dict = None, outletDataSets: dict = None):
+    def __init__(self, 
+                 productDescData: pd.DataFrame, 
+                 productSalesDataSets: dict = None, 
+                 outletDataSets: dict = None, 
+                 descriptionCacheBytes: int = 256 * 2**20):
         
         """
         Constructor:
@@ -72,6 +114,9 @@ class Substituter():
                  A pandas DataFrame describing each unique product. The following columns are obligatory:
                      'ProductID': Unique integer identifier of a product.
                      'CommodityID': Unique integer identifier of a commodity class; i.e. the EA column in UATfalk.Loblaws_fct_UniqueProdDesc. 
+            int descriptionCacheBytes:
+                Memory above which the least recently used descriptions are evicted from the description cache. If None, descriptions
+                are not cached across clusters.
         """
         
         print('\n\nInitializing substituter ...')
@@ -92,21 +137,43 @@ class Substituter():
         self.salesKey = 'Sales'
         self.unitCountKey = 'QtyUnits'
         
+        # Filter sets of a cluster, in the order in which assignTPO creates them
+        self.filterSetNames = ['CURRENT', 'OUTLET', 'RELAUNCH', 'TOP_SELLERS', 'SIMILAR', 'DISTANCE']
+        
         # Instance Variables
         
         self.unclassifiedCount = 0
         
         self.comMap = {}
         self.tpoMap = {}        
+        self.assignments = asg.AssignmentRegistry()
         
         self.productData = None
         self.productDescData = productDescData
         self.outletData = None
+        self.salesOrder = None
+        self.salesIndex = None
+        self.geographyIndex = None
+        self.geographyIndexKey = None
         self.tpoMatchedData = None
-        self.suggestionsData = None
-        self.summary = ds.fromDict([self.periodIDKey, 'Commodity Count', 'Cluster Count', 'Outlet Count', 'TPO Count', 'Assigned Count', 'Unclassified Count', 'Fraction Assigned', 'Average Similarity', 'Brand Matching'])
+        self.suggestionsWriter = None
+        self.tpoMatchedResults = None
+        self.summaryResults = rb.ResultBuilder([self.periodIDKey, 'Commodity Count', 'Cluster Count', 'Outlet Count', 'TPO Count', 'Assigned Count', 'Unclassified Count', 'Fraction Assigned', 'Average Similarity', 'Brand Matching'])
+        self.summary = self.summaryResults.toDataFrame()
+        
+        # Type the description columns, unless they were already typed while being parsed
+        self.productDescData = ds.applySchema(self.productDescData, 'descriptions')
         
-        self.productDescData = ds.convertAllColumns(self.productDescData, str, exclude=[self.productIDKey, self.commodityIDKey])
+        # Index the product descriptions by product ID
+        self.productCatalog = cat.ProductCatalog(self.productDescData, self.productIDKey, self.commodityIDKey, self.uomKey, self.brandTypeKey)
+        self.descriptionMatrix = None
+        self.vectorStore = None
+        self.approximateClusterSize = None
+        self.hashTableCount = 16
+        self.hashBitCount = 8
+        
+        # Cache the normalized and tokenized descriptions of the products across clusters
+        self.descriptionCache = None if descriptionCacheBytes is None else hom.DescriptionCache(descriptionCacheBytes)
         
         if productSalesDataSets is not None and outletDataSets is not None:
             self.assignSample(productSalesDataSets, outletDataSets)
@@ -140,6 +207,8 @@ class Substituter():
                      'PeriodID': Unique integer identifier that denotes the period (i.e. month) of the sales.
                      'QtyUnits': Floating point value describing the number of units sold over the course of the period.
                      'Sales': Floating point value describing the amount of revenue that was collected over the course of the period.
+                 DataFrames produced by ds.aggregateSales carry an 'OutletID' column in place of 'SiteID', and are not joined to the outlets 
+                 again.
             dict<int, DataFrame> outletsDataSets
                  A dictionary of DataFrame objects describing the outlets within the sample over a given time frame. The following columns 
                  are obligatory:
@@ -150,52 +219,194 @@ class Substituter():
         periodIDs = list(outletDataSets.keys())
         b = periodIDs[0]
         
-        self.outletData = outletDataSets[b]
-        self.outletData = self.outletData.rename(columns={self.retailerSiteIDKey:self.retailerSiteIDKey + '_' + str(b)})
+        # Union of the outlets of every period
+        #----------------------------------------------------------------------------------------------------------------------------------
+        # The outlets of the first period keep all of their columns. The site IDs of every other period are pivoted into a single
+        # SiteID_<period> column per period, and joined in one outer merge.
+        self.outletData = outletDataSets[b].rename(columns={self.retailerSiteIDKey:self.retailerSiteIDKey + '_' + str(b)})
+        
+        if len(periodIDs) > 1:
+            siteIDs = pd.concat([outletDataSets[i][[self.outletIDKey, self.retailerSiteIDKey]].assign(**{self.periodIDKey: i}) for i in periodIDs[1:]], 
+                                ignore_index=True)
+            siteIDs = siteIDs.drop_duplicates(subset=[self.outletIDKey, self.periodIDKey])
+            outletOrder = siteIDs[self.outletIDKey].unique()
+            siteIDs = siteIDs.pivot(index=self.outletIDKey, columns=self.periodIDKey, values=self.retailerSiteIDKey)
+            
+            # Outlets that are new to the union keep the order in which they first appear, as with successive outer merges
+            siteIDs = siteIDs.reindex(index=outletOrder, columns=periodIDs[1:])
+            siteIDs.columns = [self.retailerSiteIDKey + '_' + str(i) for i in periodIDs[1:]]
+            self.outletData = self.outletData.merge(siteIDs.reset_index(), how='outer', on=self.outletIDKey)
+        
+        # Sales of every period
+        #----------------------------------------------------------------------------------------------------------------------------------
+        salesDFs = []
+        for periodID in salesDataSets:
+            
+            # Sales that were pre-aggregated by outlet (see ds.aggregateSales) are already mapped to outlet IDs
+            salesDF = salesDataSets[periodID]
+            if self.outletIDKey not in salesDF.columns:
+                salesDF = salesDF.merge(outletDataSets[periodID][[self.outletIDKey, self.retailerSiteIDKey]], how='left', on=self.retailerSiteIDKey)
+            salesDFs.append(salesDF)
+        
+        self.productData = pd.concat(salesDFs, ignore_index=True)
         
-        for i in outletDataSets:
-            if i != b:                
-                union = self.outletData.merge(outletDataSets[i][[self.outletIDKey, self.retailerSiteIDKey]], how='outer', on=self.outletIDKey)
-                self.outletData = union.rename(columns={self.retailerSiteIDKey:self.retailerSiteIDKey + '_' + str(i)})
+        # Product descriptions
+        #----------------------------------------------------------------------------------------------------------------------------------
+        descriptions = self.productDescData[[self.productIDKey, self.commodityIDKey, self.uomKey, self.brandTypeKey]].copy()
+        descriptions['Desc'] = ds.concatenateColumns(self.productDescData, ' ', [self.productIDKey, self.commodityIDKey])
+        self.productData = self.productData.merge(descriptions, how='left', on=self.productIDKey)
+        
+        self.geographyIndex = None
+        self.indexSales()
+    
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # saveSnapshot Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def saveSnapshot(self, snapshotPath: str, inputFingerprints: dict):
         
-        for i, periodID in enumerate(salesDataSets):
+        """
+        Method:
             
-            salesDF = salesDataSets[periodID].merge(outletDataSets[periodID][[self.outletIDKey, self.retailerSiteIDKey]], how='left', on=self.retailerSiteIDKey)
+            void saveSnapshot
+            ( 
+                string snapshotPath,
+                dict<string, dict> inputFingerprints
+            )
+        
+        Description:
+            Writes the prepared product and outlet DataFrames to a memory-mappable snapshot; see snapshot.py. The sample must already have 
+            been assigned.
+        
+        Arguments:
+            string snapshotPath:
+                Directory of the snapshot.
+            dict<string, dict> inputFingerprints:
+                Fingerprints of every sales, outlet and product description file from which the sample was prepared, taken by 
+                snapshot.fingerprintFiles before any of them was read. The snapshot is invalidated as soon as any of them changes.
+        """
+        
+        if self.productData is None or self.outletData is None:
+            raise ValueError("Error: The sample has not been assigned.")
+        
+        snap.save(snapshotPath, {'product': self.productData.reset_index(drop=True), 'outlet': self.outletData}, inputFingerprints)
+    
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # loadSnapshot Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def loadSnapshot(self, snapshotPath: str, inputFilePaths: list, verifyHash: bool = True, inputFingerprints: dict = None) -> bool:
+        
+        """
+        Method:
             
-            if i == 0:
-                self.productData = salesDF
-            else:
-                self.productData = self.productData.append(salesDF)  
+            bool loadSnapshot
+            ( 
+                string snapshotPath,
+                list<string> inputFilePaths,
+                bool verifyHash,
+                dict<string, dict> inputFingerprints
+            )
         
-        descriptions = self.productDescData[[self.productIDKey, self.commodityIDKey, self.uomKey, self.brandTypeKey]]
-        features = self.productDescData.drop(columns = [self.productIDKey, self.commodityIDKey])
-        features = features.fillna('')
-        descriptions['Desc'] = features.iloc[:,:].apply(lambda x: ' '.join(x), axis=1)
-        self.productData = self.productData.merge(descriptions, how='left', on=self.productIDKey)
+        Description:
+            Assigns the product and outlet DataFrames from a snapshot written by saveSnapshot, in place of assignSample. The columns of 
+            the snapshot are memory-mapped, so that Substituters in several processes share the same pages.
+        
+        Arguments:
+            string snapshotPath:
+                Directory of the snapshot.
+            list<string> inputFilePaths:
+                Locations of every sales, outlet and product description file from which the sample is to be prepared.
+            bool verifyHash:
+                True if the contents of the input files are to be hashed and compared with the snapshot, in addition to their sizes and 
+                modification times.
+            dict<string, dict> inputFingerprints:
+                Fingerprints of the input files taken by snapshot.fingerprintFiles, if any; the files are then compared by these 
+                fingerprints rather than read again. The same fingerprints are to be passed to saveSnapshot if the snapshot is stale.
+                
+        Output:
+            True if the snapshot was loaded
+            False if the snapshot is missing or out of date, in which case assignSample must be called
+        """
+        
+        tables = snap.load(snapshotPath, inputFilePaths, verifyHash, inputFingerprints)
+        if tables is None:
+            return False
+        
+        self.productData = tables['product']
+        self.outletData = tables['outlet']
+        self.geographyIndex = None
+        self.indexSales()
+        return True
+    
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # indexSales Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def indexSales(self):
+        
+        """
+        Method:
+            
+            void indexSales()
+        
+        Description:
+            Partitions the rows of productData by commodity class and outlet, so that populateCluster only visits the rows of the 
+            outlets of a cluster. The rows are stably sorted by (CommodityID, OutletID), which keeps them in their original order within 
+            each partition. Rows without a commodity class or an outlet are left out, as they never belong to a cluster.
+        """
+        
+        comIDs = self.productData[self.commodityIDKey].to_numpy()
+        outletIDs = self.productData[self.outletIDKey].to_numpy()
+        
+        valid = np.flatnonzero(pd.notnull(comIDs) & pd.notnull(outletIDs))
+        order = valid[np.lexsort((outletIDs[valid], comIDs[valid]))]
+        sortedComIDs = comIDs[order]
+        sortedOutletIDs = outletIDs[order]
+        
+        # Boundaries of the partitions within the sorted rows
+        boundaries = np.flatnonzero((sortedComIDs[1:] != sortedComIDs[:-1]) | (sortedOutletIDs[1:] != sortedOutletIDs[:-1])) + 1
+        starts = np.concatenate([[0], boundaries]) if len(order) > 0 else np.array([], dtype='int64')
+        stops = np.concatenate([boundaries, [len(order)]]) if len(order) > 0 else np.array([], dtype='int64')
+        
+        keys = zip(sortedComIDs[starts].tolist(), sortedOutletIDs[starts].tolist())
+        self.salesOrder = order
+        self.salesIndex = dict(zip(keys, zip(starts.tolist(), stops.tolist())))
     
     #--------------------------------------------------------------------------------------------------------------------------------------
     # assignSalesDataSet Method
     #--------------------------------------------------------------------------------------------------------------------------------------
-    def initOutput(self):
+    def initOutput(self, sink = None):
         
         """
         Method:
             
-            void initOutput()
+            void initOutput
+            (
+                function sink
+            )
         
         Description:
-            Initializes the tpoMatchedData dataframe.
+            Initializes the tpoMatchedData dataframe. Its rows are accumulated in tpoMatchedResults and passed to the sink whenever 
+            tpoMatchedResults is flushed, or kept in tpoMatchedResults if sink is None. The dtypes of the columns are fixed, so that every 
+            chunk is written with the same types.
         """
         
-        self.tpoMatchedData = ds.fromDict([self.commodityIDKey,
+        self.tpoMatchedResults = rb.ResultBuilder([self.commodityIDKey,
                                            self.tpoIDKey, self.rpNameKey, self.outletIDKey,
                                            'Prev' + self.productIDKey, 'PrevDesc', 'Prev' + self.brandTypeKey,
                                            self.productIDKey, 'Desc', self.brandTypeKey,
                                            'ClusterTotal', 'CurrentTotal', 'OutletTotal',
                                            'SoldAtSite', 'InCommodity', 'NormQuantity', 'PriceHomoScore', 'Distance', 'WordSimilarity',
-                                           self.statusIDKey, 'Status'])
+                                           self.statusIDKey, 'Status'],
+                                           ['int64',
+                                            'int64', object, 'int64',
+                                            None, object, object,
+                                            None, object, object,
+                                            'int64', 'int64', 'int64',
+                                            bool, bool, 'float64', 'float64', 'float64', 'float64',
+                                            'int64', object],
+                                           sink=sink)
         
-        self.suggestionsData = None
+        self.tpoMatchedData = None
+        self.suggestionsWriter = None
         
     #--------------------------------------------------------------------------------------------------------------------------------------
     # substitute Method
@@ -215,7 +426,14 @@ class Substituter():
                    details: bool = False,
                    suggestionsFilePath: str = 'C:\\suggestions.csv',
                    suggest: bool = True,
-                   summaryFilePath: str = 'C:\\summary.csv'):
+                   summaryFilePath: str = 'C:\\summary.csv',
+                   backgroundOutput: bool = True,
+                   idfScope: str = None,
+                   approximateClusterSize: int = None,
+                   hashTableCount: int = 16,
+                   hashBitCount: int = 8,
+                   hashFeatureCount: int = None,
+                   vectorStorePath: str = None):
         
         """  
         Method:     void substitute
@@ -234,7 +452,14 @@ class Substituter():
                         bool details,
                         string suggestionsFilePath,
                         bool suggest,
-                        string summaryFilePath
+                        string summaryFilePath,
+                        bool backgroundOutput,
+                        string idfScope,
+                        int approximateClusterSize,
+                        int hashTableCount,
+                        int hashBitCount,
+                        int hashFeatureCount,
+                        string vectorStorePath
                     )
         
         Description: 
@@ -274,166 +499,272 @@ class Substituter():
                     'proportional'
                     'top_proportional'
             string tpoMatchedFilePath:
-                Location at which the matched TPO file is created.
+                Location at which the matched TPO file is created. Its rows are written once per commodity class while the substitution 
+                continues; see writer.py. If None, no file is created, and the matched TPOs are instead materialized as tpoMatchedData 
+                once every TPO has been processed.
             bool details:
                 True if additional columns are to be populated in the tpoMatchedData file. False if only the TPO ID, the status ID,
                 and the newly-assigned product ID are to be displayed in the tpoMatchedData file.
             string suggestionsFilePath:
-                Location at which the suggestions file is created.
+                Location at which the suggestions file is created. The file may be a CSV file, a gzip-compressed CSV file (.csv.gz) or
+                a Parquet file; see writer.py.
             bool suggest:
                 True if a list of suggestions is to be generated for each substitution.
             string summaryFilePath:
                 Location at which the summary file is created.
+            bool backgroundOutput:
+                True if the output files are written on background threads while the substitution continues. Either way, every output 
+                file is written to a temporary file first and only renamed into place once it is complete. Output files may be 
+                compressed with gzip (.csv.gz) or zstd (.csv.zst), or written as Parquet files.
+            string idfScope: = None or 'cluster' or 'commodity' or 'corpus'
+                Documents over which the IDF of the description distances is computed. If None, a TF-IDF vectorizer is fitted to the
+                descriptions of every cluster. Otherwise, every product description is tokenized once into a DescriptionMatrix, from
+                which the clusters are sliced, and the IDF is computed over the products of each cluster ('cluster', which gives the
+                distances of None up to floating-point rounding), of each commodity class ('commodity') or of the whole catalog
+                ('corpus'); see homogeneity.py. Rounding may break ties between equally distant candidates differently.
+            int approximateClusterSize:
+                Number of products from which the distances of a cluster are searched approximately, by locality-sensitive hashing
+                (see homogeneity.ApproximateDistanceIndex). Only the candidates retrieved by the hash tables are assigned a distance; the
+                others are treated as beyond the nearest neighbours by the RELAUNCH and DISTANCE steps. If None, every cluster is
+                searched exhaustively.
+            int hashTableCount:
+                Number of hash tables of the approximate searches. More tables raise the recall of the nearest neighbours.
+            int hashBitCount:
+                Number of bits per hash table of the approximate searches. More bits retrieve fewer candidates, which is faster but
+                lowers the recall.
+            int hashFeatureCount:
+                If not None, the terms of the DescriptionMatrix are hashed into hashFeatureCount columns rather than looked up in a 
+                vocabulary (see homogeneity.DescriptionMatrix), and idfScope defaults to 'corpus', so that the IDF table is computed 
+                once. Hash collisions perturb the distances slightly; see benchmark.compareHashedDistances.
+            string vectorStorePath:
+                If not None, the term counts and the normalized text of the product descriptions are kept across runs in a vector store
+                in this directory (see vectorstore.py), so that only new or changed descriptions are tokenized, and idfScope defaults to
+                'corpus'. The store is updated once the DescriptionMatrix is built.
         """
         
-        # Setup the tpoMatchedData dataframe
-        self.initOutput()
+        self.approximateClusterSize = approximateClusterSize
+        self.hashTableCount = hashTableCount
+        self.hashBitCount = hashBitCount
         
-        # Build commodity and TPO maps
-        #----------------------------------------------------------------------------------------------------------------------------------
-        self.buildMaps(tpoData, currentPeriodID)
+        # Tokenize the product descriptions once, unless a vectorizer is fitted to every cluster
+        if idfScope is None and (hashFeatureCount is not None or vectorStorePath is not None):
+            idfScope = 'corpus'
         
-        # Iterate over commodity classes
-        #----------------------------------------------------------------------------------------------------------------------------------
-        comCounter = 0
-        cluCounter = 0
-        tpoCounter = 0
-        outletSet = set()
-        assignedCounter = 0
-        for comID, commodity in self.comMap.items():
+        if idfScope is None:
+            self.descriptionMatrix = None
+            self.vectorStore = None
+        elif (self.descriptionMatrix is None or self.descriptionMatrix.idfScope != idfScope or 
+              self.descriptionMatrix.featureCount != hashFeatureCount or
+              (None if self.vectorStore is None else self.vectorStore.storePath) != vectorStorePath):
             
-            if commodity.containsUnassignedTPOs(self.tpoMap, currentPeriodID):
+            # Only tokenize the descriptions that are not in the vector store yet, and keep the new ones for the next run
+            self.vectorStore = None if vectorStorePath is None else vs.VectorStore(vectorStorePath, hashFeatureCount)
+            self.descriptionMatrix = hom.DescriptionMatrix(self.productCatalog, idfScope, hashFeatureCount, self.vectorStore)
+            
+            if self.vectorStore is not None:
+                self.vectorStore.save()
+                storeStats = self.vectorStore.stats()
+                print("Vector Store: " + str(storeStats['reused']) + " descriptions reused, " + str(storeStats['vectorized']) + " vectorized")
+        
+        if self.descriptionCache is not None:
+            self.descriptionCache.vectorStore = self.vectorStore
+        
+        # Matched TPOs are streamed to their file once per commodity class, or kept in memory if no file is given
+        tpoMatchedWriter = None
+        writers = []
+        if tpoMatchedFilePath is not None:
+            tpoMatchedWriter = wr.AsyncWriter(tpoMatchedFilePath) if backgroundOutput else wr.TableWriter(tpoMatchedFilePath)
+            writers.append(tpoMatchedWriter)
+        
+        # Discard the temporary file of every output that is still open if the substitution fails
+        try:
+            if tpoMatchedWriter is None:
+                self.initOutput()
+            elif details == True:
+                self.initOutput(tpoMatchedWriter.write)
+            else:
+                self.initOutput(lambda chunk: tpoMatchedWriter.write(chunk[[self.tpoIDKey, self.productIDKey, self.statusIDKey]]))
+            
+            # Output the header alone if no TPO is matched
+            if tpoMatchedWriter is not None:
+                self.tpoMatchedResults.sink(self.tpoMatchedResults.toDataFrame())
+        
+            # Suggestions are streamed to their file as they are generated
+            if suggest:
+                self.suggestionsWriter = wr.AsyncWriter(suggestionsFilePath) if backgroundOutput else wr.TableWriter(suggestionsFilePath)
+                writers.append(self.suggestionsWriter)
+        
+            # Build commodity and TPO maps
+            #------------------------------------------------------------------------------------------------------------------------------
+            self.buildMaps(tpoData, currentPeriodID)
+        
+            # Iterate over commodity classes
+            #------------------------------------------------------------------------------------------------------------------------------
+            comCounter = 0
+            cluCounter = 0
+            tpoCounter = 0
+            outletSet = set()
+            assignedCounter = 0
+            similarityCounter = 0
+            similarityTotal = 0
+            brandCounter = 0
+            brandMatchCounter = 0
+            for comID, commodity in self.comMap.items():
+            
+                if commodity.containsUnassignedTPOs(self.tpoMap, currentPeriodID):
                 
-                comCounter += 1
-                print("\n\nCommodity " + str(comCounter) + ": " + str(comID))
+                    comCounter += 1
+                    print("\n\nCommodity " + str(comCounter) + ": " + str(comID))
                 
-                # Aggregate by geography
-                #--------------------------------------------------------------------------------------------------------------------------
-                clusters = self.buildClusterList(commodity, currentPeriodID, geoAggKey)
-                for cluster in clusters:
-                    # Populate the cluster with all products within the commodity class and the geographic class
-                    self.populateCluster(cluster)
+                    # Aggregate by geography
+                    #----------------------------------------------------------------------------------------------------------------------
+                    clusters = self.buildClusterList(commodity, currentPeriodID, geoAggKey)
+                    for cluster in clusters:
+                        # Populate the cluster with all products within the commodity class and the geographic class
+                        self.populateCluster(cluster)
                 
-                # Remove absent products
-                #--------------------------------------------------------------------------------------------------------------------------
-                for cluster in clusters:
-                    removeProductIDs = []
-                    for productID, product in cluster.products.items():
-                        # Check whether product was sold during the current period
-                        if not product.isPresent(currentPeriodID):
-                            removeProductIDs.append(productID)
-                    # Remove all products not sold during the current period
-                    for productID in removeProductIDs:
-                        cluster.removeProduct(productID)
+                    # Remove absent products
+                    #----------------------------------------------------------------------------------------------------------------------
+                    for cluster in clusters:
+                        removeProductIDs = []
+                        for productID, product in cluster.products.items():
+                            # Check whether product was sold during the current period
+                            if not product.isPresent(currentPeriodID):
+                                removeProductIDs.append(productID)
+                        # Remove all products not sold during the current period
+                        for productID in removeProductIDs:
+                            cluster.removeProduct(productID)
                 
-                # Iterate over clusters
-                #--------------------------------------------------------------------------------------------------------------------------
-                for cluster in clusters:
+                    # Iterate over clusters
+                    #----------------------------------------------------------------------------------------------------------------------
+                    for cluster in clusters:
+                    
+                        cluCounter += 1
                     
-                    cluCounter += 1
+                        # Search the nearest neighbours of every pending TPO of the cluster at once
+                        clusterNeighbours = self.computeClusterDistances(cluster, currentPeriodID, neighbourCount)
+                        clusterHomogeneities = self.computeClusterHomogeneities(cluster, currentPeriodID)
                     
-                    # Iterate over all TPOs
-                    for i, tpoID in enumerate(cluster.tpoIDs):
+                        # Iterate over all TPOs
+                        for i, tpoID in enumerate(cluster.tpoIDs):
                         
-                        tpo = self.tpoMap[tpoID]
-                        if not tpo.isAssigned(currentPeriodID):
+                            tpo = self.tpoMap[tpoID]
+                            if not tpo.isAssigned(currentPeriodID):
                             
-                            tpoCounter += 1
-                            outletSet.add(tpo.outletID)
+                                tpoCounter += 1
+                                outletSet.add(tpo.outletID)
+                                prevProductID = tpo.properties[currentPeriodID].productID
                             
-                            # Try to assign a new productID to the TPO
-                            status = self.assignTPO(cluster, 
-                                                    tpo,
-                                                    currentPeriodID,
-                                                    geoAggKey,
-                                                    lowerQuantityCutoff,
-                                                    upperQuantityCutoff,
-                                                    neighbourCount,
-                                                    relaunchDistanceCutoff,
-                                                    lowerDistanceCutoff,
-                                                    upperDistanceCutoff,
-                                                    samplingStrategy)
+                                # Try to assign a new productID to the TPO
+                                status = self.assignTPO(cluster, 
+                                                        tpo,
+                                                        currentPeriodID,
+                                                        geoAggKey,
+                                                        lowerQuantityCutoff,
+                                                        upperQuantityCutoff,
+                                                        neighbourCount,
+                                                        relaunchDistanceCutoff,
+                                                        lowerDistanceCutoff,
+                                                        upperDistanceCutoff,
+                                                        samplingStrategy,
+                                                        clusterNeighbours.get(tpoID),
+                                                        clusterHomogeneities.get(tpoID))
                             
-                            if suggest and tpo.properties[currentPeriodID].statusID == 2:
+                                if suggest and tpo.properties[currentPeriodID].statusID == 2:
                                 
-                                cluster.products[tpo.properties[currentPeriodID].productID].variables['selected'] = 1
-                                suggestions = cluster.toDataFrame(currentPeriodID, 
-                                                                  tpo.ID,
-                                                                  ['distance', self.salesKey, 'similarity', 'normDistance', 'selected'],
-                                                                  'OUTLET')
+                                    cluster.products[tpo.properties[currentPeriodID].productID].variables['selected'] = 1
+                                    suggestions = cluster.toDataFrame(currentPeriodID, 
+                                                                      tpo.ID,
+                                                                      ['distance', self.salesKey, 'similarity', 'normDistance', 'selected'],
+                                                                      'OUTLET',
+                                                                      self.filterSetNames)
+                                    self.suggestionsWriter.write(suggestions)
                             
-                                if self.suggestionsData is None:
-                                    self.suggestionsData = suggestions
-                                else:
-                                    self.suggestionsData = ds.appendDataSet(self.suggestionsData, suggestions)
+                                print("\nTPO " + str(tpoCounter) + ": " + str(tpo.ID) + " - " + status)
                             
-                            print("\nTPO " + str(tpoCounter) + ": " + str(tpo.ID) + " - " + status)
+                                if status == 'ASSIGNED' or status == 'RELAUNCH':
+                                    assignedCounter += 1
                             
-                            if status == 'ASSIGNED' or status == 'RELAUNCH':
-                                assignedCounter += 1
+                                # Append a new row to the tpoMatchedData dataframe
+                                wordSimilarity = self.appendResult(tpo, currentPeriodID, status, cluster)
                             
-                            # Append a new row to the tpoMatchedData dataframe
-                            self.appendResult(tpo, currentPeriodID, status, cluster)
-        
-        # Compute Brand Matching Score
-        #----------------------------------------------------------------------------------------------------------------------------------
-        tpoPeriodData = tpoData.loc[tpoData[self.periodIDKey] == currentPeriodID]
-        dupRPData = tpoPeriodData.loc[(tpoPeriodData[self.rpNameKey].str.contains("1")) | (tpoPeriodData[self.rpNameKey].str.contains("2"))]
-        dupRPData = dupRPData.merge(self.tpoMatchedData[[self.tpoIDKey, self.statusIDKey, self.productIDKey]], how='left', on=self.tpoIDKey, suffixes=('', '_s'))
-        dupRPData = dupRPData.dropna(subset=[self.productIDKey + '_s'])
-        dupRPData = dupRPData.loc[dupRPData['StatusID_s'] == 2]
-        dupRPData = dupRPData.merge(self.productDescData[[self.productIDKey, self.brandTypeKey]], how='left', on=self.productIDKey)
-        dupRPData = dupRPData.merge(self.productDescData[[self.productIDKey, self.brandTypeKey]], how='left', left_on=self.productIDKey+'_s', right_on=self.productIDKey, suffixes=('', '_s'))
-        dupRPData['Match'] = np.where(dupRPData[self.brandTypeKey] == dupRPData[self.brandTypeKey+'_s'], 1, 0)
-        
-        brandMatching = sum(dupRPData['Match']) / len(dupRPData)
-        
-        # Generate Matched TPO File
-        #----------------------------------------------------------------------------------------------------------------------------------
-        if details == True:
-            ds.generateFile(self.tpoMatchedData, tpoMatchedFilePath)
-        else:
-            ds.generateFile(self.tpoMatchedData[[self.tpoIDKey, self.productIDKey, self.statusIDKey]], tpoMatchedFilePath)
-        
-        # Generate Suggestions File
-        #----------------------------------------------------------------------------------------------------------------------------------
-        if self.suggestionsData is not None:
-            ds.generateFile(self.suggestionsData, suggestionsFilePath)
+                                # Accumulate the average similarity over every TPO that was not out of stock
+                                tpoProp = tpo.properties[currentPeriodID]
+                                if tpoProp.statusID != 3:
+                                    similarityCounter += 1
+                                    similarityTotal += wordSimilarity
+                            
+                                # Accumulate the brand matching score over the substituted TPOs of RPs 1 and 2
+                                if tpoProp.statusID == 2 and ("1" in tpo.rpName or "2" in tpo.rpName):
+                                    brandCounter += 1
+                                    prevPosition = self.productCatalog.position(prevProductID)
+                                    newPosition = self.productCatalog.position(tpoProp.productID)
+                                    if (prevPosition >= 0 and newPosition >= 0 and 
+                                        self.productCatalog.brandTypes[prevPosition] == self.productCatalog.brandTypes[newPosition]):
+                                        brandMatchCounter += 1
+                
+                    # Write the matched TPOs and the suggestions of the commodity class
+                    self.tpoMatchedResults.flush()
+                    if tpoMatchedWriter is not None:
+                        tpoMatchedWriter.flush()
+                    if suggest:
+                        self.suggestionsWriter.flush()
+            
+            # Materialize the matched TPOs if they were not streamed to a file
+            if tpoMatchedWriter is None:
+                self.tpoMatchedData = self.tpoMatchedResults.toDataFrame()
+        
+            # Compute Brand Matching Score
+            #------------------------------------------------------------------------------------------------------------------------------
+            brandMatching = 0
+            if brandCounter != 0:
+                brandMatching = brandMatchCounter / brandCounter
+        
+            # Generate Summary File
+            #------------------------------------------------------------------------------------------------------------------------------
+            print("\nSummary: Period " + str(currentPeriodID))
+            print("------------------------------")
+            print("Number of Commodities: " + str(comCounter))
+            print("Number of Clusters: " + str(cluCounter))
+            print("Number of Sites: " + str(len(outletSet)))
+            print("Number of TPOs: " + str(tpoCounter))
+            print("Number of Assigned TPOs: " + str(assignedCounter))
+            print("Brand Matching Score: " + str(brandMatching))
+            if self.descriptionCache is not None:
+                cacheStats = self.descriptionCache.stats()
+                print("Description Cache: " + str(cacheStats['hits']) + " hits, " + str(cacheStats['misses']) + " misses, " + 
+                      str(cacheStats['evictions']) + " evictions, " + str(cacheStats['bytes'] // 2**20) + " MB")
         
-        # Generate Summary File
-        #----------------------------------------------------------------------------------------------------------------------------------
-        print("\nSummary: Period " + str(currentPeriodID))
-        print("------------------------------")
-        print("Number of Commodities: " + str(comCounter))
-        print("Number of Clusters: " + str(cluCounter))
-        print("Number of Sites: " + str(len(outletSet)))
-        print("Number of TPOs: " + str(tpoCounter))
-        print("Number of Assigned TPOs: " + str(assignedCounter))
-        print("Brand Matching Score: " + str(brandMatching))
-        
-        assignedDF = self.tpoMatchedData.loc[self.tpoMatchedData[self.statusIDKey] != 3]
-        
-        if len(assignedDF) > 0:
-            similScore = sum(assignedDF['WordSimilarity']) / len(assignedDF['WordSimilarity'])
-        else:
             similScore = 0
-        
-        assignedFraction = 0
-        if tpoCounter != 0:
-            assignedFraction = assignedCounter / tpoCounter
-        
-        summaryVars = [currentPeriodID, 
-                       comCounter, 
-                       cluCounter, 
-                       len(outletSet), 
-                       tpoCounter, 
-                       assignedCounter, 
-                       self.unclassifiedCount,
-                       assignedFraction,
-                       similScore,
-                       brandMatching]
-        ds.addRow(self.summary, summaryVars)
-        ds.generateFile(self.summary, summaryFilePath)
+            if similarityCounter != 0:
+                similScore = similarityTotal / similarityCounter
+        
+            assignedFraction = 0
+            if tpoCounter != 0:
+                assignedFraction = assignedCounter / tpoCounter
+        
+            summaryVars = [currentPeriodID, 
+                           comCounter, 
+                           cluCounter, 
+                           len(outletSet), 
+                           tpoCounter, 
+                           assignedCounter, 
+                           self.unclassifiedCount,
+                           assignedFraction,
+                           similScore,
+                           brandMatching]
+            self.summaryResults.addRow(summaryVars)
+            self.summary = self.summaryResults.toDataFrame()
+            writers.append(wr.writeFile(self.summary, summaryFilePath, backgroundOutput))
+        
+            # Wait for the output files to be complete
+            #------------------------------------------------------------------------------------------------------------------------------
+            while len(writers) > 0:
+                writers[0].close()
+                writers.pop(0)
+        finally:
+            for writer in writers:
+                writer.discard()
     
     #--------------------------------------------------------------------------------------------------------------------------------------
     # buildMaps Method
@@ -478,14 +809,7 @@ class Substituter():
         
         # Identify any TPOs without a commodity mapping, and then attempt to complete the mapping through its associated RP
         # If the product description data set is complete, this step should not be necessary.
-        recipientComDF = tpoData.loc[tpoData[self.commodityIDKey].isnull()]
-        for row in recipientComDF.itertuples():
-            rpName = str(getattr(row, self.rpNameKey))
-            donorComDF = tpoData.loc[(tpoData[self.rpNameKey] == rpName) & (tpoData[self.commodityIDKey].notnull())]
-            if len(donorComDF) > 0:
-                comID = donorComDF[self.commodityIDKey].iloc[0]
-                index = row.Index
-                tpoData.at[index, self.commodityIDKey] = comID
+        tpoData = self.imputeCommodities(tpoData)
         
         # Initialize the commodity map
         #----------------------------------------------------------------------------------------------------------------------------------
@@ -497,17 +821,16 @@ class Substituter():
         # Filter out all assigned TPOs
         unassignedTPOData = tpoPeriodData.loc[tpoPeriodData[self.statusIDKey] == 0]
         
-        # Build a map of commodity classes such that each unassigned TPO is represented.
-        # Iterate over each unassigned TPO.
-        for row in unassignedTPOData.itertuples():
+        # Build a map of commodity classes such that each unassigned TPO is represented, in order of first appearance.
+        for value in pd.unique(unassignedTPOData[self.commodityIDKey]):
             
             try:
                 # Retrieve the Commodity Class ID
-                comID = int(getattr(row, self.commodityIDKey))
+                comID = int(value)
                     
                 # If the commodity class ID does not already exist as a dictionary key, create a new Commodity object.
                 if comID not in self.comMap:
-                    self.comMap[comID] = com.Commodity(comID)
+                    self.comMap[comID] = com.Commodity(comID, self.assignments)
                     
             except:
                 pass
@@ -517,77 +840,212 @@ class Substituter():
         print('\n\nMapping TPOs to each commodity class ...')
         
         # Map all TPOs, both assigned and unassigned, to the existing Commodity objects.
-        
-        # Iterate over all TPOs.
         print("Total of " + str(len(tpoPeriodData)) + " TPOs.")
-        for i in range(0, len(tpoPeriodData)):
+        
+        # Retrieve the properties of every TPO as column arrays.
+        productIDs = list(tpoPeriodData[self.productIDKey].to_numpy()) # Product ID
+        tpoIDs = tpoPeriodData[self.tpoIDKey].astype('int64').tolist() # TPO ID
+        rpNames = tpoPeriodData[self.rpNameKey].astype(str).tolist() # RP name
+        outletIDs = tpoPeriodData[self.outletIDKey].astype('int64').tolist() # Outlet ID (Phoenix)
+        cities = tpoPeriodData[self.cityKey].astype(str).tolist() # City
+        provinces = tpoPeriodData[self.provinceKey].astype(str).tolist() # Province
+        
+        # Convert 'Out of Stock' statuses to 'Unassigned'
+        statusIDs = tpoPeriodData[self.statusIDKey].astype('int64').to_numpy()
+        statusIDs = np.where(statusIDs == 3, 0, statusIDs).tolist() # Status ID of the TPO
+        
+        # Case 1: TPO is initialized
+        initialized = (tpoPeriodData[self.productIDKey] != "").to_numpy()
+        
+        # Search for the product description of each TPO's product.
+        positions = self.productCatalog.positionsOf(productIDs)
+        classified = initialized & (positions >= 0)
+        
+        # Case 1.2: The assigned product of the TPO does not have a commodity classification.
+        self.unclassifiedCount += int(np.count_nonzero(initialized & (positions < 0)))
+        
+        # Retrieve the ID of the commodity class and the UOM of each product.
+        comIDs = np.full(len(positions), np.nan)
+        comIDs[classified] = self.productCatalog.commodityIDs[positions[classified]]
+        UOMs = np.full(len(positions), np.nan, dtype=object)
+        UOMs[classified] = self.productCatalog.uoms[positions[classified]]
+        
+        # Case 1.1: The assigned product of the TPO has a commodity classification.
+        # A TargetProductOffer object is only created if a Commodity object exists for the retrieved commodity ID.
+        mapped = classified & np.isin(comIDs, list(self.comMap.keys()))
+        
+        # Materialize the TPOs in their original order
+        for i in np.flatnonzero(mapped).tolist():
             
-            # Retrieve the properties of the TPO.
-            productID = tpoPeriodData.iloc[i][self.productIDKey] # Product ID
-            tpoID = int(tpoPeriodData.iloc[i]['TPO_ID']) # TPO ID
-            rpName = str(tpoPeriodData.iloc[i][self.rpNameKey]) # RP name
-            outletID = int(tpoPeriodData.iloc[i][self.outletIDKey]) # Outlet ID (Phoenix)
-            city = str(tpoPeriodData.iloc[i][self.cityKey]) # City
-            province = str(tpoPeriodData.iloc[i][self.provinceKey]) # Province
-            statusID = int(tpoPeriodData.iloc[i][self.statusIDKey]) # Status ID of the TPO
+            tpoID = tpoIDs[i]
+            productID = productIDs[i]
+            statusID = statusIDs[i]
             
-            # Convert 'Out of Stock' statuses to 'Unassigned'
-            if statusID == 3:
-                statusID = 0
+            # Create a new TargetProductOffer object if the ID does not exist.
+            if tpoID not in self.tpoMap:
+                self.tpoMap[tpoID] = tpro.TargetProductOffer(tpoID, rpNames[i], outletIDs[i], cities[i], provinces[i], UOMs[i])
+                
+            tpo = self.tpoMap[tpoID]
             
-            # Case 1: TPO is initialized
-            if productID != "":
+            # Assign the TPO to the Commodity object
+            self.comMap[int(comIDs[i])].addTPO(tpo)
             
-                # Search for the product description of the TPO's product.
-                descDS = self.productDescData.loc[self.productDescData[self.productIDKey] == productID]
-                
-                # Case 1.1: The assigned product of the TPO has a commodity classification.
-                if len(descDS) > 0:
-                    
-                    # Retrieve the ID of the commodity class to which this product belongs.
-                    
-                    comID = descDS.iloc[0][self.commodityIDKey]
-                    UOM = descDS.iloc[0][self.uomKey]
-                    
-                    # Create a TargetProductOffer object, but only if a Commodity object exists for the retrieved commodity ID.
-                    if comID in self.comMap:
-                        
-                        # Assign the TPO to the Commodity object
-                        if tpoID not in self.comMap[comID].tpoIDs:
-                            self.comMap[comID].tpoIDs.add(tpoID)
-                    
-                        # Create a new TargetProductOffer object if the ID does not exist.
-                        if tpoID not in self.tpoMap:
-                            self.tpoMap[tpoID] = tpro.TargetProductOffer(tpoID, rpName, outletID, city, province, UOM)
-                            
-                        tpo = self.tpoMap[tpoID]
-                        
-                        # Case 1.1.1: Unassigned or Out of Stock
-                        if statusID == 0:
-                            if (periodID - 1) not in tpo.properties:
-                                tpo.addPeriod(periodID - 1, 1, productID)
-                            tpo.addPeriod(periodID, 0, productID)
-                            
-                        # Case 1.1.2: Continuity
-                        elif statusID == 1:
-                            if (periodID - 1) not in tpo.properties:
-                                tpo.addPeriod(periodID - 1, 1, productID)
-                            tpo.addPeriod(periodID, 1, productID)
-                        
-                        # Case 1.1.3: Substitution
-                        elif statusID == 2:
-                            if (periodID - 1) not in tpo.properties:
-                                tpo.addPeriod(periodID - 1, 1, productID)
-                            tpo.addPeriod(periodID, 2, productID)
-                
-                # Case 1.2: The assigned product of the TPO does not have a commodity classification.
-                else:
-                    self.unclassifiedCount += 1
+            # Case 1.1.1: Unassigned or Out of Stock
+            # Case 1.1.2: Continuity
+            # Case 1.1.3: Substitution
+            if statusID == 0 or statusID == 1 or statusID == 2:
+                if (periodID - 1) not in tpo.properties:
+                    tpo.addPeriod(periodID - 1, 1, productID)
+                tpo.addPeriod(periodID, statusID, productID)
+    
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # imputeCommodities Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def imputeCommodities(self, tpoData: pd.DataFrame) -> pd.DataFrame:
+        
+        """  
+        Method:     DataFrame imputeCommodities
+                    (
+                        DataFrame tpoData
+                    )
+        
+        Description: 
+            Completes the commodity mapping of TPOs without a commodity class ID through their associated RP. The donor of each RP is 
+            the first TPO of the same RP that has a commodity class ID; the donors are computed once, and every recipient is filled in a 
+            single step. TPOs whose RP has no donor keep a missing commodity class ID. Returns a copy of tpoData if any TPO was filled.
             
-            # Case 2: TPO is uninitialized
-            else:
-                # need commodity classification and UOM of TPOs
-                pass
+        Arguments:
+            DataFrame tpoData:
+                 A DataFrame containing the following obligatory columns:
+                     'RPName': String object that contains the name of the corresponding RPs.
+                     'CommodityID': Unique integer identifier of the commodity class of the TPO, or a missing value.
+        """
+        
+        recipients = tpoData[self.commodityIDKey].isnull().to_numpy()
+        if not recipients.any():
+            return tpoData
+        
+        start = time.perf_counter()
+        
+        # Donor commodity class of each RP
+        rpNames = tpoData[self.rpNameKey].astype(object)
+        donors = tpoData.loc[~recipients, self.commodityIDKey].groupby(rpNames[~recipients], sort=False).first()
+        
+        # Fill every recipient at once
+        comIDs = tpoData[self.commodityIDKey].copy()
+        comIDs[recipients] = rpNames[recipients].map(donors)
+        tpoData = tpoData.assign(**{self.commodityIDKey: comIDs})
+        
+        imputedCount = int(comIDs[recipients].notnull().sum())
+        print("Imputed the commodity class of " + str(imputedCount) + " of " + str(int(recipients.sum())) + " TPOs without a commodity class from " 
+              + str(len(donors)) + " RPs in " + str(round(time.perf_counter() - start, 3)) + " seconds.")
+        
+        return tpoData
+    
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # computeClusterDistances Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def computeClusterDistances(self, cluster: clu.Cluster, currentPeriodID: int, neighbourCount: int = None) -> dict:
+        
+        """  
+        Method:     dict<int, dict<T, float>> computeClusterDistances
+                    (
+                        Cluster cluster,
+                        int currentPeriodID,
+                        int neighbourCount
+                    )
+        
+        Description: 
+            Searches the nearest neighbours of the previous products of every unassigned, non-new TPO of the cluster in a single batch,
+            rather than one TPO at a time in assignTPO. TPOs whose previous product is not in the product catalog are left to assignTPO.
+            
+        Arguments:
+            Cluster cluster:
+                A populated Cluster object.
+            int currentPeriodID:
+                Unique identifier of the reference period to be considered.
+            int neighbourCount:
+                Number of closest candidate products per TPO; see substitute.
+        
+        Output:
+            dict<int, dict<T, float>>
+            Key: TPO ID
+            Value: map of the nearest neighbours of the previous product of the TPO to their distance
+        """
+        
+        if len(cluster.products) == 0:
+            return {}
+        
+        tpoIDs = []
+        references = []
+        for tpoID in cluster.tpoIDs:
+            tpo = self.tpoMap[tpoID]
+            if tpo.isAssigned(currentPeriodID) or currentPeriodID - 1 not in tpo.properties:
+                continue
+            
+            refProductID = tpo.properties[currentPeriodID - 1].productID
+            if refProductID != -1 and refProductID in self.productCatalog:
+                tpoIDs.append(tpoID)
+                references.append(self.productCatalog.desc(refProductID))
+        
+        if len(references) == 0:
+            return {}
+        
+        nCount = neighbourCount
+        if nCount == None:
+            nCount = len(cluster.products)
+        
+        index = cluster.getDistanceIndex(self.descriptionMatrix, self.approximateClusterSize, self.hashTableCount, self.hashBitCount)
+        neighbours = hom.computeDistances(references, cluster.products, nCount, index)
+        return dict(zip(tpoIDs, neighbours))
+    
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # computeClusterHomogeneities Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def computeClusterHomogeneities(self, cluster: clu.Cluster, currentPeriodID: int) -> dict:
+        
+        """  
+        Method:     dict<int, dict<T, float>> computeClusterHomogeneities
+                    (
+                        Cluster cluster,
+                        int currentPeriodID
+                    )
+        
+        Description: 
+            Computes the price homogeneity scores of the products of the cluster against the previous products of every unassigned, 
+            non-new TPO of the cluster in a single batch, from the price matrix of the cluster. The previous product of a TPO serves as
+            the reference if it was sold within the cluster, even if it was removed from the cluster since; other TPOs are left to 
+            assignTPO.
+            
+        Arguments:
+            Cluster cluster:
+                A populated Cluster object.
+            int currentPeriodID:
+                Unique identifier of the reference period to be considered.
+        
+        Output:
+            dict<int, dict<T, float>>
+            Key: TPO ID
+            Value: map of the products of the cluster to their price homogeneity score
+        """
+        
+        if len(cluster.products) == 0:
+            return {}
+        
+        tpoIDs = []
+        references = []
+        for tpoID in cluster.tpoIDs:
+            tpo = self.tpoMap[tpoID]
+            if tpo.isAssigned(currentPeriodID) or currentPeriodID - 1 not in tpo.properties:
+                continue
+            
+            refProduct = cluster.getProduct(tpo.properties[currentPeriodID - 1].productID)
+            if refProduct is not None:
+                tpoIDs.append(tpoID)
+                references.append(refProduct)
+        
+        homogeneities = hom.computePriceHomogeneities(references, cluster.products, cluster.getPriceMatrix())
+        return dict(zip(tpoIDs, homogeneities))
     
     #--------------------------------------------------------------------------------------------------------------------------------------
     # assignTPO Method
@@ -603,7 +1061,9 @@ class Substituter():
                   relaunchDistanceCutoff: float = 0,
                   lowerDistanceCutoff: float = 0.5,
                   upperDistanceCutoff: float = 1,
-                  samplingStrategy: str = 'cutoff') -> str:
+                  samplingStrategy: str = 'cutoff',
+                  neighbours: dict = None,
+                  homogeneities: dict = None) -> str:
         
         """  
         Method:     str assignTPO
@@ -618,7 +1078,9 @@ class Substituter():
                         float relaunchDistanceCutoff,
                         float lowerDistanceCutoff,
                         float upperDistanceCutoff,
-                        str samplingStrategy
+                        str samplingStrategy,
+                        dict<T, float> neighbours,
+                        dict<T, float> homogeneities
                     )
         
         Description: 
@@ -631,6 +1093,12 @@ class Substituter():
                      'Province' : clusters include all products within a province
                      'City' : clusters include all products within a city
                      'SiteID' : clusters include all products within an outlet
+            dict<T, float> neighbours:
+                 Nearest neighbours of the previous product of the TPO within the cluster, as computed by computeClusterDistances. If
+                 None, the neighbours are searched by the method.
+            dict<T, float> homogeneities:
+                 Price homogeneity scores of the products of the cluster against the previous product of the TPO, as computed by 
+                 computeClusterHomogeneities. If None, the scores are computed by the method.
             
         Output:
             A string describing the status of the TPO.
@@ -685,12 +1153,27 @@ class Substituter():
                 nCount = len(cluster.products)
             
             refProductID = tpo.properties[currentPeriodID - 1].productID
-            refFeatures = self.productDescData.loc[self.productDescData[self.productIDKey] == refProductID]
-            refFeatures = refFeatures.drop(columns = [self.productIDKey, self.commodityIDKey])
-            refFeatures = refFeatures.fillna('')
-            refFeatures = refFeatures.iloc[:,:].apply(lambda x: ' '.join(x), axis=1)
+            refFeatures = pd.Series([self.productCatalog.desc(refProductID)] if refProductID in self.productCatalog else [], dtype=object)
+            
+            if neighbours is None:
+                index = cluster.getDistanceIndex(self.descriptionMatrix, self.approximateClusterSize, self.hashTableCount, self.hashBitCount)
+                hom.computeDistance('distance', refFeatures, cluster.products, nCount, index)
+            else:
+                hom.computeDistance('distance', refFeatures, cluster.products, nCount, neighbours = neighbours)
             
-            hom.computeDistance('distance', refFeatures, cluster.products, nCount)
+            # Calculate price homogeneity
+            #----------------------------------------------------------------------------------------------------------------------------------
+            # Compare the price relatives of every product with those of the previously-selected product. Products that cannot be 
+            # compared, for lack of common periods or of sales of the previously-selected product, have a score of infinity.
+            if homogeneities is None:
+                refProduct = cluster.getProduct(refProductID)
+                homogeneities = hom.computePriceHomogeneities([refProduct] if refProduct is not None else [], 
+                                                              cluster.products, 
+                                                              cluster.getPriceMatrix())
+                homogeneities = homogeneities[0] if len(homogeneities) > 0 else {}
+            
+            for productID, product in cluster.products.items():
+                product.variables['homogeneity'] = homogeneities.get(productID, np.inf)
                                     
             # Identify relaunched products
             #----------------------------------------------------------------------------------------------------------------------------------
@@ -738,8 +1221,10 @@ class Substituter():
         #----------------------------------------------------------------------------------------------------------------------------------
         # Calculate word similarity scores between each product description and the previous RP name.
         
-        for productID in cluster.filterSets['TOP_SELLERS']:    
-            cluster.products[productID].variables['similarity'] = hom.computeWordSimilarity(tpo.rpName, cluster.products[productID].desc, '\s|/|_')
+        topSellerIDs = list(cluster.filterSets['TOP_SELLERS'])
+        similarities = hom.computeWordSimilarities(tpo.rpName, cluster.getNormalizedDescs(topSellerIDs), '\s|/|_', normalized = True)
+        for productID, similarity in zip(topSellerIDs, similarities.tolist()):
+            cluster.products[productID].variables['similarity'] = similarity
             
         maxSimilarity = cluster.find(lambda refProd, prod: refProd.variables['similarity'] < prod.variables['similarity'], 
                                      lambda prod: prod.variables['similarity'],
@@ -832,8 +1317,12 @@ class Substituter():
         
         print('\nBuilding a cluster for each unique geography ...')
         
-        # Construct an empty list
+        if self.geographyIndex is None or self.geographyIndexKey != geoAggKey:
+            self.indexGeography(geoAggKey)
+        
+        # Construct an empty list, and a map of the clusters by geographic properties
         clusters = []
+        clusterMap = {}
         
         # Iterate over all TPOs assigned to the commodity class
         for tpoID in commodity.tpoIDs:
@@ -843,54 +1332,95 @@ class Substituter():
             # Only consider the unassigned TPOs
             if not tpo.isAssigned(periodID):
                 
-                # Setup a list of geographic properties
-                #   [0] := province
-                #   [1] := city
-                #   [2] := outlet ID
-                geoProperties = ['', '', '']
-                
-                # Retrieve the geographic properties selected for filtering 
-                if geoAggKey == self.provinceKey:
-                    geoProperties[0] = tpo.province
-                elif geoAggKey == self.cityKey:
-                    geoProperties[0] = tpo.province
-                    geoProperties[1] = tpo.city
-                elif geoAggKey == self.outletIDKey:
-                    geoProperties[0] = tpo.province
-                    geoProperties[1] = tpo.city
-                    geoProperties[2] = tpo.outletID
+                # Retrieve the geographic properties selected for filtering
+                geoProperties = self.geographyKey(tpo.province, tpo.city, tpo.outletID, geoAggKey)
                 
                 # Check whether a Cluster object with the same geoProperties already exists.
-                exists = False
-                for cluster in clusters:
-                    if cluster.geography.equals(geoProperties):
-                        cluster.tpoIDs.append(tpoID)
-                        exists = True
-                        break
+                if geoProperties in clusterMap:
+                    clusterMap[geoProperties].tpoIDs.append(tpoID)
                        
                 # If not, create a new Cluster object and add it to the cluster list.
-                if exists == False:
+                else:
                     
-                    cluster = clu.Cluster(commodity, geo.Geography(geoProperties))
+                    cluster = clu.Cluster(commodity, geo.Geography(geoProperties), self.descriptionCache)
                     
                     cluster.tpoIDs.append(tpoID)
                     
-                    # Find all of the outlets that are within this cluster
-                    outlets = None
-                    if geoAggKey == self.provinceKey:
-                        outlets = self.outletData.loc[self.outletData[self.provinceKey] == tpo.province]
-                    elif geoAggKey == self.cityKey:
-                        outlets = self.outletData.loc[(self.outletData[self.provinceKey] == tpo.province) & (self.outletData[self.cityKey] == tpo.city)]
-                    elif geoAggKey == self.outletIDKey:
-                        outlets = self.outletData.loc[(self.outletData[self.provinceKey] == tpo.province) & (self.outletData[self.cityKey] == tpo.city) & (self.outletData[self.outletIDKey] == tpo.outletID)]
-                    
-                    # Assign the outlet IDs to the cluster
-                    cluster.geography.addOutlet(outlets[self.outletIDKey].tolist())
+                    # Assign the outlets that are within this cluster
+                    cluster.geography.addOutlet(self.geographyIndex.get(geoProperties, []))
                     
                     clusters.append(cluster)
+                    clusterMap[geoProperties] = cluster
                     
         return clusters
-
+    
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # geographyKey Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def geographyKey(self, province, city, outletID, geoAggKey: str = 'City') -> tuple:
+        
+        """  
+        Method:     tuple geographyKey
+                    (
+                        T province,
+                        T city,
+                        int outletID,
+                        string geoAggKey
+                    )
+        
+        Description: 
+            Returns the geographic properties of an outlet at the level given by geoAggKey:
+                [0] := province
+                [1] := city
+                [2] := outlet ID
+            Properties below the selected level are empty strings.
+        """
+        
+        if geoAggKey == self.provinceKey:
+            return (province, '', '')
+        elif geoAggKey == self.cityKey:
+            return (province, city, '')
+        elif geoAggKey == self.outletIDKey:
+            return (province, city, outletID)
+        return ('', '', '')
+    
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # indexGeography Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def indexGeography(self, geoAggKey: str = 'City'):
+        
+        """  
+        Method:     void indexGeography
+                    (
+                        string geoAggKey
+                    )
+        
+        Description: 
+            Maps the geographic properties of every geographic class at the level given by geoAggKey to the IDs of its outlets, in a 
+            single pass over outletData. Outlets with a missing province, city or outlet ID at the selected level are left out, as 
+            they never belong to a cluster.
+        """
+        
+        if geoAggKey == self.provinceKey:
+            keyColumns = [self.provinceKey]
+        elif geoAggKey == self.cityKey:
+            keyColumns = [self.provinceKey, self.cityKey]
+        elif geoAggKey == self.outletIDKey:
+            keyColumns = [self.provinceKey, self.cityKey, self.outletIDKey]
+        else:
+            raise ValueError("Error: Unknown geographic level '" + str(geoAggKey) + "'. Expected 'Province', 'City' or 'OutletID'.")
+        
+        outletIDs = self.outletData[self.outletIDKey].to_numpy()
+        groups = self.outletData.groupby(keyColumns, sort=False, observed=True).indices
+        
+        self.geographyIndex = {}
+        for key, positions in groups.items():
+            key = key if isinstance(key, tuple) else (key,)
+            geoProperties = self.geographyKey(key[0], key[1] if len(key) > 1 else '', key[2] if len(key) > 2 else '', geoAggKey)
+            self.geographyIndex[geoProperties] = outletIDs[np.sort(positions)].tolist()
+        
+        self.geographyIndexKey = geoAggKey
+    
     #--------------------------------------------------------------------------------------------------------------------------------------
     # populateCluster Method
     #--------------------------------------------------------------------------------------------------------------------------------------
@@ -913,9 +1443,14 @@ class Substituter():
         
         print('\nPopulating cluster ...')
         
+        if self.salesIndex is None:
+            self.indexSales()
+        
         for outletID, outlet in cluster.geography.outlets.items():
             
-            prodCluster = self.productData.loc[(self.productData[self.commodityIDKey] == cluster.commodity.ID) & (self.productData[self.outletIDKey] == outletID)]
+            # Retrieve the sales of the commodity class at the outlet
+            start, stop = self.salesIndex.get((cluster.commodity.ID, outletID), (0, 0))
+            prodCluster = self.productData.iloc[self.salesOrder[start:stop]]
             
             for row in prodCluster.itertuples():
                 productID = getattr(row, self.productIDKey)
@@ -935,7 +1470,7 @@ class Substituter():
     def appendResult(self, tpo: tpro.TargetProductOffer, periodID: int = 0, status: str = '', cluster: clu.Cluster = None):
         
         """  
-        Method:     void appendResult
+        Method:     float appendResult
                     (
                         TargetProductOffer tpo,
                         int periodID,
@@ -957,7 +1492,9 @@ class Substituter():
                 A string message that explains whether a product was assigned.
             Cluster cluster:
                 A Cluster object containing all products related to the previously-selected product.
-            
+        
+        Output:
+            The word similarity between the RP of the TPO and the description of its new product, or 0 if it was not assigned one.
         """
 
         comID = -1
@@ -991,9 +1528,9 @@ class Substituter():
         
         if (periodID - 1) in tpo.properties:
             try:
-                prevProdDesc = self.productDescData.loc[self.productDescData[self.productIDKey] == int(tpo.properties[periodID - 1].productID)]
-                prevBrandType = getattr(prevProdDesc, self.brandTypeKey)[prevProdDesc.index[0]]
-                prevDesc = ds.concatenateRow(prevProdDesc, 0, ' ', [self.productIDKey, self.commodityIDKey])
+                position = self.productCatalog.find(int(tpo.properties[periodID - 1].productID))
+                prevBrandType = self.productCatalog.brandTypes[position]
+                prevDesc = self.productCatalog.descs[position]
             except:
                 pass
         
@@ -1002,10 +1539,10 @@ class Substituter():
             
             soldAtSite = tpo.outletID in cluster.products[tpoProp.productID].properties[periodID].outletIDs
             
-            newProdDesc = self.productDescData.loc[self.productDescData[self.productIDKey] == int(tpoProp.productID)]
-            newBrandType = getattr(newProdDesc, self.brandTypeKey)[newProdDesc.index[0]]
-            newDesc = ds.concatenateRow(newProdDesc, 0, ' ', [self.productIDKey, self.commodityIDKey])
-            prodComID = int(newProdDesc.iloc[0][self.commodityIDKey])
+            position = self.productCatalog.find(int(tpoProp.productID))
+            newBrandType = self.productCatalog.brandTypes[position]
+            newDesc = self.productCatalog.descs[position]
+            prodComID = int(self.productCatalog.commodityIDs[position])
             inCommodity = cluster.commodity.ID == prodComID
             
             product = cluster.products[tpoProp.productID]
@@ -1017,15 +1554,16 @@ class Substituter():
                 distance = product.variables['distance']
             
             if status == 'RELAUNCH':
-                wordSimilarity = hom.computeWordSimilarity(tpo.rpName, newDesc, '\s|/|_')
+                wordSimilarity = hom.computeWordSimilarity(tpo.rpName, newDesc, '\s|/|_', tpoProp.productID, self.descriptionCache)
             else:
                 wordSimilarity = cluster.products[tpoProp.productID].variables['similarity']
         
-        ds.addRow(self.tpoMatchedData,
-                  [comID,
-                  tpo.ID, tpo.rpName, tpo.outletID,
-                  tpo.properties[periodID - 1].productID, prevDesc, prevBrandType,
-                  tpo.properties[periodID].productID, newDesc, newBrandType,
-                  productCount, currentTotal, outletTotal,
-                  soldAtSite, inCommodity, normQuant, priceHomo, distance, wordSimilarity,
-                  tpo.properties[periodID].statusID, status])
\ No newline at end of file
+        self.tpoMatchedResults.addRow([comID,
+                                       tpo.ID, tpo.rpName, tpo.outletID,
+                                       tpo.properties[periodID - 1].productID, prevDesc, prevBrandType,
+                                       tpo.properties[periodID].productID, newDesc, newBrandType,
+                                       productCount, currentTotal, outletTotal,
+                                       soldAtSite, inCommodity, normQuant, priceHomo, distance, wordSimilarity,
+                                       tpo.properties[periodID].statusID, status])
+        
+        return wordSimilarity
\ No newline at end of file
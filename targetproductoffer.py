@@ -1,3 +1,22 @@
+#------------------------------------------------------------------------------------------------------------------------------------------
+# isAssignedStatus Method
+#------------------------------------------------------------------------------------------------------------------------------------------
+def isAssignedStatus(statusID: int) -> bool:
+    
+    """
+    Method:
+        
+        bool isAssignedStatus
+        (
+            int statusID
+        )
+        
+    Description:
+        Returns False if the status denotes an unassigned or out of stock TPO. Returns True otherwise.
+    """
+    
+    return not (statusID == 0 or statusID == 3)
+
 #==========================================================================================================================================
 # TPOProperties Class
 #==========================================================================================================================================
@@ -66,6 +85,8 @@ class TargetProductOffer:
             Value: TPOProperty object.
         string UOM:
             Unit of measure of the assigned product.
+        AssignmentRegistry registry:
+            Registry that is notified of every call to addPeriod, or None; see assignment.py.
     """
     
     #--------------------------------------------------------------------------------------------------------------------------------------
@@ -104,6 +125,8 @@ class TargetProductOffer:
         
         self.properties = {}
         
+        self.registry = None
+        
     #--------------------------------------------------------------------------------------------------------------------------------------
     # isAssigned Method
     #--------------------------------------------------------------------------------------------------------------------------------------
@@ -121,10 +144,7 @@ class TargetProductOffer:
             bool
         """
         
-        if self.properties[periodID].statusID == 0 or self.properties[periodID].statusID == 3:
-            return False
-        else:
-            return True
+        return isAssignedStatus(self.properties[periodID].statusID)
     
     #--------------------------------------------------------------------------------------------------------------------------------------
     # addPeriod Method
@@ -142,13 +162,18 @@ class TargetProductOffer:
             )
             
         Description:
-            Assigns the given product ID to the TPO and sets the TPO status.
+            Assigns the given product ID to the TPO and sets the TPO status. The registry, if any, is notified of the change.
         """
+        previous = None
         if periodID in self.properties:
+            previous = (self.properties[periodID].statusID, self.properties[periodID].productID)
             self.properties[periodID].productID = productID
             self.properties[periodID].statusID = statusID
         else:
             self.properties[periodID] = TPOProperties(periodID, statusID, productID)
+        
+        if self.registry is not None:
+            self.registry.update(self, periodID, previous)
     
     #--------------------------------------------------------------------------------------------------------------------------------------
     # toString Method
@@ -0,0 +1,515 @@
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+import scipy.sparse as sps
+from sklearn.feature_extraction.text import CountVectorizer, HashingVectorizer
+
+import homogeneity as hom
+import snapshot as snap
+
+"""
+Description:
+    Persists the term counts and the normalized text of every product description across runs, so that a run only tokenizes the
+    descriptions that are new or have changed since the previous run. The counts are stored as the .npy arrays of a CSR matrix that are
+    reopened via memory mapping, along with the product ID and a hash of the description of every row.
+
+    The columns of the counts are either the terms of a vocabulary that only ever grows, so that the rows stored by earlier runs remain
+    valid, or the featureCount columns into which a HashingVectorizer hashes the terms; see homogeneity.DescriptionMatrix.
+"""
+
+formatVersion = 1
+manifestFileName = 'manifest.json'
+
+#------------------------------------------------------------------------------------------------------------------------------------------
+# contentHash Method
+#------------------------------------------------------------------------------------------------------------------------------------------
+def contentHash(desc: str) -> int:
+
+    """
+    Method:
+
+        int contentHash
+        (
+            string desc
+        )
+
+    Description:
+        Returns a 64-bit BLAKE2 hash of a description, which identifies the version of the description from which a row was vectorized.
+    """
+
+    return int.from_bytes(hashlib.blake2b(desc.encode('utf-8'), digest_size=8).digest(), 'little')
+
+#==========================================================================================================================================
+# VectorStore Class
+#==========================================================================================================================================
+class VectorStore:
+
+    """
+    Class:     VectorStore
+
+    Description:
+        Persistent store of the term counts and the normalized text of product descriptions, keyed by product ID and description hash.
+        The store is opened from its directory, if it exists and was built with the same featureCount, and is otherwise empty. Rows are
+        looked up by vectorize and normalizedText; rows of products whose description has changed are vectorized again and replace the
+        stored ones. Changes are only written to disk by save.
+
+    Instance Variables:
+        string storePath:
+            Directory of the store.
+        int featureCount:
+            Number of columns into which the terms are hashed, or None if the columns are the terms of vocabulary.
+        list<string> terms:
+            Term of each column, in the order of the columns; empty if featureCount is not None.
+        dict<string, int> vocabulary:
+            Column of each term.
+        list<T> productIDs:
+            Product ID of each row.
+        ndarray hashes:
+            Description hash of each row; see contentHash.
+        dict<T, int> positions:
+            Row of each product ID.
+        csr_matrix counts:
+            Term counts of each row. The terms of each row are in the order in which they occur in its description. The arrays of a 
+            store that was opened from disk are memory-mapped read-only.
+        list<string> normalizedTexts:
+            Description of each row, normalized by homogeneity.normalizeText; read from disk on first use.
+        bool modified:
+            True if rows were added or replaced since the store was opened or saved.
+        int reusedCount:
+            Number of rows that were looked up by vectorize and found in the store.
+        int vectorizedCount:
+            Number of rows that were looked up by vectorize and had to be vectorized.
+    """
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # Constructor
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def __init__(self, storePath: str, featureCount: int = None):
+
+        """
+        Constructor:
+
+            VectorStore
+            (
+                string storePath,
+                int featureCount
+            )
+
+        Description:
+            Opens the store in the given directory. If the directory does not hold a store, or holds one that was written by another
+            format version or with another featureCount, the store is empty and every description will be vectorized.
+        """
+
+        if featureCount is not None and featureCount < 1:
+            raise ValueError("Error: The number of hashed features must be positive.")
+
+        self.storePath = storePath
+        self.featureCount = featureCount
+        self.terms = []
+        self.vocabulary = {}
+        self.productIDs = []
+        self.hashes = np.zeros(0, dtype='uint64')
+        self.positions = {}
+        self.counts = sps.csr_matrix((0, self.columnCount()), dtype=np.float64)
+        self.normalizedTexts = []
+        self.modified = False
+        self.reusedCount = 0
+        self.vectorizedCount = 0
+
+        manifest = self.readManifest()
+        if manifest is None:
+            print("\nVector store is missing or out of date: \n'" + storePath + "'")
+            return
+
+        print("\nOpening vector store: \n'" + storePath + "'")
+
+        if featureCount is None:
+            self.terms = snap.readStrings(os.path.join(storePath, 'terms'))
+            self.vocabulary = dict(zip(self.terms, range(0, len(self.terms))))
+
+        keys = snap.readTable(storePath, manifest['keys'])
+        self.productIDs = keys['ProductID'].tolist()
+        self.hashes = keys['Hash'].to_numpy()
+        self.positions = dict(zip(self.productIDs, range(0, len(self.productIDs))))
+
+        arrays = [np.load(os.path.join(storePath, 'counts.' + name + '.npy'), mmap_mode='r') for name in ['data', 'indices', 'indptr']]
+        self.counts = sps.csr_matrix(tuple(arrays), shape=(len(self.productIDs), self.columnCount()), copy=False)
+        self.normalizedTexts = None
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # __len__ Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def __len__(self) -> int:
+        return len(self.productIDs)
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # readManifest Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def readManifest(self) -> dict:
+
+        """
+        Method:
+
+            dict readManifest()
+
+        Description:
+            Returns the manifest of the store on disk, or None if there is no store that can be opened with the settings of the object.
+        """
+
+        snap.restoreDirectory(self.storePath)
+
+        manifestPath = os.path.join(self.storePath, manifestFileName)
+        if not os.path.exists(manifestPath):
+            return None
+
+        with open(manifestPath) as file:
+            manifest = json.load(file)
+
+        if manifest.get('version') != formatVersion or manifest.get('featureCount') != self.featureCount:
+            return None
+        return manifest
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # columnCount Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def columnCount(self) -> int:
+        return len(self.terms) if self.featureCount is None else self.featureCount
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # buildVectorizer Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def buildVectorizer(self):
+
+        """
+        Method:
+
+            CountVectorizer or HashingVectorizer buildVectorizer()
+
+        Description:
+            Returns a vectorizer that maps descriptions to the columns of the rows returned by vectorize, as the vectorizer of a 
+            DescriptionMatrix. Terms that are added to the store later are not known to the vectorizer.
+        """
+
+        if self.featureCount is None:
+            return CountVectorizer(encoding="latin-1", dtype=np.float64, vocabulary=dict(zip(self.terms, self.sortedColumns().tolist())))
+        return HashingVectorizer(encoding="latin-1", n_features=self.featureCount, alternate_sign=False, norm=None, dtype=np.float64)
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # sortedColumns Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def sortedColumns(self) -> np.ndarray:
+
+        """
+        Method:
+
+            ndarray sortedColumns()
+
+        Description:
+            Returns the rank of the term of each column among the terms of the vocabulary. Columns are stored in the order in which their
+            terms were first seen, but presented in the order of the sorted terms, as by a fitted CountVectorizer; see presentColumns.
+        """
+
+        ranks = np.empty(len(self.terms), dtype='int32')
+        ranks[np.argsort(np.array(self.terms, dtype=object), kind='stable')] = np.arange(0, len(self.terms), dtype='int32')
+        return ranks
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # vectorizeTexts Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def vectorizeTexts(self, descs: list) -> sps.csr_matrix:
+
+        """
+        Method:
+
+            csr_matrix vectorizeTexts
+            (
+                list<string> descs
+            )
+
+        Description:
+            Tokenizes the given descriptions and returns their term counts, one row per description. Terms that are not in the
+            vocabulary yet are appended to it.
+        """
+
+        if self.featureCount is not None:
+            return sps.csr_matrix(self.buildVectorizer().transform(descs))
+
+        tokenLists = [hom.analyzeText(desc) for desc in descs]
+        tokens = [token for tokenList in tokenLists for token in tokenList]
+        if len(tokens) == 0:
+            return sps.csr_matrix((len(descs), self.columnCount()), dtype=np.float64)
+
+        # Map the distinct tokens onto the columns of the store, appending the new ones in the order in which they are first seen
+        codes, uniqueTokens = pd.factorize(pd.Series(tokens, dtype=object))
+        columns = np.zeros(len(uniqueTokens), dtype='int64')
+        for i, term in enumerate(uniqueTokens.tolist()):
+            column = self.vocabulary.get(term)
+            if column is None:
+                column = len(self.terms)
+                self.vocabulary[term] = column
+                self.terms.append(term)
+            columns[i] = column
+
+        # Count every term of every row, and keep the terms of each row in the order in which they first occur in the description
+        rows = np.repeat(np.arange(0, len(descs), dtype='int64'), [len(tokenList) for tokenList in tokenLists])
+        keys = rows * self.columnCount() + columns[codes]
+        uniqueKeys, firstPositions, counts = np.unique(keys, return_index=True, return_counts=True)
+        order = np.argsort(firstPositions, kind='stable')
+        uniqueKeys = uniqueKeys[order]
+
+        indptr = np.zeros(len(descs) + 1, dtype='int64')
+        indptr[1:] = np.cumsum(np.bincount(uniqueKeys // self.columnCount(), minlength=len(descs)))
+        return sps.csr_matrix((counts[order].astype(np.float64), (uniqueKeys % self.columnCount()).astype('int32'), indptr),
+                              shape=(len(descs), self.columnCount()))
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # loadNormalizedTexts Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def loadNormalizedTexts(self) -> list:
+        if self.normalizedTexts is None:
+            self.normalizedTexts = snap.readStrings(os.path.join(self.storePath, 'normalized'))
+        return self.normalizedTexts
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # find Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def find(self, productID, desc: str) -> int:
+
+        """
+        Method:
+
+            int find
+            (
+                T productID,
+                string desc
+            )
+
+        Description:
+            Returns the row of a product, or -1 if the product is not in the store or its row was vectorized from another description.
+        """
+
+        try:
+            position = self.positions.get(productID, -1)
+        except TypeError:
+            # Unhashable IDs are never in the store
+            return -1
+
+        if position < 0 or self.hashes[position] != contentHash(desc):
+            return -1
+        return position
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # normalizedText Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def normalizedText(self, productID, desc: str) -> str:
+
+        """
+        Method:
+
+            string normalizedText
+            (
+                T productID,
+                string desc
+            )
+
+        Description:
+            Returns the stored normalized description of a product, or None if the product is not in the store or its description has
+            changed.
+        """
+
+        position = self.find(productID, desc)
+        if position < 0:
+            return None
+        return self.loadNormalizedTexts()[position]
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # vectorize Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def vectorize(self, productIDs: list, descs: list) -> sps.csr_matrix:
+
+        """
+        Method:
+
+            csr_matrix vectorize
+            (
+                list<T> productIDs,
+                list<string> descs
+            )
+
+        Description:
+            Returns the term counts of the given products, one row per product, as a CountVectorizer fitted to their descriptions would
+            (see presentColumns). The rows of products whose description is in the store are read from it; the other descriptions are vectorized, and their rows are added to the store or
+            replace the stored ones.
+
+        Arguments
+            list<T> productIDs:
+                Unique identifiers of the products.
+            list<string> descs:
+                Concatenated text features of the products, in the same order.
+
+        Output:
+            csr_matrix
+        """
+
+        if len(productIDs) != len(descs):
+            raise ValueError("Error: " + str(len(descs)) + " descriptions were given for " + str(len(productIDs)) + " products.")
+
+        hashes = np.array([contentHash(desc) for desc in descs], dtype='uint64')
+        positions = np.array([self.positions.get(productID, -1) for productID in productIDs], dtype='int64')
+
+        found = positions >= 0
+        found[found] = self.hashes[positions[found]] == hashes[found]
+        missing = np.flatnonzero(~found)
+
+        self.reusedCount += len(productIDs) - len(missing)
+        self.vectorizedCount += len(missing)
+
+        if len(missing) > 0:
+            self.add([productIDs[i] for i in missing], hashes[missing], [descs[i] for i in missing])
+            positions = np.array([self.positions[productID] for productID in productIDs], dtype='int64')
+
+        counts = self.counts[positions]
+        if self.featureCount is None:
+            counts = self.presentColumns(counts)
+        return counts
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # presentColumns Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def presentColumns(self, counts: sps.csr_matrix) -> sps.csr_matrix:
+
+        """
+        Method:
+
+            csr_matrix presentColumns
+            (
+                csr_matrix counts
+            )
+
+        Description:
+            Returns stored rows as a CountVectorizer fitted to their descriptions would: the columns are renumbered in the order of the
+            sorted terms (see sortedColumns), and the terms of each row are ordered by their first occurrence in the given rows, taken in
+            order. The TF-IDF weights are then summed in the same order as without a store, so that the distances are the same.
+        """
+
+        rowCount = counts.shape[0]
+        if counts.nnz == 0:
+            return sps.csr_matrix((rowCount, self.columnCount()), dtype=np.float64)
+
+        # The stored terms of each row are in the order in which they occur in the description
+        uniqueColumns, firstPositions = np.unique(counts.indices, return_index=True)
+        firstSeen = np.zeros(self.columnCount(), dtype='int64')
+        firstSeen[uniqueColumns] = firstPositions
+
+        entryRows = np.repeat(np.arange(0, rowCount, dtype='int64'), np.diff(counts.indptr))
+        order = np.lexsort((firstSeen[counts.indices], entryRows))
+        return sps.csr_matrix((np.asarray(counts.data)[order], self.sortedColumns()[np.asarray(counts.indices)[order]], counts.indptr),
+                              shape=counts.shape)
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # add Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def add(self, productIDs: list, hashes: np.ndarray, descs: list):
+
+        """
+        Method:
+
+            void add
+            (
+                list<T> productIDs,
+                ndarray hashes,
+                list<string> descs
+            )
+
+        Description:
+            Vectorizes and normalizes the given descriptions and appends their rows to the store. Stored rows of the same products are
+            dropped. If a product is given more than once, its last description is kept.
+        """
+
+        # Keep the last occurrence of every product ID
+        last = dict(zip(productIDs, range(0, len(productIDs))))
+        if len(last) < len(productIDs):
+            keep = sorted(last.values())
+            productIDs = [productIDs[i] for i in keep]
+            hashes = hashes[keep]
+            descs = [descs[i] for i in keep]
+
+        newCounts = self.vectorizeTexts(descs)
+        normalizedTexts = self.loadNormalizedTexts() if len(self.productIDs) > 0 else []
+
+        keep = np.array([productID not in last for productID in self.productIDs], dtype=bool)
+        keptRows = np.flatnonzero(keep)
+
+        # Copy the kept rows out of the memory-mapped arrays, which are replaced when the store is saved
+        keptCounts = sps.csr_matrix(self.counts[keptRows], shape=(len(keptRows), self.columnCount()))
+        self.counts = sps.vstack([keptCounts, newCounts], format='csr')
+        self.productIDs = [self.productIDs[i] for i in keptRows] + list(productIDs)
+        self.hashes = np.concatenate([self.hashes[keptRows], hashes]).astype('uint64')
+        self.normalizedTexts = [normalizedTexts[i] for i in keptRows] + [hom.normalizeText(desc) for desc in descs]
+        self.positions = dict(zip(self.productIDs, range(0, len(self.productIDs))))
+        self.modified = True
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # save Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def save(self):
+
+        """
+        Method:
+
+            void save()
+
+        Description:
+            Writes the store to its directory, replacing the previous version, if rows were added or replaced since it was opened. The
+            store is written to a temporary directory first, so that an interrupted write never leaves a partial store behind, and then
+            swapped in by snapshot.replaceDirectory.
+        """
+
+        if not self.modified:
+            return
+
+        print("\nWriting vector store: \n'" + self.storePath + "' ...")
+
+        tempPath = self.storePath.rstrip('/\\') + '.tmp'
+        if os.path.exists(tempPath):
+            shutil.rmtree(tempPath)
+        os.makedirs(tempPath)
+
+        # Indices and index pointers share the smallest dtype that holds them, which scipy then maps without copying them
+        counts = self.counts
+        indexDtype = 'int32' if max(counts.nnz, self.columnCount()) < 2**31 else 'int64'
+        np.save(os.path.join(tempPath, 'counts.data.npy'), np.asarray(counts.data, dtype=np.float64))
+        np.save(os.path.join(tempPath, 'counts.indices.npy'), np.asarray(counts.indices, dtype=indexDtype))
+        np.save(os.path.join(tempPath, 'counts.indptr.npy'), np.asarray(counts.indptr, dtype=indexDtype))
+        snap.writeStrings(os.path.join(tempPath, 'normalized'), self.loadNormalizedTexts())
+        if self.featureCount is None:
+            snap.writeStrings(os.path.join(tempPath, 'terms'), self.terms)
+
+        keys = snap.writeTable(tempPath, 'keys', pd.DataFrame({'ProductID': self.productIDs, 'Hash': self.hashes}))
+        manifest = {'version': formatVersion, 'featureCount': self.featureCount, 'keys': keys}
+
+        with open(os.path.join(tempPath, manifestFileName), 'w') as file:
+            json.dump(manifest, file, indent=1)
+
+        snap.replaceDirectory(tempPath, self.storePath)
+
+        self.modified = False
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # stats Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def stats(self) -> dict:
+
+        """
+        Method:
+
+            dict<string, int> stats()
+
+        Description:
+            Returns the counters of the store: 'rows', 'columns', 'reused' and 'vectorized'.
+        """
+
+        return {'rows': len(self.productIDs), 'columns': self.columnCount(), 'reused': self.reusedCount, 'vectorized': self.vectorizedCount}
@@ -0,0 +1,585 @@
+import gzip
+import io
+import os
+import queue
+import threading
+import pandas as pd
+
+import dataset as ds
+
+"""
+Description:
+    Provides writers that stream tables to their output files in chunks. Every file is written to a temporary file next to its
+    destination, which is synced to disk and renamed into place once the file is closed; downstream jobs therefore never see a partial
+    output file.
+"""
+
+#------------------------------------------------------------------------------------------------------------------------------------------
+# compressionOf Method
+#------------------------------------------------------------------------------------------------------------------------------------------
+def compressionOf(filePath: str) -> str:
+
+    """
+    Method:
+
+        string compressionOf
+        (
+            string filePath
+        )
+
+    Description:
+        Returns the compression implied by the extension of a CSV file; i.e. 'gzip' for '.gz', 'zstd' for '.zst', and None otherwise.
+    """
+
+    lowerPath = filePath.lower()
+    if lowerPath.endswith('.gz'):
+        return 'gzip'
+    if lowerPath.endswith('.zst'):
+        return 'zstd'
+    return None
+
+#------------------------------------------------------------------------------------------------------------------------------------------
+# syncDirectory Method
+#------------------------------------------------------------------------------------------------------------------------------------------
+def syncDirectory(directory: str):
+
+    """
+    Method:
+
+        void syncDirectory
+        (
+            string directory
+        )
+
+    Description:
+        Syncs the entries of a directory to disk, so that the files renamed into it are durable. Platforms on which a directory cannot be
+        opened (i.e. Windows) are skipped.
+    """
+
+    try:
+        handle = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+
+    try:
+        os.fsync(handle)
+    finally:
+        os.close(handle)
+
+#==========================================================================================================================================
+# TableWriter Class
+#==========================================================================================================================================
+class TableWriter:
+
+    """
+    Class:     TableWriter
+
+    Description:
+        Streams a table to a file in chunks, so that the table never has to be held in memory as a whole. Chunks passed to write are
+        buffered until flush is called, at which point they are appended to a temporary file. Once the writer is closed, the temporary
+        file is synced to disk and renamed to filePath. If no chunk was ever written, no file is created.
+
+        The format of the file is determined by its extension:
+            '.csv': CSV file, as written by ds.generateFile
+            '.csv.gz' or '.csv.zst': CSV file compressed with gzip or zstd
+            '.parquet' or '.pq': Parquet file; each flush is written as a row group
+            '.feather', '.arrow' or '.ipc': Arrow IPC file; each flush is written as a record batch
+
+        Every chunk must have the same columns as the first one. In the columnar formats, duplicate column names are suffixed as in
+        ds.generateFile, and the column types are fixed by the first chunk.
+
+    Instance Variables:
+        string filePath:
+            Location of the output file.
+        string tempFilePath:
+            Location of the file while it is being written.
+        string fileFormat: = 'csv' or 'parquet' or 'feather'
+            Format of the output file.
+        string compression:
+            Compression codec. For CSV files, 'gzip' or 'zstd' or None, as implied by the extension. For columnar files, any codec
+            supported by pyarrow (e.g. 'zstd', 'gzip', 'snappy'); if None, the default codec of pyarrow is used.
+        list<DataFrame> pending:
+            Chunks that have been written but not yet flushed.
+        int pendingRowCount:
+            Number of rows in pending.
+        int rowCount:
+            Number of rows flushed to the file.
+        list<string> columnNames:
+            Column names of the table, as given by the first chunk.
+    """
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # Constructor
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def __init__(self, filePath: str, compression: str = None):
+
+        """
+        Constructor:
+
+            TableWriter
+            (
+                string filePath,
+                string compression
+            )
+
+        Description:
+            Constructs a TableWriter object. No file is opened until the first flush.
+        """
+
+        self.filePath = filePath
+        self.tempFilePath = filePath + '.tmp'
+        self.fileFormat = ds.fileFormat(filePath[:-4] if filePath.lower().endswith('.zst') else filePath)
+        self.compression = compressionOf(filePath) if self.fileFormat == 'csv' else compression
+        self.pending = []
+        self.pendingRowCount = 0
+        self.rowCount = 0
+        self.columnNames = None
+
+        self.template = None
+        self.rawHandle = None
+        self.handle = None
+        self.arrowWriter = None
+        self.arrowSchema = None
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # write Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def write(self, df: pd.DataFrame):
+
+        """
+        Method:
+
+            void write
+            (
+                DataFrame df
+            )
+
+        Description:
+            Buffers a chunk of the table until the next flush.
+        """
+
+        if self.columnNames is None:
+            self.columnNames = [str(colName) for colName in df.columns]
+            self.template = df.iloc[:0]
+        elif [str(colName) for colName in df.columns] != self.columnNames:
+            raise ValueError("Error: The columns of the chunk do not match the columns of '" + self.filePath + "'.")
+
+        if len(df) > 0:
+            self.pending.append(df)
+            self.pendingRowCount += len(df)
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # flush Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def flush(self):
+
+        """
+        Method:
+
+            void flush()
+
+        Description:
+            Appends every buffered chunk to the file and releases them.
+        """
+
+        if len(self.pending) == 0:
+            return
+
+        df = self.pending[0] if len(self.pending) == 1 else pd.concat(self.pending, ignore_index=True)
+        self.pending = []
+        self.pendingRowCount = 0
+
+        self.writeChunk(df)
+        self.rowCount += len(df)
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # writeChunk Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def writeChunk(self, df: pd.DataFrame):
+
+        """
+        Method:
+
+            void writeChunk
+            (
+                DataFrame df
+            )
+
+        Description:
+            Appends a chunk to the temporary file, which is opened along with the first chunk.
+        """
+
+        if self.rawHandle is None:
+            print("\nGenerating file: \n'" + self.filePath + "' ...")
+            self.rawHandle = open(self.tempFilePath, 'wb')
+
+        if self.fileFormat == 'csv':
+            self.writeCSV(df)
+        else:
+            self.writeArrow(df)
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # writeCSV Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def writeCSV(self, df: pd.DataFrame):
+
+        """
+        Method:
+
+            void writeCSV
+            (
+                DataFrame df
+            )
+
+        Description:
+            Appends a chunk to the CSV file. The header is only written along with the first chunk.
+        """
+
+        header = self.handle is None
+        if header:
+            if self.compression == 'gzip':
+                binary = gzip.GzipFile(fileobj=self.rawHandle, mode='wb')
+            elif self.compression == 'zstd':
+                try:
+                    import zstandard
+                except ImportError:
+                    raise ImportError("Error: zstandard is required to write '" + self.filePath + "'.")
+                binary = zstandard.ZstdCompressor().stream_writer(self.rawHandle, closefd=False)
+            else:
+                binary = self.rawHandle
+            self.handle = io.TextIOWrapper(binary, encoding='utf-8', newline='')
+
+        df.to_csv(self.handle, index=False, header=header)
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # writeArrow Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def writeArrow(self, df: pd.DataFrame):
+
+        """
+        Method:
+
+            void writeArrow
+            (
+                DataFrame df
+            )
+
+        Description:
+            Appends a chunk to the Parquet or Arrow IPC file.
+        """
+
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Error: pyarrow is required to write '" + self.filePath + "'.")
+
+        df = df.reset_index(drop=True)
+        df.columns = ds.uniqueColumns(df.columns)
+        df = df.infer_objects()
+
+        if self.arrowWriter is None:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            self.arrowSchema = table.schema.remove_metadata()
+            if self.fileFormat == 'parquet':
+                self.arrowWriter = pq.ParquetWriter(self.rawHandle, self.arrowSchema, compression=self.compression or 'snappy')
+            else:
+                options = pa.ipc.IpcWriteOptions(compression=self.compression)
+                self.arrowWriter = pa.ipc.new_file(self.rawHandle, self.arrowSchema, options=options)
+
+        # Later chunks are cast to the types of the first chunk
+        table = pa.Table.from_pandas(df, schema=self.arrowSchema, preserve_index=False)
+        self.arrowWriter.write_table(table)
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # close Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def close(self):
+
+        """
+        Method:
+
+            void close()
+
+        Description:
+            Flushes every buffered chunk, syncs the temporary file to disk and renames it to filePath, then syncs the directory so that
+            the rename itself survives a crash. A table to which only empty chunks were written is output with its header alone.
+        """
+
+        self.flush()
+        if self.rawHandle is None and self.template is not None:
+            self.writeChunk(self.template)
+
+        if self.rawHandle is None:
+            return
+
+        # Close the encoders first, as they may hold buffered bytes
+        if self.handle is not None:
+            self.handle.flush()
+            binary = self.handle.detach()
+            if binary is not self.rawHandle:
+                binary.close()
+            self.handle = None
+        if self.arrowWriter is not None:
+            self.arrowWriter.close()
+            self.arrowWriter = None
+
+        if not self.rawHandle.closed:
+            self.rawHandle.flush()
+            os.fsync(self.rawHandle.fileno())
+            self.rawHandle.close()
+        self.rawHandle = None
+        self.template = None
+
+        os.replace(self.tempFilePath, self.filePath)
+        syncDirectory(os.path.dirname(os.path.abspath(self.filePath)))
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # discard Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def discard(self):
+
+        """
+        Method:
+
+            void discard()
+
+        Description:
+            Abandons the table and deletes the temporary file, leaving any existing file at filePath untouched.
+        """
+
+        self.pending = []
+        self.pendingRowCount = 0
+
+        for closeable in [self.handle, self.arrowWriter, self.rawHandle]:
+            try:
+                if closeable is not None:
+                    closeable.close()
+            except Exception:
+                pass
+        self.handle = self.arrowWriter = self.rawHandle = None
+
+        if os.path.exists(self.tempFilePath):
+            os.remove(self.tempFilePath)
+
+#==========================================================================================================================================
+# AsyncWriter Class
+#==========================================================================================================================================
+class AsyncWriter:
+
+    """
+    Class:     AsyncWriter
+
+    Description:
+        Wraps a TableWriter, whose chunks are formatted, compressed and written on a background thread while the caller continues. The
+        writer has the same methods as TableWriter. Calls to write and flush return immediately, unless queueSize operations are already
+        waiting, which bounds the memory held by the queue. An error raised on the background thread is raised again by the next call.
+
+        A chunk must not be modified after it was passed to write.
+
+    Instance Variables:
+        TableWriter tableWriter:
+            Writer that is run on the background thread.
+        string filePath:
+            Location of the output file.
+        queue.Queue operations:
+            Operations waiting to be run on the background thread.
+        threading.Thread thread:
+            Background thread.
+        Exception error:
+            First error raised on the background thread, if any.
+        bool discarded:
+            True once discard has been called; every operation that is still queued is skipped.
+    """
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # Constructor
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def __init__(self, filePath: str, compression: str = None, queueSize: int = 16):
+
+        """
+        Constructor:
+
+            AsyncWriter
+            (
+                string filePath,
+                string compression,
+                int queueSize
+            )
+
+        Description:
+            Constructs an AsyncWriter object and starts its background thread; see TableWriter for the arguments.
+        """
+
+        self.tableWriter = TableWriter(filePath, compression)
+        self.filePath = filePath
+        self.operations = queue.Queue(maxsize=queueSize)
+        self.error = None
+        self.discarded = False
+
+        self.thread = threading.Thread(target=self.run, name='AsyncWriter', daemon=True)
+        self.thread.start()
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # run Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def run(self):
+
+        """
+        Method:
+
+            void run()
+
+        Description:
+            Runs the queued operations on the background thread until the writer is closed or discarded. Once an operation fails, every
+            later operation is skipped and the temporary file is discarded.
+        """
+
+        while True:
+            operation, df = self.operations.get()
+            try:
+                if operation == 'discard':
+                    self.tableWriter.discard()
+                elif self.error is None and not self.discarded:
+                    if operation == 'write':
+                        self.tableWriter.write(df)
+                    elif operation == 'flush':
+                        self.tableWriter.flush()
+                    elif operation == 'close':
+                        self.tableWriter.close()
+            except Exception as e:
+                self.error = e
+                self.tableWriter.discard()
+            finally:
+                self.operations.task_done()
+
+            if operation == 'close' or operation == 'discard':
+                return
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # submit Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def submit(self, operation: str, df: pd.DataFrame = None):
+
+        """
+        Method:
+
+            void submit
+            (
+                string operation,
+                DataFrame df
+            )
+
+        Description:
+            Queues an operation for the background thread.
+        """
+
+        if self.error is not None:
+            raise self.error
+        if not self.thread.is_alive():
+            raise ValueError("Error: '" + self.filePath + "' has already been closed.")
+        self.operations.put((operation, df))
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # write Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def write(self, df: pd.DataFrame):
+
+        """
+        Method:
+
+            void write
+            (
+                DataFrame df
+            )
+
+        Description:
+            Queues a chunk of the table; see TableWriter.write.
+        """
+
+        self.submit('write', df)
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # flush Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def flush(self):
+
+        """
+        Method:
+
+            void flush()
+
+        Description:
+            Queues the writing of every chunk queued so far; see TableWriter.flush.
+        """
+
+        self.submit('flush')
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # close Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def close(self):
+
+        """
+        Method:
+
+            void close()
+
+        Description:
+            Waits for every queued operation to complete, then closes the file; see TableWriter.close.
+        """
+
+        self.submit('close')
+        self.thread.join()
+
+        if self.error is not None:
+            raise self.error
+
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    # discard Method
+    #--------------------------------------------------------------------------------------------------------------------------------------
+    def discard(self):
+
+        """
+        Method:
+
+            void discard()
+
+        Description:
+            Skips every queued operation, deletes the temporary file and stops the background thread; see TableWriter.discard. A writer
+            that has already been closed is left untouched. Errors raised on the background thread are not raised again.
+        """
+
+        if not self.thread.is_alive():
+            return
+
+        self.discarded = True
+        self.operations.put(('discard', None))
+        self.thread.join()
+
+#------------------------------------------------------------------------------------------------------------------------------------------
+# writeFile Method
+#------------------------------------------------------------------------------------------------------------------------------------------
+def writeFile(df: pd.DataFrame, filePath: str, background: bool = True, compression: str = None):
+
+    """
+    Method:
+
+        TableWriter writeFile
+        (
+            DataFrame df,
+            string filePath,
+            bool background,
+            string compression
+        )
+
+    Description:
+        Writes a complete table to a file. If background is True, the file is written on a background thread, and the AsyncWriter is
+        returned so that the caller can wait for it with close. Otherwise, the file is written before returning.
+    """
+
+    writer = AsyncWriter(filePath, compression) if background else TableWriter(filePath, compression)
+    writer.write(df)
+    if not background:
+        writer.close()
+    return writer